@@ -0,0 +1,11 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+import pytest
+from models import SIZES, size_id, many_variables, benchmark_run
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_many_variables(benchmark, size):
+    benchmark_run(benchmark, lambda: many_variables(*size))
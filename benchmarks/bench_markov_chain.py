@@ -0,0 +1,11 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+import pytest
+from models import SIZES, size_id, markov_chain, benchmark_run
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_markov_chain(benchmark, size):
+    benchmark_run(benchmark, lambda: markov_chain(*size))
@@ -0,0 +1,15 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+import pytest
+from models import SIZES, size_id, past_lookback, benchmark_run
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_past_history(benchmark, size):
+    benchmark_run(benchmark, lambda: past_lookback(*size))
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_past_ring_buffer(benchmark, size):
+    benchmark_run(benchmark, lambda: past_lookback(*size, max_past=5))
@@ -0,0 +1,23 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+import pytest
+from models import SIZES, size_id, random_walk, random_walk_kernel, benchmark_run
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_random_walk(benchmark, size):
+    benchmark_run(benchmark, lambda: random_walk(*size))
+
+@pytest.mark.parametrize('validate', ['full', 'first_step', 'off'])
+def bench_random_walk_validate(benchmark, validate):
+    benchmark_run(benchmark, lambda: random_walk(1000, 100, validate=validate))
+
+@pytest.mark.parametrize('size', SIZES, ids=size_id)
+def bench_random_walk_without_history(benchmark, size):
+    benchmark_run(benchmark, lambda: random_walk(*size, keep_history=False))
+
+@pytest.mark.parametrize('size', SIZES + [(10000, 1000)], ids=size_id)
+def bench_random_walk_kernel(benchmark, size):
+    benchmark_run(benchmark, lambda: random_walk_kernel(*size))
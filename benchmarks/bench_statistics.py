@@ -0,0 +1,36 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+import pytest
+from models import size_id, random_walk
+
+#(n_subsimulations, n_steps) of the simulations whose statistics are benchmarked
+STATISTIC_SIZES = [(1000, 100), (1000, 1000), (10000, 100)]
+
+@pytest.fixture(scope='module', params=STATISTIC_SIZES, ids=size_id)
+def env(request):
+    env = random_walk(*request.param)
+    env.run(show_progress=False)
+    return env
+
+@pytest.mark.parametrize('domain', ['step', 'subsim', None], ids=['step', 'subsim', 'overall'])
+@pytest.mark.parametrize('statistic', ['mean', 'median', 'var', 'std', 'min', 'max', 'sum'])
+def bench_statistic(benchmark, env, statistic, domain):
+    benchmark(getattr(env, f'get_variable_{statistic}'), 'x', domain)
+
+@pytest.mark.parametrize('domain', ['step', 'subsim', None], ids=['step', 'subsim', 'overall'])
+def bench_quantiles(benchmark, env, domain):
+    benchmark(env.get_variable_quantiles, 'x', [0.05, 0.5, 0.95], domain)
+
+@pytest.mark.parametrize('bins', ['linear', 'log'])
+def bench_histogram(benchmark, env, bins):
+    benchmark(env.get_variable_histogram, 'x', 40, _range=(1, 100) if bins == 'log' else None, bins=bins)
+
+def bench_histories(benchmark, env):
+    benchmark(env.get_variable_histories, 'x')
+
+@pytest.mark.parametrize('domain', ['step', None], ids=['step', 'overall'])
+def bench_describe(benchmark, env, domain):
+    benchmark(env.describe, stats=('mean', 'std', 'min', 'max', 'p5', 'p50', 'p95'), domain=domain)
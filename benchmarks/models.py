@@ -0,0 +1,112 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import tracemalloc
+import pymcsl as mcs
+
+#(n_subsimulations, n_steps) of the simulation benchmarks
+SIZES = [(100, 100), (1000, 100), (100, 1000)]
+
+def size_id(size: Tuple[int, int]) -> str:
+    """Returns the benchmark id of a (n_subsimulations, n_steps) size.
+    """
+    return f'{size[0]}x{size[1]}'
+
+def random_walk(n_subsimulations: int, n_steps: int, **kwargs) -> mcs.MonteCarloSimulationEnv:
+    """Random walk with steps -1 and +1 (the Galton board of the examples).
+    """
+    env = mcs.MonteCarloSimulationEnv([('x', int, 0)], n_subsimulations, n_steps, seed=0, **kwargs)
+
+    @env.subsim_begin
+    def beginf(context):
+        context.direction = mcs.DiscreteRandomVariable({-1: 1, 1: 1})
+
+    @env.subsim_step
+    def stepf(context, step):
+        context.x += context.direction.evaluate()
+
+    return env
+
+def walk_kernel(state, step, rng):
+    """Step kernel of the random walk. It is defined at module level, so it is compiled only once for all the benchmarks.
+    """
+    state.x += 1 if rng.random() < 0.5 else -1
+
+def random_walk_kernel(n_subsimulations: int, n_steps: int, **kwargs) -> mcs.MonteCarloSimulationEnv:
+    """Random walk with steps -1 and +1, with a step kernel (compiled by numba, if it is installed).
+    """
+    env = mcs.MonteCarloSimulationEnv([('x', int, 0)], n_subsimulations, n_steps, seed=0, **kwargs)
+    env.set_subsim_step_callback(walk_kernel, jit=True)
+    return env
+
+def markov_chain(n_subsimulations: int, n_steps: int, **kwargs) -> mcs.MonteCarloSimulationEnv:
+    """Three-state Markov chain, whose state is logged at each step.
+    """
+    env = mcs.MonteCarloSimulationEnv([('x', int, 0)], n_subsimulations, n_steps, seed=0, **kwargs)
+
+    @env.subsim_begin
+    def beginf(context):
+        context.chain = mcs.SimpleMarkovChain(
+            states = {0, 1, 2},
+            transitions = [(0, 1, 1), (1, 0, 1), (1, 2, 1), (2, 0, 1)],
+            initial_state = 0
+        )
+        context.x = context.chain.state
+
+    @env.subsim_step
+    def stepf(context, step):
+        context.chain.foward()
+        context.x = context.chain.state
+
+    return env
+
+def many_variables(n_subsimulations: int, n_steps: int, n_variables: int = 20, **kwargs) -> mcs.MonteCarloSimulationEnv:
+    """Model with many float variables, all updated at each step.
+    """
+    var_names = [f'v{i}' for i in range(n_variables)]
+    env = mcs.MonteCarloSimulationEnv([(var_name, float, 0.0) for var_name in var_names], n_subsimulations, n_steps, seed=0, **kwargs)
+
+    @env.subsim_begin
+    def beginf(context):
+        pass
+
+    @env.subsim_step
+    def stepf(context, step):
+        noise = context.rng.random(n_variables)
+        for i, var_name in enumerate(var_names):
+            setattr(context, var_name, getattr(context, var_name) + noise[i])
+
+    return env
+
+def past_lookback(n_subsimulations: int, n_steps: int, lookback: int = 5, **kwargs) -> mcs.MonteCarloSimulationEnv:
+    """Moving average of a random walk over the last 'lookback' steps, read through context.past.
+    """
+    env = mcs.MonteCarloSimulationEnv([('x', float, 0.0), ('avg', float, 0.0)], n_subsimulations, n_steps, seed=0, **kwargs)
+
+    @env.subsim_begin
+    def beginf(context):
+        pass
+
+    @env.subsim_step
+    def stepf(context, step):
+        context.x += context.rng.normal()
+        n = max(0, min(lookback, step-1))
+        context.avg = (context.x + sum([context.past(k).x for k in range(1, n+1)])) / (n+1)
+
+    return env
+
+def benchmark_run(benchmark: Any, make_env: Callable[[], mcs.MonteCarloSimulationEnv], rounds: int = 3):
+    """Benchmarks the run of the simulations given by 'make_env', and saves its throughput (steps/second) and its peak memory (of a separate run, traced by tracemalloc) in the extra info of the benchmark.
+    """
+    benchmark.pedantic(lambda env: env.run(show_progress=False), setup=lambda: ((make_env(),), dict()), rounds=rounds, iterations=1)
+    env = make_env()
+    tracemalloc.start()
+    env.run(show_progress=False)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info['peak_memory_mb'] = peak / 2**20
+    if benchmark.stats is not None:
+        benchmark.extra_info['steps_per_second'] = env._n_subsims * env._n_steps / benchmark.stats.stats.mean
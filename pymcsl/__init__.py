@@ -5,5 +5,11 @@ sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 __version__ = '0.1.0'
 from subsimulation import SubSimulationEnv, ContextType
 from montecarlosimulation import MonteCarloSimulationEnv
+from vectorizedmontecarlosimulation import VectorizedMonteCarloSimulationEnv
 from randomvariable import DiscreteRandomVariable
-from markovchain import SimpleMarkovChain
\ No newline at end of file
+from markovchain import SimpleMarkovChain, MarkovChainEnsemble
+from onlinestatistics import OnlineStatistics, QuantileSketch
+from resultsio import load_results
+from profiling import RunStats
+from parametersweep import ParameterSweep
+from jitkernel import KernelRandom
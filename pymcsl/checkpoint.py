@@ -0,0 +1,180 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import os
+import copy
+import json
+import pickle
+import numpy as np
+from subsimulation import _to_python_scalar
+from onlinestatistics import OnlineStatistics
+
+_type_names = {'str': str, 'int': int, 'float': float, 'bool': bool}
+
+class _RunCheckpoint():
+    """Internal class.
+    Checkpoint directory of a MonteCarloSimulationEnv run. It has the files:
+    - meta.json: simulation parameters (including the seed, from which the generators of every subsimulation are derived, so no generator state has to be saved);
+    - callbacks.pkl: the pickled callbacks, if they are picklable;
+    - chunk_XXXXXX.npz (keep_history=True) or chunk_XXXXXX.pkl (keep_history=False): results of a batch of completed subsimulations. Chunk files are only appended, each one written to a temporary file and then renamed, so a crash never leaves a partial chunk.
+    """
+
+    def __init__(self, path: str, every: int) -> None:
+        """
+        :param path: Checkpoint directory. It is created if it does not exist.
+        :type path: str
+        :param every: Number of completed subsimulations between two chunk files.
+        :type every: int
+        """
+        self._path = path
+        self._every = every
+        self._pending_indexes = []
+        self._pending_online = []
+        os.makedirs(path, exist_ok=True)
+        self._n_chunks = len(self._get_chunk_files())
+
+    @staticmethod
+    def get_meta(env: 'MonteCarloSimulationEnv') -> Dict[str, Any]:
+        """Returns the parameters of a simulation in a JSON serializable dictionary.
+        """
+        return {
+            'variables': [[var_name, var_type.__name__, var_default] for var_name, var_type, var_default in env._variables],
+            'n_subsimulations': env._n_subsims,
+            'n_steps': env._n_steps,
+            'seed': str(env._entropy),
+            'keep_history': env._keep_history,
+            'online_config': {var_name: histogram_config for var_name, histogram_config in env._online_config.items()},
+            'quantile_error': env._quantile_error,
+            'max_past': env._max_past,
+            'validate': env._validate,
+            'history_backend': env._history_backend
+        }
+
+    @staticmethod
+    def get_env_kwargs(meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the MonteCarloSimulationEnv constructor arguments of the simulation described by 'meta'.
+        """
+        online_config = meta['online_config']
+        return {
+            'variables': [(var_name, _type_names[type_name], _type_names[type_name](var_default)) for var_name, type_name, var_default in meta['variables']],
+            'n_subsimulations': meta['n_subsimulations'],
+            'n_steps': meta['n_steps'],
+            'seed': int(meta['seed']),
+            'keep_history': meta['keep_history'],
+            'online_stats': list(online_config.keys()),
+            'online_histograms': {var_name: (histogram_config[0], tuple(histogram_config[1])) + ((histogram_config[2] if isinstance(histogram_config[2], str) else tuple(histogram_config[2]),) if len(histogram_config) == 3 else ()) for var_name, histogram_config in online_config.items() if histogram_config is not None},
+            'quantile_error': meta['quantile_error'],
+            'max_past': meta['max_past'],
+            'validate': meta['validate'],
+            'history_backend': meta['history_backend']
+        }
+
+    @staticmethod
+    def read_meta(path: str) -> Dict[str, Any]:
+        """Reads the metadata of the checkpoint at 'path'.
+        """
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def read_callbacks(path: str) -> Tuple[Union[Callable, None], Union[Callable, None]]:
+        """Reads the callbacks (begin_function, step_function) of the checkpoint at 'path', or (None, None) if they were not picklable.
+        """
+        callbacks_path = os.path.join(path, 'callbacks.pkl')
+        if not os.path.exists(callbacks_path):
+            return None, None
+        with open(callbacks_path, 'rb') as f:
+            return pickle.load(f)
+
+    def _write_file(self, file_name: str, write: Callable[[Any], None]):
+        """Writes a file of the checkpoint atomically (temporary file + rename).
+        """
+        final_path = os.path.join(self._path, file_name)
+        temporary_path = final_path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, final_path)
+
+    def _get_chunk_files(self) -> List[str]:
+        """Returns the names of the complete chunk files, in the order they were written.
+        """
+        return sorted([file_name for file_name in os.listdir(self._path) if file_name.startswith('chunk_') and (file_name.endswith('.npz') or file_name.endswith('.pkl'))])
+
+    def start(self, env: 'MonteCarloSimulationEnv'):
+        """Writes the metadata and the callbacks of a new checkpoint, or checks that an existing checkpoint belongs to the same simulation.
+        """
+        meta = _RunCheckpoint.get_meta(env)
+        if os.path.exists(os.path.join(self._path, 'meta.json')):
+            saved_meta = _RunCheckpoint.read_meta(self._path)
+            assert saved_meta == json.loads(json.dumps(meta)), f'The checkpoint at {self._path} belongs to a different simulation (or to the same simulation with other parameters).'
+            return
+        try:
+            callbacks = pickle.dumps((env._subsim_begin_function, env._subsim_step_function))
+            self._write_file('callbacks.pkl', lambda f: f.write(callbacks))
+        except (pickle.PicklingError, AttributeError, TypeError):
+            #the callbacks must then be given to resume
+            pass
+        self._write_file('meta.json', lambda f: f.write(json.dumps(meta, indent=4).encode()))
+
+    def load(self, env: 'MonteCarloSimulationEnv') -> List[int]:
+        """Loads the results of the completed subsimulations into 'env' and returns their indexes.
+        """
+        loaded_indexes = []
+        for file_name in self._get_chunk_files():
+            if file_name.endswith('.npz'):
+                with np.load(os.path.join(self._path, file_name), allow_pickle=True) as chunk:
+                    subsim_indexes = chunk['subsim_indexes'].tolist()
+                    histories = {var_name: chunk[f'history_{var_name}'] for var_name, var_type, var_default in env._variables}
+                #the final states are the last logged states
+                final_states = [{var_name: _to_python_scalar(histories[var_name][k, -1]) for var_name in histories.keys()} for k in range(len(subsim_indexes))]
+                env._collect_history_chunk(subsim_indexes, histories, final_states)
+            else:
+                with open(os.path.join(self._path, file_name), 'rb') as f:
+                    subsim_indexes, online_stats, subsim_summaries = pickle.load(f)
+                env._collect_online_chunk(subsim_indexes, online_stats, subsim_summaries)
+            loaded_indexes += subsim_indexes
+        return loaded_indexes
+
+    def add_history(self, env: 'MonteCarloSimulationEnv', subsim_indexes: List[int]):
+        """Registers completed subsimulations whose histories are in the result matrices of 'env'.
+        """
+        self._pending_indexes += subsim_indexes
+        if len(self._pending_indexes) >= self._every:
+            self.flush(env)
+
+    def add_online(self, env: 'MonteCarloSimulationEnv', subsim_indexes: List[int], online_stats: Dict[str, OnlineStatistics], subsim_summaries: Dict[str, Dict[str, np.ndarray]]):
+        """Registers completed subsimulations whose online accumulators and summaries were not saved yet.
+        """
+        self._pending_indexes += subsim_indexes
+        self._pending_online.append((subsim_indexes, online_stats, subsim_summaries))
+        if len(self._pending_indexes) >= self._every:
+            self.flush(env)
+
+    def flush(self, env: 'MonteCarloSimulationEnv'):
+        """Writes a chunk file with the registered subsimulations.
+        """
+        if len(self._pending_indexes) == 0:
+            return
+        file_name = f'chunk_{self._n_chunks:06d}'
+        subsim_indexes = self._pending_indexes
+        if env._keep_history:
+            columns = {f'history_{var_name}': env._results[var_name][subsim_indexes] for var_name in env._results.keys()}
+            self._write_file(file_name + '.npz', lambda f: np.savez(f, subsim_indexes=np.array(subsim_indexes, dtype=np.int64), **columns))
+        else:
+            #the accumulators of the pending chunks are merged into a single one per variable
+            online_stats = dict()
+            subsim_summaries = dict()
+            for var_name in env._online_config.keys():
+                online_stats[var_name] = copy.deepcopy(self._pending_online[0][1][var_name])
+                for chunk_indexes, chunk_online_stats, chunk_summaries in self._pending_online[1:]:
+                    online_stats[var_name].merge(chunk_online_stats[var_name])
+                subsim_summaries[var_name] = {statistic: np.concatenate([chunk_summaries[var_name][statistic] for chunk_indexes, chunk_online_stats, chunk_summaries in self._pending_online]) for statistic in self._pending_online[0][2][var_name].keys()}
+            self._write_file(file_name + '.pkl', lambda f: pickle.dump((subsim_indexes, online_stats, subsim_summaries), f))
+        self._n_chunks += 1
+        self._pending_indexes = []
+        self._pending_online = []
@@ -0,0 +1,242 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import math
+import numpy as np
+
+#compiled loops, indexed by (begin_kernel, step_kernel)
+_jit_loops = dict()
+#generator class of the kernels compiled by numba, built when the first loop is compiled
+_jit_random_class = None
+
+def _no_begin(state: Any, rng: Any):
+    """Internal function.
+    Beginning kernel of the simulations whose step kernel has no beginning kernel.
+    """
+    pass
+
+def _get_state_dtype(variables: List[Tuple[str, type, Union[int, float, bool]]]) -> np.dtype:
+    """Internal function.
+    Returns the structured dtype of the states of the kernels, with a field per variable (int64, float64 or bool).
+    """
+    return np.dtype([(var_name, {int: np.int64, float: np.float64, bool: np.bool_}[var_type]) for var_name, var_type, var_default in variables])
+
+def _get_initial_state(variables: List[Tuple[str, type, Union[int, float, bool]]]) -> np.recarray:
+    """Internal function.
+    Returns a record array with a single record, whose fields are the default values of the variables.
+    """
+    return np.array([tuple(var_default for var_name, var_type, var_default in variables)], dtype=_get_state_dtype(variables)).view(np.recarray)
+
+#constants of the SplitMix64 mixer and of the xoshiro256** generator, as uint64 so numba does not promote them to floats
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_U5 = np.uint64(5)
+_U7 = np.uint64(7)
+_U9 = np.uint64(9)
+_U11 = np.uint64(11)
+_U17 = np.uint64(17)
+_U19 = np.uint64(19)
+_U27 = np.uint64(27)
+_U30 = np.uint64(30)
+_U31 = np.uint64(31)
+_U45 = np.uint64(45)
+_U57 = np.uint64(57)
+
+class KernelRandom():
+    """Generator of the kernels (the 'rng' argument), with a subset of the methods of the NumPy generators.
+    It is a xoshiro256** generator that is reseeded at the beginning of each subsimulation, inside the compiled loop, from the key of the simulation and the index of the subsimulation. The seeding goes through bijective SplitMix64 mixes, so two subsimulations of the same simulation never get the same state.
+    The class is compiled by numba (as a jitclass) with the loop, or used as is by the interpreted loop, with the same results.
+    """
+    def __init__(self, key0: int, key1: int):
+        """
+        :param key0: First word of the key of the simulation.
+        :type key0: int
+        :param key1: Second word of the key of the simulation.
+        :type key1: int
+        """
+        self._key0 = key0
+        self._key1 = key1
+        self._s0 = key0
+        self._s1 = key1
+        self._s2 = key0
+        self._s3 = key1
+
+    def _seed(self, subsim_index: int):
+        """Internal method.
+        Sets the state of the generator for the subsimulation of the given index: the index is mixed with the key, and the four words of the state are the next outputs of the SplitMix64 generator seeded with the mix.
+        """
+        x = np.uint64(subsim_index) + self._key0
+        x = (x ^ (x >> _U30)) * _MIX1
+        x = (x ^ (x >> _U27)) * _MIX2
+        x = (x ^ (x >> _U31)) ^ self._key1
+        x += _GOLDEN
+        z = (x ^ (x >> _U30)) * _MIX1
+        z = (z ^ (z >> _U27)) * _MIX2
+        self._s0 = z ^ (z >> _U31)
+        x += _GOLDEN
+        z = (x ^ (x >> _U30)) * _MIX1
+        z = (z ^ (z >> _U27)) * _MIX2
+        self._s1 = z ^ (z >> _U31)
+        x += _GOLDEN
+        z = (x ^ (x >> _U30)) * _MIX1
+        z = (z ^ (z >> _U27)) * _MIX2
+        self._s2 = z ^ (z >> _U31)
+        x += _GOLDEN
+        z = (x ^ (x >> _U30)) * _MIX1
+        z = (z ^ (z >> _U27)) * _MIX2
+        self._s3 = z ^ (z >> _U31)
+
+    def _next(self) -> int:
+        """Internal method.
+        Returns the next 64-bit output of the generator.
+        """
+        s1 = self._s1
+        result = s1 * _U5
+        result = ((result << _U7) | (result >> _U57)) * _U9
+        t = s1 << _U17
+        self._s2 ^= self._s0
+        self._s3 ^= s1
+        self._s1 = s1 ^ self._s2
+        self._s0 ^= self._s3
+        self._s2 ^= t
+        self._s3 = (self._s3 << _U45) | (self._s3 >> _U19)
+        return result
+
+    def random(self) -> float:
+        """Returns a float drawn from the uniform distribution over [0, 1), with 53 random bits.
+
+        :rtype: float
+        """
+        return (self._next() >> _U11) * 1.1102230246251565e-16
+
+    def uniform(self, low: float = 0.0, high: float = 1.0) -> float:
+        """Returns a float drawn from the uniform distribution over [low, high).
+
+        :param low: Lower bound. Defaults to 0.0.
+        :type low: float
+        :param high: Upper bound. Defaults to 1.0.
+        :type high: float
+        :rtype: float
+        """
+        return low + (high - low) * self.random()
+
+    def integers(self, low: int, high: int) -> int:
+        """Returns an int drawn from the uniform distribution over [low, high), as Generator.integers (scaled from random(), so ranges should be far below 2**53).
+
+        :param low: Lowest int.
+        :type low: int
+        :param high: One above the highest int.
+        :type high: int
+        :rtype: int
+        """
+        return low + int(self.random() * (high - low))
+
+    def standard_normal(self) -> float:
+        """Returns a float drawn from the standard normal distribution (by the polar method).
+
+        :rtype: float
+        """
+        while True:
+            u = 2.0 * self.random() - 1.0
+            v = 2.0 * self.random() - 1.0
+            s = u * u + v * v
+            if 0.0 < s < 1.0:
+                return u * math.sqrt(-2.0 * math.log(s) / s)
+
+    def normal(self, loc: float = 0.0, scale: float = 1.0) -> float:
+        """Returns a float drawn from the normal distribution.
+
+        :param loc: Mean. Defaults to 0.0.
+        :type loc: float
+        :param scale: Standard deviation. Defaults to 1.0.
+        :type scale: float
+        :rtype: float
+        """
+        return loc + scale * self.standard_normal()
+
+    def exponential(self, scale: float = 1.0) -> float:
+        """Returns a float drawn from the exponential distribution.
+
+        :param scale: Mean (the inverse of the rate). Defaults to 1.0.
+        :type scale: float
+        :rtype: float
+        """
+        return -scale * math.log(1.0 - self.random())
+
+def _get_kernel_random_class(compiled: bool) -> type:
+    """Internal function.
+    Returns the generator class of the kernels, compiled as a numba jitclass (once) if 'compiled' is True.
+    """
+    global _jit_random_class
+    if not compiled:
+        return KernelRandom
+    if _jit_random_class is None:
+        import numba
+        from numba.experimental import jitclass
+        _jit_random_class = jitclass([(name, numba.uint64) for name in ('_key0', '_key1', '_s0', '_s1', '_s2', '_s3')])(KernelRandom)
+    return _jit_random_class
+
+def _get_kernel_key(entropy: int) -> np.ndarray:
+    """Internal function.
+    Returns the two uint64 words of the key of the kernel generators of a simulation, derived from the root SeedSequence(entropy) (the other generators of the subsimulations are derived from its children).
+    """
+    return np.random.SeedSequence(entropy).generate_state(2, np.uint64)
+
+def _make_loop(begin_kernel: Callable, step_kernel: Callable) -> Callable:
+    """Internal function.
+    Returns the loop that runs subsimulations with the kernels: for each row of the histories, the generator is reseeded for the index of the subsimulation, the beginning kernel is called on a copy of the initial state, and the step kernel is called once per step, the state after each step being written into the row.
+    The same loop is compiled by numba (with compiled kernels) or run by the interpreter (with the Python kernels).
+    """
+    def loop(initial_state, histories, subsim_indexes, rng):
+        for k in range(histories.shape[0]):
+            rng._seed(subsim_indexes[k])
+            states = initial_state.copy()
+            state = states[0]
+            begin_kernel(state, rng)
+            for step in range(histories.shape[1]):
+                step_kernel(state, step, rng)
+                histories[k, step] = state
+    return loop
+
+def _get_loop(begin_kernel: Callable, step_kernel: Callable) -> Tuple[Callable, bool]:
+    """Internal function.
+    Returns the loop of the kernels compiled by numba, or, if numba is not installed, the interpreted loop. The second item of the returned tuple tells if the loop is compiled.
+    """
+    key = (begin_kernel, step_kernel)
+    if key not in _jit_loops:
+        #kernels already decorated with numba.njit are recompiled from their Python functions
+        begin_function = getattr(begin_kernel, 'py_func', begin_kernel)
+        step_function = getattr(step_kernel, 'py_func', step_kernel)
+        try:
+            import numba
+            _jit_loops[key] = (numba.njit(_make_loop(numba.njit(begin_function), numba.njit(step_function))), True)
+        except ImportError:
+            _jit_loops[key] = (_make_loop(begin_function, step_function), False)
+    return _jit_loops[key]
+
+def _run_kernels(variables: List[Tuple[str, type, Union[int, float, bool]]], begin_kernel: Callable, step_kernel: Callable, n_steps: int, entropy: int, subsim_indexes: List[int], compiled: Union[bool, None] = None) -> Dict[str, np.ndarray]:
+    """Internal function.
+    Runs the subsimulations of the given indexes with the kernels, in a single call of the loop, and returns the (len(subsim_indexes), n_steps) history matrix of each variable.
+    If subsim_indexes is empty, the loop is only compiled (by running it for no subsimulations).
+    If 'compiled' is False, the interpreted loop is run even if numba is installed (the results are the same).
+    """
+    loop, is_compiled = _get_loop(begin_kernel, step_kernel)
+    if compiled is False and is_compiled:
+        loop, is_compiled = _make_loop(getattr(begin_kernel, 'py_func', begin_kernel), getattr(step_kernel, 'py_func', step_kernel)), False
+    key = _get_kernel_key(entropy)
+    rng = _get_kernel_random_class(is_compiled)(key[0], key[1])
+    initial_state = _get_initial_state(variables)
+    histories = np.empty((len(subsim_indexes), n_steps), dtype=_get_state_dtype(variables))
+    indexes = np.asarray(subsim_indexes, dtype=np.int64)
+    if is_compiled:
+        #numba works on the plain structured arrays
+        loop(initial_state.view(np.ndarray).astype(histories.dtype), histories, indexes, rng)
+    else:
+        #the records of record arrays give attribute access to the fields, as numba records do, and the uint64 words of the generator wrap around silently
+        with np.errstate(over='ignore'):
+            loop(initial_state, histories.view(np.recarray), indexes, rng)
+    return {var_name: np.ascontiguousarray(histories[var_name]) for var_name, var_type, var_default in variables}
@@ -4,23 +4,94 @@ June-2022
 """
 
 from typing import *
-from random import choices
+from random import random
+from bisect import bisect_right
+import numpy as np
+from randomvariable import _active_rng
 
 StateType = Union[int, float, str]
 WeightType = Union[int, float]
 
-def _first_or_default(l: List, f: Callable[[Any], bool], default: Any = None) -> Any:
-    for x in l:
-        if f(x):
-            return x
-    return default
+def _compile_transitions(state_indexes: Dict[StateType, int], transitions: List[Tuple[StateType, StateType, WeightType]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compiles a list of transitions into an integer-indexed CSR (compressed sparse row) transition matrix, in O(E) time.
+    When a pair (state1, state2) appears more than once, the first weight is used. Transitions with zero weight are dropped.
+
+    :param state_indexes: Dictionary in the format {state: state_index}.
+    :type state_indexes: Dict[StateType, int]
+    :param transitions: List of transitions in the format (state1, state2, weight).
+    :type transitions: List[Tuple[StateType, StateType, WeightType]]
+    :return: Tuple in the format (indptr, indices, weights). The transitions from state i are indices[indptr[i]:indptr[i+1]], with the weights weights[indptr[i]:indptr[i+1]].
+    :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    rows = [dict() for i in range(len(state_indexes))]
+    for state1, state2, weight in transitions:
+        row = rows[state_indexes[state1]]
+        j = state_indexes[state2]
+        if j not in row:
+            row[j] = weight
+    for row in rows:
+        for j in [j for j, weight in row.items() if weight == 0]:
+            del row[j]
+
+    indptr = np.zeros(len(rows)+1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.array([j for row in rows for j in row.keys()], dtype=np.int64)
+    weights = np.array([weight for row in rows for weight in row.values()], dtype=np.float64)
+    return indptr, indices, weights
+
+def _solve_linear_system(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n: int, b: np.ndarray) -> np.ndarray:
+    """Solves the linear system Ax=b, where A is a n x n matrix given as triplets (duplicated entries are summed).
+    SciPy sparse solvers are used when SciPy is installed, and NumPy dense solvers otherwise.
+
+    :raises ValueError: if the system is singular.
+    """
+    try:
+        from scipy.sparse import csc_matrix
+        from scipy.sparse.linalg import spsolve
+    except ImportError:
+        A = np.zeros((n, n))
+        np.add.at(A, (rows, cols), values)
+        try:
+            x = np.linalg.solve(A, b)
+        except np.linalg.LinAlgError:
+            raise ValueError('Singular linear system.')
+    else:
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            x = spsolve(csc_matrix((values, (rows, cols)), shape=(n, n)), b)
+        x = np.asarray(x).reshape(b.shape)
+    if not np.all(np.isfinite(x)):
+        raise ValueError('Singular linear system.')
+    return x
+
+def _reverse_reachable(indptr: np.ndarray, indices: np.ndarray, sources: np.ndarray, blocked: Union[np.ndarray, None] = None) -> np.ndarray:
+    """Returns a boolean mask of the states that can reach some state of 'sources' (including themselves) in the transition graph, without passing through the 'blocked' states.
+    """
+    n = len(indptr) - 1
+    entry_rows = np.repeat(np.arange(n), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    reverse_indptr = np.searchsorted(indices[order], np.arange(n+1))
+    predecessors = entry_rows[order]
+
+    reached = np.zeros(n, dtype=bool)
+    reached[sources] = True
+    stack = list(np.flatnonzero(reached))
+    while len(stack) > 0:
+        j = stack.pop()
+        for i in predecessors[reverse_indptr[j]:reverse_indptr[j+1]].tolist():
+            if not reached[i] and (blocked is None or not blocked[i]):
+                reached[i] = True
+                stack.append(i)
+    return reached
 
 class SimpleMarkovChain():
     """Markov Chains are graphs that represent stochastic processes based on random state transitions.
     The SimpleMarkovChain class is a Markov Chain simulator with constant transition probabilities.
+    The chain is compiled into an integer-indexed sparse transition matrix with cumulative weights per state, so each transition costs O(log(out-degree)). State labels are only used at the API boundary.
     """
 
-    def __init__(self, states: Set[StateType], transitions: List[Tuple[StateType, StateType, WeightType]], initial_state: StateType) -> None:
+    def __init__(self, states: Set[StateType], transitions: List[Tuple[StateType, StateType, WeightType]], initial_state: StateType, rng: Union[np.random.Generator, None] = None) -> None:
         """
         :param states: Set of states.
         :type states: Set[StateType], where StateType=Union[str, int, float]
@@ -28,6 +99,8 @@ class SimpleMarkovChain():
         :type transitions: List[Tuple[StateType, StateType, WeightType]]
         :param initial_state: Initial state.
         :type initial_state: StateType
+        :param rng: NumPy generator used by the transitions. If None, the generator of the running subsimulation (context.rng) is used, or the global random module outside of a subsimulation. Defaults to None.
+        :type rng: Union[np.random.Generator, None], optional
         """
         assert isinstance(states, set), f'\'states\' must be a set. Given {type(states)}.'
         lstates = list(states)
@@ -37,13 +110,23 @@ class SimpleMarkovChain():
         assert all(isinstance(transition, tuple) for transition in transitions), '\'transitions\' must be a list of tuples.'
         assert all(len(t)==3 for t in transitions), 'All the tuples of \'transitions\' must have length=3.'
         assert all([isinstance(x1, (int, float, str)) and isinstance(x2, (int, float, str)) and isinstance(x3, (int, float)) for x1,x2,x3 in transitions]), 'All the tuples of \'transitions\' must be Tuple[StateType, StateType, WeightType], where StateType=Union[int,float,str] and WeightType=Union[int, float].'
+        assert all([w >= 0 for s1, s2, w in transitions]), 'Transition weights must be non-negative.'
         assert all([s1 in states and s2 in states for s1, s2, w in transitions]), 'state1 and state2 in transitions tuples (state1, state2, weight) must belong to states.'
         assert initial_state in states, f'initial_state must belong to states. Given {initial_state}.'
+        assert rng is None or isinstance(rng, np.random.Generator), f'\'rng\' must be a numpy.random.Generator or None. Given {type(rng)}.'
         
         self._states = lstates
-        self._transitions = transitions        
-        self._transition_weights = {state1: [_first_or_default(transitions, lambda s: s[0]==state1 and s[1]==state2, (None,None,0))[2] for state2 in lstates] for state1 in lstates}
+        self._transitions = transitions
+        self._state_indexes = {state: i for i, state in enumerate(lstates)}
+        self._indptr, self._indices, self._weights = _compile_transitions(self._state_indexes, transitions)
+
+        #per-state lists for the scalar transitions, which are faster than NumPy arrays for single lookups
+        self._row_targets = [self._indices[self._indptr[i]:self._indptr[i+1]].tolist() for i in range(len(lstates))]
+        self._row_cumulative_weights = [np.cumsum(self._weights[self._indptr[i]:self._indptr[i+1]]).tolist() for i in range(len(lstates))]
+
         self._state = initial_state
+        self._state_index = self._state_indexes[initial_state]
+        self._rng = rng
     
     @property
     def state(self) -> StateType:
@@ -60,5 +143,261 @@ class SimpleMarkovChain():
         :return: State after transition.
         :rtype: StateType
         """
-        self._state = choices(self._states, self._transition_weights[self._state])[0]
-        return self._state
\ No newline at end of file
+        cumulative_weights = self._row_cumulative_weights[self._state_index]
+        if len(cumulative_weights) == 0:
+            raise ValueError(f'State {self._state} has no outgoing transitions.')
+        rng = self._rng if self._rng is not None else _active_rng.get()
+        u = random() if rng is None else rng.random()
+        self._state_index = self._row_targets[self._state_index][bisect_right(cumulative_weights, u * cumulative_weights[-1])]
+        self._state = self._states[self._state_index]
+        return self._state
+
+    def _get_probability_triplets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Internal method.
+        Returns the transition probability matrix as triplets (rows, cols, probabilities). States with no outgoing transitions are taken as absorbing.
+        """
+        degrees = np.diff(self._indptr)
+        entry_rows = np.repeat(np.arange(len(self._states)), degrees)
+        row_totals = np.add.reduceat(self._weights, self._indptr[:-1][degrees > 0])
+        totals = np.zeros(len(self._states))
+        totals[degrees > 0] = row_totals
+        dead_states = np.flatnonzero(degrees == 0)
+        return (np.concatenate([entry_rows, dead_states]),
+                np.concatenate([self._indices, dead_states]),
+                np.concatenate([self._weights / totals[entry_rows], np.ones(len(dead_states))]))
+
+    def _get_state_index_array(self, states: Union[StateType, Iterable[StateType]]) -> np.ndarray:
+        """Internal method.
+        Converts a state, or an iterable of states, to an array of state indexes.
+        """
+        if isinstance(states, (int, float, str)):
+            states = [states]
+        states = list(states)
+        assert len(states) > 0, 'At least one state must be given.'
+        assert all([state in self._state_indexes.keys() for state in states]), 'All the given states must belong to the chain.'
+        return np.array([self._state_indexes[state] for state in states], dtype=np.int64)
+
+    def stationary_distribution(self) -> Dict[StateType, float]:
+        """Calculates the stationary (long-run) distribution of the chain, by solving pi*P = pi with sum(pi) = 1.
+        States with no outgoing transitions are taken as absorbing.
+
+        :raises ValueError: if the chain has no unique stationary distribution (e.g. it has more than one closed class).
+        :return: Dictionary in the format {state: probability}.
+        :rtype: Dict[StateType, float]
+        """
+        n = len(self._states)
+        rows, cols, probabilities = self._get_probability_triplets()
+        #(P^T - I) pi = 0, with the last (redundant) equation replaced by sum(pi) = 1
+        keep = cols != n-1
+        system_rows = np.concatenate([cols[keep], np.arange(n-1), np.full(n, n-1)])
+        system_cols = np.concatenate([rows[keep], np.arange(n-1), np.arange(n)])
+        system_values = np.concatenate([probabilities[keep], -np.ones(n-1), np.ones(n)])
+        b = np.zeros(n)
+        b[n-1] = 1.0
+        try:
+            pi = _solve_linear_system(system_rows, system_cols, system_values, n, b)
+        except ValueError:
+            raise ValueError('The chain has no unique stationary distribution.')
+        return {state: float(pi[i]) for i, state in enumerate(self._states)}
+
+    def distribution_at(self, n: int, initial: Union[StateType, Dict[StateType, float], None] = None) -> Dict[StateType, float]:
+        """Calculates the distribution of the state after 'n' transitions.
+        Small chains use repeated squaring of the dense transition matrix, and large chains use 'n' sparse vector-matrix products, whichever is cheaper.
+
+        :param n: Number of transitions.
+        :type n: int
+        :param initial: Initial state, or initial distribution in the format {state: probability}. If None, the current state is used. Defaults to None.
+        :type initial: Union[StateType, Dict[StateType, float], None], optional
+        :return: Dictionary in the format {state: probability}.
+        :rtype: Dict[StateType, float]
+        """
+        assert isinstance(n, int), f'\'n\' must be integer. Given {type(n)}.'
+        assert n >= 0, f'n must be non-negative. Given {n}.'
+        n_states = len(self._states)
+        p = np.zeros(n_states)
+        if initial is None:
+            p[self._state_index] = 1.0
+        elif isinstance(initial, dict):
+            assert all([state in self._state_indexes.keys() for state in initial.keys()]), 'All the states of \'initial\' must belong to the chain.'
+            for state, probability in initial.items():
+                p[self._state_indexes[state]] = probability
+            assert np.isclose(np.sum(p), 1.0), 'The probabilities of \'initial\' must sum to 1.'
+        else:
+            assert initial in self._state_indexes.keys(), f'initial must belong to the states of the chain. Given {initial}.'
+            p[self._state_indexes[initial]] = 1.0
+
+        rows, cols, probabilities = self._get_probability_triplets()
+        if n_states <= 4096 and n_states**3 * max(1, n.bit_length()) < n * len(probabilities):
+            P = np.zeros((n_states, n_states))
+            np.add.at(P, (rows, cols), probabilities)
+            p = p @ np.linalg.matrix_power(P, n)
+        else:
+            for i in range(n):
+                p = np.bincount(cols, weights=p[rows]*probabilities, minlength=n_states)
+        return {state: float(p[i]) for i, state in enumerate(self._states)}
+
+    def expected_hitting_times(self, target: Union[StateType, Iterable[StateType]]) -> Dict[StateType, float]:
+        """Calculates the expected number of transitions to reach a target state (or set of states) from each state.
+        The expected time is infinite for the states from which the target may never be reached.
+
+        :param target: Target state, or iterable of target states.
+        :type target: Union[StateType, Iterable[StateType]]
+        :return: Dictionary in the format {state: expected_hitting_time}.
+        :rtype: Dict[StateType, float]
+        """
+        n_states = len(self._states)
+        targets = np.zeros(n_states, dtype=bool)
+        targets[self._get_state_index_array(target)] = True
+        rows, cols, probabilities = self._get_probability_triplets()
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_states))])
+        order = np.argsort(rows, kind='stable')
+        indices = cols[order]
+
+        #the states that can not reach the target, and the ones that may get to them, never hit it with probability 1
+        unable = ~_reverse_reachable(indptr, indices, np.flatnonzero(targets))
+        finite = ~targets & ~_reverse_reachable(indptr, indices, np.flatnonzero(unable), blocked=targets)
+
+        hitting_times = np.full(n_states, np.inf)
+        hitting_times[targets] = 0.0
+        if finite.any():
+            #(I - Q) h = 1, where Q are the transitions among the 'finite' states
+            positions = np.cumsum(finite) - 1
+            inner = finite[rows] & finite[cols]
+            m = int(np.sum(finite))
+            h = _solve_linear_system(np.concatenate([positions[rows[inner]], np.arange(m)]),
+                                     np.concatenate([positions[cols[inner]], np.arange(m)]),
+                                     np.concatenate([-probabilities[inner], np.ones(m)]), m, np.ones(m))
+            hitting_times[finite] = h
+        return {state: float(hitting_times[i]) for i, state in enumerate(self._states)}
+
+    def absorption_probabilities(self) -> Dict[StateType, Dict[StateType, float]]:
+        """Calculates, for each transient state, the probability of being absorbed by each absorbing state.
+        Absorbing states are the ones whose only transition is to themselves (or that have no outgoing transitions).
+
+        :return: Dictionary in the format {transient_state: {absorbing_state: probability}}.
+        :rtype: Dict[StateType, Dict[StateType, float]]
+        """
+        n_states = len(self._states)
+        rows, cols, probabilities = self._get_probability_triplets()
+        absorbing = np.ones(n_states, dtype=bool)
+        absorbing[rows[rows != cols]] = False
+        absorbing_indexes = np.flatnonzero(absorbing)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_states))])
+        order = np.argsort(rows, kind='stable')
+
+        #only the transient states that can reach an absorbing state have nonzero probabilities
+        solvable = ~absorbing & _reverse_reachable(indptr, cols[order], absorbing_indexes)
+        absorption = np.zeros((n_states, len(absorbing_indexes)))
+        if solvable.any() and len(absorbing_indexes) > 0:
+            #(I - Q) B = R, where Q are the transitions among the solvable states and R the transitions to absorbing states
+            positions = np.cumsum(solvable) - 1
+            m = int(np.sum(solvable))
+            inner = solvable[rows] & solvable[cols]
+            to_absorbing = solvable[rows] & absorbing[cols]
+            R = np.zeros((m, len(absorbing_indexes)))
+            np.add.at(R, (positions[rows[to_absorbing]], np.searchsorted(absorbing_indexes, cols[to_absorbing])), probabilities[to_absorbing])
+            absorption[solvable] = _solve_linear_system(np.concatenate([positions[rows[inner]], np.arange(m)]),
+                                                        np.concatenate([positions[cols[inner]], np.arange(m)]),
+                                                        np.concatenate([-probabilities[inner], np.ones(m)]), m, R)
+        return {self._states[i]: {self._states[a]: float(absorption[i, k]) for k, a in enumerate(absorbing_indexes)} for i in np.flatnonzero(~absorbing)}
+
+class MarkovChainEnsemble():
+    """The MarkovChainEnsemble class advances many independent walkers of the same Markov chain at once.
+    The current states of the walkers are kept as an integer NumPy array, and each transition of all walkers is drawn by inverse-CDF sampling on the compiled transition matrix of a SimpleMarkovChain, with a handful of array operations.
+    """
+
+    def __init__(self, chain: SimpleMarkovChain, n_walkers: int, initial_states: Union[StateType, Sequence[StateType], None] = None, rng: Union[np.random.Generator, None] = None) -> None:
+        """
+        :param chain: Markov chain whose transitions are used by the walkers.
+        :type chain: SimpleMarkovChain
+        :param n_walkers: Number of walkers.
+        :type n_walkers: int
+        :param initial_states: Initial state of all walkers, or a sequence with the initial state of each walker. If None, the current state of 'chain' is used. Defaults to None.
+        :type initial_states: Union[StateType, Sequence[StateType], None], optional
+        :param rng: NumPy generator used by the transitions. If None, the generator of the running subsimulation (context.rng) is used, or the global numpy.random state outside of a subsimulation. Defaults to None.
+        :type rng: Union[np.random.Generator, None], optional
+        """
+        assert isinstance(chain, SimpleMarkovChain), f'\'chain\' must be a SimpleMarkovChain. Given {type(chain)}.'
+        assert isinstance(n_walkers, int), f'\'n_walkers\' must be integer. Given {type(n_walkers)}.'
+        assert n_walkers > 0, f'n_walkers must be positive. Given {n_walkers}.'
+        assert rng is None or isinstance(rng, np.random.Generator), f'\'rng\' must be a numpy.random.Generator or None. Given {type(rng)}.'
+
+        self._chain = chain
+        self._n_walkers = n_walkers
+        self._rng = rng
+        self._labels = np.array(chain._states) if not isinstance(chain._states[0], str) else np.array(chain._states, dtype=object)
+        self._indices = chain._indices
+
+        if initial_states is None:
+            initial_states = chain.state
+        if isinstance(initial_states, (int, float, str)):
+            assert initial_states in chain._state_indexes.keys(), f'initial_states must belong to the states of the chain. Given {initial_states}.'
+            self._state_indexes = np.full(n_walkers, chain._state_indexes[initial_states], dtype=np.int64)
+        else:
+            assert len(initial_states) == n_walkers, f'initial_states must have one state for each walker ({n_walkers}). Given {len(initial_states)}.'
+            assert all([state in chain._state_indexes.keys() for state in initial_states]), 'initial_states must belong to the states of the chain.'
+            self._state_indexes = np.array([chain._state_indexes[state] for state in initial_states], dtype=np.int64)
+
+        #Search keys of the inverse CDF: the transitions from state r have keys in (r, r+1], spaced by their probabilities,
+        #so the transition of a walker in state r with uniform draw u is the first key greater than r+u.
+        indptr, weights = chain._indptr, chain._weights
+        degrees = np.diff(indptr)
+        entry_rows = np.repeat(np.arange(len(degrees)), degrees)
+        cumulative_weights = np.concatenate([[0.0], np.cumsum(weights)])
+        row_totals = cumulative_weights[indptr[1:]] - cumulative_weights[indptr[:-1]]
+        within_row = (cumulative_weights[1:] - cumulative_weights[indptr[entry_rows]]) / row_totals[entry_rows]
+        within_row[indptr[1:][degrees > 0] - 1] = 1.0
+        self._keys = entry_rows + within_row
+        self._dead_states = degrees == 0
+
+    @property
+    def n_walkers(self) -> int:
+        """
+        :return: Number of walkers.
+        :rtype: int
+        """
+        return self._n_walkers
+
+    @property
+    def states(self) -> np.ndarray:
+        """Returns the current states of all walkers.
+
+        :return: Array of states.
+        :rtype: np.ndarray
+        """
+        return self._labels[self._state_indexes]
+
+    def forward(self) -> np.ndarray:
+        """Do a random transition of every walker.
+
+        :return: States after the transition.
+        :rtype: np.ndarray
+        """
+        self._step()
+        return self.states
+
+    def simulate(self, n_steps: int) -> np.ndarray:
+        """Do 'n_steps' random transitions of every walker.
+
+        :param n_steps: Number of transitions.
+        :type n_steps: int
+        :return: Trajectory matrix, whose 0-axis indexes the walkers and 1-axis indexes the steps. Each entry is the state after the transition.
+        :rtype: np.ndarray
+        """
+        assert isinstance(n_steps, int), f'\'n_steps\' must be integer. Given {type(n_steps)}.'
+        assert n_steps > 0, f'n_steps must be positive. Given {n_steps}.'
+        trajectory = np.empty((self._n_walkers, n_steps), dtype=np.int64, order='F')
+        for step in range(n_steps):
+            self._step()
+            trajectory[:, step] = self._state_indexes
+        return self._labels[trajectory]
+
+    def _step(self):
+        """Internal method.
+        Advances the state indexes of all walkers by inverse-CDF sampling.
+        """
+        if self._dead_states[self._state_indexes].any():
+            raise ValueError('Some walkers are in states with no outgoing transitions.')
+        rng = self._rng if self._rng is not None else _active_rng.get()
+        uniforms = np.random.random_sample(self._n_walkers) if rng is None else rng.random(self._n_walkers)
+        self._state_indexes = self._indices[np.searchsorted(self._keys, self._state_indexes + uniforms, side='right')]
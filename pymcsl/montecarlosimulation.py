@@ -4,14 +4,207 @@ June-2022
 """
 
 from typing import *
+import os
+import random
+import asyncio
+import shutil
+import tempfile
+import weakref
+import tracemalloc
+from time import perf_counter
+from statistics import NormalDist
 import numpy as np
-from subsimulation import SubSimulationEnv, ContextType
+from pandas import DataFrame
+from subsimulation import SubSimulationEnv, ContextType, _get_numpy_dtype, _to_python_scalar
+from onlinestatistics import OnlineStatistics, _histogram_counts, _get_histogram_config, _get_histogram_edges
+from checkpoint import _RunCheckpoint
+from resultsio import _to_arrow_table, _write_parquet, _write_npz
+from profiling import RunStats, _get_peak_rss
+from jitkernel import _run_kernels, _no_begin
 
-def _first_or_default(l: List, f: Callable[[Any], bool], default: Any = None) -> Any:
-    for x in l:
-        if f(x):
-            return x
-    return default
+#number of values of a result matrix that are loaded at once by the statistics of the memmap history backend
+_memmap_block_values = 2**23
+
+def _get_quantile_values(hist: np.ndarray) -> np.ndarray:
+    """Internal function.
+    Returns the result matrix as is if np.quantile can interpolate its values (int or float), or converted to float (bool, or object for big ints).
+    """
+    return hist if hist.dtype.kind in 'iuf' else np.asarray(hist, dtype=np.float64)
+
+def _select_from_blocks(get_blocks: Callable[[], Iterator[np.ndarray]], rank: int, max_values: int) -> float:
+    """Returns the value of a given rank (starting at 0, in ascending order) among the values of a sequence of 1D blocks, without loading them all at once.
+    The blocks are read again on each pass. Each pass narrows the range of values that holds the rank with a histogram, until the values in the range fit in max_values and are selected in memory.
+    """
+    lower, upper = -np.inf, np.inf
+    while True:
+        n_below = 0
+        n_in_range = 0
+        range_min, range_max, n_range_min = np.inf, -np.inf, 0
+        for block in get_blocks():
+            in_range = block[(block >= lower) & (block <= upper)]
+            n_below += np.count_nonzero(block < lower)
+            n_in_range += in_range.size
+            if in_range.size > 0:
+                block_min = in_range.min()
+                if block_min < range_min:
+                    range_min, n_range_min = block_min, np.count_nonzero(in_range == block_min)
+                elif block_min == range_min:
+                    n_range_min += np.count_nonzero(in_range == block_min)
+                range_max = max(range_max, in_range.max())
+        rank_in_range = rank - n_below
+        if range_min == range_max:
+            return float(range_min)
+        if np.nextafter(range_min, np.inf) == range_max:
+            #the range has only two values, which can not be split further
+            return float(range_min if rank_in_range < n_range_min else range_max)
+        if n_in_range <= max_values:
+            candidates = np.concatenate([block[(block >= lower) & (block <= upper)] for block in get_blocks()])
+            return float(np.partition(candidates, rank_in_range)[rank_in_range])
+        edges = np.linspace(range_min, range_max, 1025)
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for block in get_blocks():
+            counts += np.histogram(block[(block >= range_min) & (block <= range_max)], edges)[0]
+        i = int(np.searchsorted(np.cumsum(counts), rank_in_range, side='right'))
+        lower, upper = edges[i], edges[i+1]
+
+def _get_blocked_quantiles(get_blocks: Callable[[], Iterator[np.ndarray]], n_values: int, qs: Union[float, Sequence[float]]) -> np.ndarray:
+    """Calculates exact quantiles (with the linear interpolation of np.quantile) of the values of a sequence of 1D blocks, without loading them all at once (see _select_from_blocks).
+    """
+    if any(np.isnan(block).any() for block in get_blocks()):
+        return np.full(np.shape(qs), np.nan)
+    quantiles = []
+    for q in np.atleast_1d(qs):
+        index = (n_values - 1) * q
+        lower_rank = int(np.floor(index))
+        lower_value = _select_from_blocks(get_blocks, lower_rank, _memmap_block_values)
+        upper_value = _select_from_blocks(get_blocks, lower_rank + 1, _memmap_block_values) if lower_rank + 1 < n_values and index > lower_rank else lower_value
+        t = index - lower_rank
+        quantiles.append(lower_value + (upper_value - lower_value) * t if t < 0.5 else upper_value - (upper_value - lower_value) * (1 - t))
+    return np.asarray(quantiles, dtype=np.float64).reshape(np.shape(qs))
+
+def _get_describe_quantile(statistic: str) -> Union[float, None]:
+    """Returns the quantile of a 'describe' statistic ('median' or 'pXX', where XX is a percentile, e.g. 'p50' or 'p99.9'), or None if it is not a quantile.
+    """
+    if statistic == 'median':
+        return 0.5
+    if statistic.startswith('p'):
+        try:
+            percentile = float(statistic[1:])
+        except ValueError:
+            return None
+        return percentile / 100 if 0 <= percentile <= 100 else None
+    return None
+
+def _seed_subsim(entropy: int, subsim_index: int):
+    """Seeds the global random generators (random and numpy.random) for a specific subsimulation.
+    The seed is derived from the simulation entropy and the subsimulation index, so it does not depend on which worker runs the subsimulation.
+    """
+    seed_state = np.random.SeedSequence(entropy, spawn_key=(subsim_index,)).generate_state(4)
+    random.seed(int.from_bytes(seed_state.tobytes(), 'little'))
+    np.random.seed(seed_state)
+
+def _get_global_random_states() -> Tuple[Any, Any]:
+    """Returns the states of the global random generators (random and numpy.random), which are reseeded for each subsimulation, so that they can be restored with _set_global_random_states.
+    """
+    return random.getstate(), np.random.get_state()
+
+def _set_global_random_states(random_states: Tuple[Any, Any]):
+    """Restores the states of the global random generators given by _get_global_random_states.
+    """
+    random.setstate(random_states[0])
+    np.random.set_state(random_states[1])
+
+def _get_subsim_rng(entropy: int, subsim_index: int) -> np.random.Generator:
+    """Derives the NumPy generator (context.rng) of a specific subsimulation.
+    The seed sequence of subsimulation i is the i-th child of SeedSequence(entropy) (as given by SeedSequence.spawn), and the generator uses its own child of it, so the streams of the subsimulations are independent.
+    """
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(entropy, spawn_key=(subsim_index, 2))))
+
+def _get_sketch_seed(entropy: int, subsim_index: int) -> int:
+    """Derives the seed of the quantile sketches of the chunk that starts at a specific subsimulation.
+    """
+    return int(np.random.SeedSequence(entropy, spawn_key=(subsim_index, 1)).generate_state(1)[0])
+
+def _run_subsim(variables: List[Tuple[str, type, object]], begin_function: Callable, step_function: Callable, n_steps: int, entropy: int, subsim_index: int, columns: Dict[str, np.ndarray], max_past: Union[int, None] = None, validate: str = 'full', stats: Union[RunStats, None] = None, trace_memory: bool = False) -> SubSimulationEnv:
+    """Runs a subsimulation whose history is written into the given 1D columns (e.g. rows of a result matrix) and returns its environment.
+    A column that falls back to object is reallocated by the environment, so the history must then be stored with _store_history.
+    If 'stats' is given, the time of each phase of the subsimulation is recorded in it, with its memory high-water mark (and its peak of traced memory, if trace_memory=True and tracemalloc is tracing).
+    """
+    _seed_subsim(entropy, subsim_index)
+    env = SubSimulationEnv(variables, begin_function, step_function, max_past, validate=validate, rng=_get_subsim_rng(entropy, subsim_index))
+    env._attach_history(columns)
+    if stats is None:
+        env.run_steps(n_steps)
+    else:
+        if trace_memory:
+            tracemalloc.reset_peak()
+        env._profile = stats
+        start_time = perf_counter()
+        env.run_steps(n_steps)
+        stats.add_subsim(subsim_index, perf_counter() - start_time, n_steps, _get_peak_rss(), tracemalloc.get_traced_memory()[1] if trace_memory else np.nan)
+        env._profile = None
+    return env
+
+def _store_history(env: SubSimulationEnv, matrices: Dict[str, np.ndarray], row: int, n_steps: int):
+    """Copies into a row of the given (n_subsimulations, n_steps) matrices the history columns of a subsimulation that were reallocated while it ran, instead of written into that row.
+    If a column fell back to object (e.g. an int state outside the int64 range), its typed matrix is replaced in 'matrices' by an object copy of it, so the values are kept as Python objects.
+    """
+    for var_name in matrices.keys():
+        history = env._history[var_name]
+        if np.may_share_memory(history, matrices[var_name]):
+            continue
+        if history.dtype == object and matrices[var_name].dtype != object:
+            matrices[var_name] = np.array(matrices[var_name], dtype=object)
+        matrices[var_name][row] = history[:n_steps]
+
+def _summarize_subsims(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Calculates the mean, variance, minimum, maximum and sum of each subsimulation (0-axis of 'values') over its steps.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return {'mean': np.mean(values, axis=1), 'var': np.var(values, axis=1), 'min': np.min(values, axis=1), 'max': np.max(values, axis=1), 'sum': np.sum(values, axis=1)}
+
+def _run_subsim_chunk(variables: List[Tuple[str, type, object]], begin_function: Callable, step_function: Callable, n_steps: int, entropy: int, subsim_indexes: List[int], max_past: Union[int, None] = None, validate: str = 'full', profile: Union[bool, str] = False) -> Tuple[List[int], Dict[str, np.ndarray], List[Dict[str, Any]], Union[RunStats, None]]:
+    """Runs a chunk of subsimulations and returns only their histories (as (len(subsim_indexes), n_steps) matrices), final states and, if profile is True or 'memory', the RunStats of the chunk (or None).
+    This function is the unit of work sent to the workers of the parallel backends, so it must stay at module level (picklable).
+    """
+    histories = {var_name: np.empty((len(subsim_indexes), n_steps), dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in variables}
+    final_states = []
+    stats = RunStats() if profile else None
+    #the workers of the 'process' backend start tracing their own allocations
+    start_tracing = profile == 'memory' and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    try:
+        for k, subsim_index in enumerate(subsim_indexes):
+            env = _run_subsim(variables, begin_function, step_function, n_steps, entropy, subsim_index, {var_name: histories[var_name][k] for var_name in histories.keys()}, max_past, validate, stats, profile == 'memory')
+            _store_history(env, histories, k, n_steps)
+            final_states.append(env.variables_states)
+    finally:
+        if start_tracing:
+            tracemalloc.stop()
+    return subsim_indexes, histories, final_states, stats
+
+def _run_subsim_chunk_online(variables: List[Tuple[str, type, object]], begin_function: Callable, step_function: Callable, n_steps: int, entropy: int, subsim_indexes: List[int], online_config: Dict[str, Union[Tuple[int, Tuple[float, float]], None]], quantile_error: Union[float, None] = None, max_past: Union[int, None] = None, validate: str = 'full', profile: Union[bool, str] = False) -> Tuple[List[int], Dict[str, OnlineStatistics], Dict[str, Dict[str, np.ndarray]], Union[RunStats, None]]:
+    """Runs a chunk of subsimulations and folds their histories into online accumulators, which are returned with the per-subsimulation summaries and the RunStats of the chunk (or None).
+    'online_config' is in the format {variable_name: histogram_config}.
+    """
+    subsim_indexes, histories, final_states, stats = _run_subsim_chunk(variables, begin_function, step_function, n_steps, entropy, subsim_indexes, max_past, validate, profile)
+    start_time = perf_counter()
+    subsim_indexes, online_stats, subsim_summaries = _fold_subsim_chunk(n_steps, entropy, subsim_indexes, histories, online_config, quantile_error)
+    if stats is not None:
+        stats.add('aggregation', perf_counter() - start_time)
+    return subsim_indexes, online_stats, subsim_summaries, stats
+
+def _fold_subsim_chunk(n_steps: int, entropy: int, subsim_indexes: List[int], histories: Dict[str, np.ndarray], online_config: Dict[str, Union[Tuple[int, Tuple[float, float]], None]], quantile_error: Union[float, None] = None) -> Tuple[List[int], Dict[str, OnlineStatistics], Dict[str, Dict[str, np.ndarray]]]:
+    """Folds the histories of a chunk of subsimulations into online accumulators, which are returned with the per-subsimulation summaries.
+    """
+    online_stats = dict()
+    subsim_summaries = dict()
+    for var_name, histogram_config in online_config.items():
+        online_stats[var_name] = OnlineStatistics(n_steps, histogram_config, quantile_error, _get_sketch_seed(entropy, subsim_indexes[0]))
+        online_stats[var_name].update(histories[var_name])
+        subsim_summaries[var_name] = _summarize_subsims(histories[var_name])
+    return subsim_indexes, online_stats, subsim_summaries
 
 class MonteCarloSimulationEnv():
     """
@@ -19,7 +212,7 @@ class MonteCarloSimulationEnv():
     The MonteCarloSimulationEnv class performs a series of independent subsimulations under the same conditions.
     """
     
-    def __init__(self, variables: List[Tuple[str, type, Union[str, int, float, bool]]], n_subsimulations: int, n_steps: int) -> None:
+    def __init__(self, variables: List[Tuple[str, type, Union[str, int, float, bool]]], n_subsimulations: int, n_steps: int, seed: Union[int, None] = None, keep_history: bool = True, online_stats: Union[List[str], None] = None, online_histograms: Union[Dict[str, Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], str], Sequence[float]]], None] = None, quantile_error: Union[float, None] = None, max_past: Union[int, None] = None, validate: str = 'full', history_backend: str = 'memory', history_dir: Union[str, None] = None) -> None:
         """
         :param variables: List of simulation variables in the format [(variable_name, variable_type, default_value)].
         :type variables: List[Tuple[str, type, Union[str, int, float, bool]]]
@@ -27,6 +220,24 @@ class MonteCarloSimulationEnv():
         :type n_subsimulations: int
         :param n_steps: Number of steps per subsimulation.
         :type n_steps: int
+        :param seed: Seed from which the seeds of all subsimulations are derived. Each subsimulation has its own NumPy generator (context.rng), from which the random variables and Markov chains of the library draw by default, and the global random generators are also seeded for it (their states are restored after the run). If None, it is drawn from the global random module, so random.seed() still makes runs reproducible. Defaults to None.
+        :type seed: Union[int, None], optional
+        :param keep_history: If False, the histories are not stored. The subsimulations are folded into per-step online accumulators as they finish, so the memory usage is O(n_steps) (plus a few values per subsimulation). Only the mean, variance, standard deviation, minimum, maximum, sum and the configured histograms are then available. Defaults to True.
+        :type keep_history: bool, optional
+        :param online_stats: Names of the numeric variables whose online accumulators are kept. If None, all numeric variables are tracked when keep_history=False or quantile_error is given. Defaults to None.
+        :type online_stats: Union[List[str], None], optional
+        :param online_histograms: Fixed-bin histograms accumulated during the run (as the subsimulations finish), in the format {variable_name: (n_bins, (min, max))} for equal-width bins, {variable_name: (n_bins, (min, max), 'log')} for log-spaced bins or {variable_name: bin_edges}. get_variable_histogram then returns them without going through the histories. Defaults to None.
+        :type online_histograms: Union[Dict[str, Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], str], Sequence[float]]], None], optional
+        :param quantile_error: If given, the online accumulators keep a mergeable quantile sketch with this target rank error, which is used by get_variable_quantiles and get_variable_median instead of the histories. Defaults to None.
+        :type quantile_error: Union[float, None], optional
+        :param max_past: Maximum 'n' of the 'past' method of the contexts. If given, each subsimulation keeps its last max_past states in a circular buffer, from which the 'past' method reads. Defaults to None.
+        :type max_past: Union[int, None], optional
+        :param validate: Type checking of the states of the subsimulations. With 'full', every assignment to a variable and every logged state is type checked; with 'first_step', only the beginning callback and the first step of each subsimulation are checked, and with 'off' nothing is checked. Defaults to 'full'.
+        :type validate: str, optional
+        :param history_backend: Storage of the result matrices. With 'memory', they are NumPy arrays. With 'memmap', the result matrix of each numeric variable is a np.memmap file of shape (n_subsimulations, n_steps), so the histories do not have to fit in RAM. The statistics are then accumulated in blocks of subsimulations during the run, and the SubSimulationEnv objects are not kept (get_subsim_env rebuilds them, without auxiliary objects). Defaults to 'memory'.
+        :type history_backend: str, optional
+        :param history_dir: Directory of the memmap files. If None, a temporary directory is created, which is removed when the simulation is garbage collected (or at exit). Defaults to None.
+        :type history_dir: Union[str, None], optional
         """
         assert isinstance(n_subsimulations, int), f'Argument of \'n_subsimulations\' must be integer. Given {type(n_subsimulations)}.'
         assert n_subsimulations > 0, f'n_subsimulations must be positive. Given {n_subsimulations}.'
@@ -37,74 +248,725 @@ class MonteCarloSimulationEnv():
         assert all([isinstance(var_type, type) for var_name, var_type, var_default in variables]), f'\'variables\' list must be in the format [(string, type, object)].'
         assert all([var_type in (str, int, float, bool) for var_name, var_type, var_default in variables]), f'variable types must be int, float, str or bool.'
         assert all([isinstance(var_default, var_type) for var_name, var_type, var_default in variables]), f'Some default value in \'variables\' list does not correspond to its variable\'s type.'
-        assert all([var_name not in ('past', 'getstate', 'setstate') for var_name, var_type, var_default in variables]), 'Names \'past\', \'getstate\' and \'setstate\' are internally reserved and forbidden for variables.'
+        assert all([var_name not in ('past', 'getstate', 'setstate', 'rng') for var_name, var_type, var_default in variables]), 'Names \'past\', \'getstate\', \'setstate\' and \'rng\' are internally reserved and forbidden for variables.'
+        assert seed is None or isinstance(seed, int), f'Argument of \'seed\' must be integer or None. Given {type(seed)}.'
+        assert isinstance(keep_history, bool), f'Argument of \'keep_history\' must be bool. Given {type(keep_history)}.'
+        assert max_past is None or (isinstance(max_past, int) and max_past > 0), f'Argument of \'max_past\' must be a positive integer or None. Given {max_past}.'
+        assert validate in ('full', 'first_step', 'off'), f'Argument of \'validate\' must be \'full\', \'first_step\' or \'off\'. Given {validate}.'
+        assert history_backend in ('memory', 'memmap'), f'Argument of \'history_backend\' must be \'memory\' or \'memmap\'. Given {history_backend}.'
+        assert history_backend == 'memory' or keep_history, 'The memmap history backend needs keep_history=True.'
+        assert history_dir is None or isinstance(history_dir, str), f'Argument of \'history_dir\' must be a string or None. Given {type(history_dir)}.'
+        numeric_variables = [var_name for var_name, var_type, var_default in variables if var_type in (float, int, bool)]
+        assert online_stats is None or all([var_name in numeric_variables for var_name in online_stats]), 'online_stats must be a list of names of int, float or bool variables.'
+        assert online_histograms is None or all([var_name in numeric_variables for var_name in online_histograms.keys()]), 'online_histograms keys must be names of int, float or bool variables.'
+        assert quantile_error is None or (isinstance(quantile_error, float) and 0 < quantile_error < 1), f'quantile_error must be a float in the interval (0, 1) or None. Given {quantile_error}.'
         
         self._variables = variables
+        self._var_indexes = {var_name: i for i, (var_name, var_type, var_default) in enumerate(variables)}
         self._n_subsims = n_subsimulations
         self._n_steps = n_steps
         self._subsim_begin_function = None
         self._subsim_step_function = None
+        self._jit_begin = False
+        self._jit_step = False
         self._subsim_envs = None
+        self._results = None
+        self._keep_history = keep_history
+        self._max_past = max_past
+        self._validate = validate
+        self._history_backend = history_backend
+        self._history_dir = history_dir
+        
+        #build a dictionary in the format {variable_name: histogram_config} with the variables that have online accumulators
+        #the statistics of the memmap backend are always taken from online accumulators
+        if online_stats is None or history_backend == 'memmap':
+            online_stats = numeric_variables if not keep_history or quantile_error is not None or history_backend == 'memmap' else []
+        online_histograms = {var_name: _get_histogram_config(histogram) for var_name, histogram in online_histograms.items()} if online_histograms is not None else dict()
+        self._online_config = {var_name: online_histograms.get(var_name) for var_name in numeric_variables if var_name in online_stats or var_name in online_histograms.keys()}
+        self._quantile_error = quantile_error
+        self._online_stats = None
+        self._subsim_summaries = None
+        self._stats = None
+        #number of leading subsimulations whose results are complete while iter_run runs (None when all the results are complete)
+        self._n_partial_subsims = None
+        self._entropy = seed if seed is not None else random.getrandbits(128)
 
     @property
     def subsim_begin(self) -> Callable:
         """Returns a decorator that subscribes a function as the beginning function of all subsimulations.
+        It can also be called with jit=True (@env.subsim_begin(jit=True)) to subscribe a beginning kernel for a step kernel (see subsim_step). The kernel is a function kernel(state, rng) that gets the state record of a subsimulation (with the default values) and its generator, and can change the state.
 
         :return: Wrapped decorator.
         :rtype: Callable
         """
-        def wrapped(function: Callable[[ContextType], None]) -> Callable:
-            self._subsim_begin_function = function
+        def wrapped(function: Union[Callable[[ContextType], None], None] = None, jit: bool = False) -> Callable:
+            if function is None:
+                return lambda function: wrapped(function, jit)
+            self.set_subsim_begin_callback(function, jit)
             return function
         return wrapped
 
     @property
     def subsim_step(self) -> Callable:
         """Returns a decorator that subscribes a function as the step-function of all subsimulations.
+        It can also be called with jit=True (@env.subsim_step(jit=True)) to subscribe a step kernel, for simulations with only int, float and bool variables.
+        A step kernel is a function kernel(state, step, rng) that changes the state record of a subsimulation in place (e.g. state.x += rng.normal()). It can only use what numba compiles in nopython mode, and draws random numbers from 'rng', the generator of the subsimulation (see KernelRandom), which has the methods random, uniform, integers, normal, standard_normal and exponential of the NumPy generators and is seeded from the simulation seed and the index of the subsimulation (the global random generators are not used).
+        The kernel is compiled by numba together with the loop over the subsimulations and the steps and with the history writes, so there are no Python calls per step or per subsimulation (only one per block of subsimulations). The compiled loop is cached per kernel function, so kernels defined once (e.g. at module level) are compiled only once. If numba is not installed, the same loop is run by the interpreter, with the same results.
+        The ints of the kernels are 64-bit, so they wrap around instead of falling back to object columns.
 
         :return: Wrapped decorator.
         :rtype: Callable
         """
-        def wrapped(function: Callable[[ContextType], None]) -> Callable:
-            self._subsim_step_function = function
+        def wrapped(function: Union[Callable[[ContextType, int], None], None] = None, jit: bool = False) -> Callable:
+            if function is None:
+                return lambda function: wrapped(function, jit)
+            self.set_subsim_step_callback(function, jit)
             return function
         return wrapped
 
-    def set_subsim_begin_callback(self, f: Callable[[ContextType], None]):
+    def set_subsim_begin_callback(self, f: Callable[[ContextType], None], jit: bool = False):
         """Subscribes a function as the begin-function of all subsimulations.
 
         :param f: Callback function.
         :type f: Callable[[ContextType], None]
+        :param jit: If True, f is a beginning kernel (see subsim_begin). Defaults to False.
+        :type jit: bool, optional
         """
         assert isinstance(f, Callable)
         self._subsim_begin_function = f
+        self._jit_begin = jit
     
-    def set_subsim_step_callback(self, f: Callable[[ContextType], None]):
+    def set_subsim_step_callback(self, f: Callable[[ContextType], None], jit: bool = False):
         """Subscribes a function as the step-function of all subsimulations.
 
         :param f: Callback function.
         :type f: Callable[[ContextType], None]
+        :param jit: If True, f is a step kernel (see subsim_step). Defaults to False.
+        :type jit: bool, optional
         """
         assert isinstance(f, Callable)
+        assert not jit or all([var_type in (int, float, bool) for var_name, var_type, var_default in self._variables]), 'Step kernels only support int, float and bool variables.'
         self._subsim_step_function = f
+        self._jit_step = jit
 
-    def run(self, show_progress: bool = True):
+    def run(self, show_progress: bool = True, n_workers: Union[int, None] = None, backend: str = 'serial', chunk_size: Union[int, None] = None, start_method: Union[str, None] = None, checkpoint_path: Union[str, None] = None, checkpoint_every: Union[int, None] = None, profile: Union[bool, str] = False, profile_hook: Union[Callable[[RunStats], None], None] = None):
         """Run all the independent subsimulations.
+        Each subsimulation is seeded from the simulation seed and its own index, so the outcomes are the same for any backend and any number of workers.
+        With the 'process' backend, only the histories and final states of the subsimulations are sent back to the parent process, and the auxiliary objects are lost.
+        The callbacks must then be picklable (defined at module level) when the 'spawn' start method is used.
+        The 'thread' backend shares the global random generators among the workers, so it is only reproducible if the callbacks only draw from context.rng (directly or through the random variables and Markov chains of the library).
 
         :param show_progress: Enable progress bar, defaults to True
         :type show_progress: bool, optional
+        :param n_workers: Number of workers of the 'process' and 'thread' backends. If None, the number of CPUs is used. Defaults to None.
+        :type n_workers: Union[int, None], optional
+        :param backend: 'serial' runs the subsimulations one after another, 'process' shards them across worker processes and 'thread' across worker threads. Defaults to 'serial'.
+        :type backend: str, optional
+        :param chunk_size: Number of subsimulations sent to a worker at once (or folded at once by a serial run with keep_history=False). If None, a size that gives about 4 chunks per worker is used, and it is at most checkpoint_every when checkpoint_path is given. Defaults to None.
+        :type chunk_size: Union[int, None], optional
+        :param start_method: Multiprocessing start method ('fork', 'spawn' or 'forkserver') of the 'process' backend. If None, the platform default is used. Defaults to None.
+        :type start_method: Union[str, None], optional
+        :param checkpoint_path: Directory where the results of the completed subsimulations are periodically saved. If it already has a checkpoint of this simulation, the saved subsimulations are loaded instead of run again (see also resume). Defaults to None.
+        :type checkpoint_path: Union[str, None], optional
+        :param checkpoint_every: Number of completed subsimulations between two saves. If None, about 1% of the subsimulations. Defaults to None.
+        :type checkpoint_every: Union[int, None], optional
+        :param profile: If True, the wall time and the number of calls of each phase of the run (beginning callback, step callback, context dispatch, logging and aggregation) and the time, steps per second and memory high-water mark of each subsimulation are recorded in a RunStats object (see the stats property). If 'memory', the allocations are also traced with tracemalloc, to record the peak of each subsimulation, which slows down the run (and mixes the subsimulations of the 'thread' backend). The progress bar then shows the share of each phase. Defaults to False.
+        :type profile: Union[bool, str], optional
+        :param profile_hook: Function called with the RunStats object whenever subsimulations are completed, e.g. to monitor a long run. Needs profile. Defaults to None.
+        :type profile_hook: Union[Callable[[RunStats], None], None], optional
         """
-        assert isinstance(self._subsim_begin_function, Callable), 'Begin callback is not defined.'
+        assert isinstance(self._subsim_begin_function, Callable) or self._jit_step, 'Begin callback is not defined.'
         assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+        assert self._jit_step or not self._jit_begin, 'A beginning kernel needs a step kernel.'
+        assert not self._jit_step or self._subsim_begin_function is None or self._jit_begin, 'A step kernel needs a beginning kernel (jit=True) or no beginning callback.'
+        assert not self._jit_step or (backend == 'serial' and checkpoint_path is None), 'Step kernels are run by a single compiled loop, so they only support the serial backend and no checkpoints.'
+        assert checkpoint_path is None or isinstance(checkpoint_path, str), f'checkpoint_path must be a string or None. Given {type(checkpoint_path)}.'
+        assert checkpoint_every is None or (isinstance(checkpoint_every, int) and checkpoint_every > 0), f'checkpoint_every must be a positive integer or None. Given {checkpoint_every}.'
+        assert backend in ('serial', 'process', 'thread'), 'backend must be \'serial\', \'process\' or \'thread\'.'
+        assert n_workers is None or (isinstance(n_workers, int) and n_workers > 0), f'n_workers must be a positive integer or None. Given {n_workers}.'
+        assert chunk_size is None or (isinstance(chunk_size, int) and chunk_size > 0), f'chunk_size must be a positive integer or None. Given {chunk_size}.'
+        assert profile in (False, True, 'memory'), f'profile must be False, True or \'memory\'. Given {profile}.'
+        assert profile_hook is None or (profile and isinstance(profile_hook, Callable)), 'profile_hook must be a function, and needs profile.'
         
         if show_progress:
             from tqdm import tqdm
         
-        self._subsim_envs = [SubSimulationEnv(self._variables, self._subsim_begin_function, self._subsim_step_function) for i in range(self._n_subsims)]
-        
-        for env in tqdm(self._subsim_envs) if show_progress else self._subsim_envs:
-            env.run_steps(self._n_steps)
-    
+        n_workers = n_workers if n_workers is not None else (os.cpu_count() or 1)
+        if checkpoint_path is not None and checkpoint_every is None:
+            checkpoint_every = max(1, self._n_subsims // 100)
+        if chunk_size is None:
+            #serial runs without history are folded in blocks of about 2^16 states per variable
+            chunk_size = max(1, -(-self._n_subsims // (4*n_workers))) if backend != 'serial' else max(1, min(self._n_subsims, 2**16 // self._n_steps))
+            #a chunk is saved only when it is completed, so the chunks are not larger than the checkpoint interval
+            if checkpoint_path is not None:
+                chunk_size = min(chunk_size, checkpoint_every)
+
+        start_time = perf_counter()
+        self._stats = RunStats() if profile else None
+        start_tracing = profile == 'memory' and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        self._allocate_results()
+
+        #the subsimulations saved in the checkpoint are loaded, and only the other ones are run
+        checkpoint = None
+        remaining = list(range(self._n_subsims))
+        if checkpoint_path is not None:
+            checkpoint = _RunCheckpoint(checkpoint_path, checkpoint_every)
+            checkpoint.start(self)
+            loaded = set(checkpoint.load(self))
+            remaining = [i for i in remaining if i not in loaded]
+        chunks = [remaining[first:first+chunk_size] for first in range(0, len(remaining), chunk_size)]
+
+        progress_bar = tqdm(total=self._n_subsims, initial=self._n_subsims-len(remaining)) if show_progress else None
+
+        #the global random generators are reseeded for each subsimulation run in this process, and given back to the caller afterwards
+        caller_random_states = _get_global_random_states()
+        try:
+            if self._jit_step:
+                self._run_kernel_blocks(progress_bar, start_time, profile_hook)
+            elif backend == 'serial':
+                if self._keep_history:
+                    for i in remaining:
+                        env = _run_subsim(self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, i, {var_name: self._results[var_name][i] for var_name in self._results.keys()}, self._max_past, self._validate, self._stats, profile == 'memory')
+                        _store_history(env, self._results, i, self._n_steps)
+                        aggregation_start = perf_counter()
+                        if self._subsim_envs is not None:
+                            self._subsim_envs[i] = env
+                        self._fold_completed_subsims([i])
+                        if checkpoint is not None:
+                            checkpoint.add_history(self, [i])
+                        self._report_progress(progress_bar, 1, start_time, aggregation_start, profile_hook)
+                else:
+                    for chunk in chunks:
+                        *chunk_results, chunk_stats = _run_subsim_chunk_online(self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, chunk, self._online_config, self._quantile_error, self._max_past, self._validate, profile)
+                        aggregation_start = perf_counter()
+                        self._collect_online_chunk(*chunk_results)
+                        if checkpoint is not None:
+                            checkpoint.add_online(self, *chunk_results)
+                        self._report_progress(progress_bar, len(chunk), start_time, aggregation_start, profile_hook, chunk_stats)
+            else:
+                if backend == 'process':
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+                    executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context(start_method))
+                else:
+                    from concurrent.futures import ThreadPoolExecutor
+                    executor = ThreadPoolExecutor(max_workers=n_workers)
+
+                from concurrent.futures import as_completed
+                with executor:
+                    if self._keep_history:
+                        futures = [executor.submit(_run_subsim_chunk, self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, chunk, self._max_past, self._validate, profile) for chunk in chunks]
+                    else:
+                        futures = [executor.submit(_run_subsim_chunk_online, self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, chunk, self._online_config, self._quantile_error, self._max_past, self._validate, profile) for chunk in chunks]
+                    for future in as_completed(futures):
+                        *chunk_results, chunk_stats = future.result()
+                        aggregation_start = perf_counter()
+                        if self._keep_history:
+                            self._collect_history_chunk(*chunk_results)
+                            if checkpoint is not None:
+                                checkpoint.add_history(self, chunk_results[0])
+                        else:
+                            self._collect_online_chunk(*chunk_results)
+                            if checkpoint is not None:
+                                checkpoint.add_online(self, *chunk_results)
+                        self._report_progress(progress_bar, len(chunk_results[0]), start_time, aggregation_start, profile_hook, chunk_stats)
+
+            aggregation_start = perf_counter()
+            if checkpoint is not None:
+                checkpoint.flush(self)
+            if self._keep_history and self._history_backend == 'memmap':
+                for var_name in self._results.keys():
+                    if isinstance(self._results[var_name], np.memmap):
+                        self._results[var_name].flush()
+            self._report_progress(None, 0, start_time, aggregation_start, profile_hook)
+        finally:
+            _set_global_random_states(caller_random_states)
+            if start_tracing:
+                tracemalloc.stop()
+            if progress_bar is not None:
+                progress_bar.close()
+
+    def _get_begin_kernel(self) -> Callable:
+        """Internal method.
+        Returns the beginning kernel of the step kernel.
+        """
+        return self._subsim_begin_function if self._subsim_begin_function is not None else _no_begin
+
+    def _run_kernel_blocks(self, progress_bar: Any, start_time: float, profile_hook: Union[Callable[[RunStats], None], None]):
+        """Internal method.
+        Runs all the subsimulations with the step kernel, in blocks of subsimulations. The histories of each block are written into the result matrices (or folded into the online accumulators) as the blocks are completed.
+        """
+        #the loop is compiled before the run (by running it for no subsimulations), so that the compilation time is not taken as time of the steps
+        begin_kernel = self._get_begin_kernel()
+        _run_kernels(self._variables, begin_kernel, self._subsim_step_function, self._n_steps, self._entropy, [])
+        self._subsim_envs = None
+        block_size = max(1, _memmap_block_values // (self._n_steps * len(self._variables)))
+        for first in range(0, self._n_subsims, block_size):
+            subsim_indexes = list(range(first, min(first+block_size, self._n_subsims)))
+            block_start = perf_counter()
+            histories = _run_kernels(self._variables, begin_kernel, self._subsim_step_function, self._n_steps, self._entropy, subsim_indexes)
+            aggregation_start = perf_counter()
+            if self._stats is not None:
+                #the subsimulations of a block are run by a single native call, so they share its time evenly
+                self._stats.add('step', aggregation_start - block_start, len(subsim_indexes) * self._n_steps)
+                for subsim_index in subsim_indexes:
+                    self._stats.add_subsim(subsim_index, (aggregation_start - block_start) / len(subsim_indexes), self._n_steps, _get_peak_rss())
+            if self._keep_history:
+                for var_name in self._results.keys():
+                    self._results[var_name][first:first+len(subsim_indexes)] = histories[var_name]
+                self._fold_completed_subsims(subsim_indexes)
+            else:
+                self._collect_online_chunk(*_fold_subsim_chunk(self._n_steps, self._entropy, subsim_indexes, histories, self._online_config, self._quantile_error))
+            self._report_progress(progress_bar, len(subsim_indexes), start_time, aggregation_start, profile_hook)
+
+    def _report_progress(self, progress_bar: Any, n_completed: int, start_time: float, aggregation_start: float, profile_hook: Union[Callable[[RunStats], None], None], chunk_stats: Union[RunStats, None] = None):
+        """Internal method.
+        Records the aggregation time and the RunStats of completed subsimulations (if profiling), calls the profile hook and advances the progress bar, whose postfix shows the steps per second (and the share of each phase, if profiling).
+        """
+        elapsed = perf_counter() - start_time
+        if self._stats is not None:
+            if chunk_stats is not None:
+                self._stats.merge(chunk_stats)
+            self._stats.add('aggregation', perf_counter() - aggregation_start)
+            self._stats._wall_time = elapsed
+            if profile_hook is not None:
+                profile_hook(self._stats)
+        if progress_bar is not None:
+            if self._stats is not None:
+                progress_bar.set_postfix(self._stats._get_postfix(), refresh=False)
+            else:
+                progress_bar.set_postfix({'steps/s': f'{(progress_bar.n + n_completed - progress_bar.initial) * self._n_steps / elapsed:.4g}'}, refresh=False)
+            progress_bar.update(n_completed)
+
+    @property
+    def stats(self) -> Union[RunStats, None]:
+        """
+        :return: RunStats object with the profile of the last run, or None if it was not run with profile=True.
+        :rtype: Union[RunStats, None]
+        """
+        return self._stats
+
+    def _allocate_results(self):
+        """Internal method.
+        Allocates the result matrices (or the per-subsimulation summaries, when the histories are not kept) and the online accumulators of a run of n_subsimulations.
+        """
+        if self._keep_history and self._history_backend == 'memory':
+            #one (n_subsims, n_steps) result matrix per variable. The subsimulations write their histories directly into its rows.
+            self._results = {var_name: np.empty((self._n_subsims, self._n_steps), dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in self._variables}
+            self._subsim_envs = [None] * self._n_subsims
+        elif self._keep_history:
+            #the result matrices of the numeric variables are memory-mapped files. Variables of other types (object arrays) stay in memory.
+            if self._history_dir is None:
+                self._history_dir = tempfile.mkdtemp(prefix='pymcsl_')
+                #the temporary directory is removed with the simulation
+                weakref.finalize(self, shutil.rmtree, self._history_dir, True)
+            os.makedirs(self._history_dir, exist_ok=True)
+            self._results = {var_name: np.memmap(os.path.join(self._history_dir, f'{var_name}.dat'), dtype=_get_numpy_dtype(var_type), mode='w+', shape=(self._n_subsims, self._n_steps)) if var_type in (int, float, bool) else np.empty((self._n_subsims, self._n_steps), dtype=object) for var_name, var_type, var_default in self._variables}
+            self._subsim_envs = None
+            self._subsim_summaries = {var_name: {statistic: np.empty(self._n_subsims) for statistic in ('mean', 'var', 'min', 'max', 'sum')} for var_name in self._online_config.keys()}
+        else:
+            self._results = None
+            self._subsim_envs = None
+            self._subsim_summaries = {var_name: {statistic: np.empty(self._n_subsims) for statistic in ('mean', 'var', 'min', 'max', 'sum')} for var_name in self._online_config.keys()}
+        self._online_stats = {var_name: OnlineStatistics(self._n_steps, histogram_config, self._quantile_error, _get_sketch_seed(self._entropy, self._n_subsims)) for var_name, histogram_config in self._online_config.items()}
+        self._completed_subsims = np.zeros(self._n_subsims, dtype=bool)
+        self._n_folded_subsims = 0
+
+    @classmethod
+    def resume(cls, checkpoint_path: str, begin_function: Union[Callable[[ContextType], None], None] = None, step_function: Union[Callable[[ContextType, int], None], None] = None, **run_kwargs) -> 'MonteCarloSimulationEnv':
+        """Rebuilds a simulation from a checkpoint written by run, and runs the subsimulations that were not saved.
+        Since every subsimulation is seeded from the simulation seed and its own index, the results are the same as the ones of an uninterrupted run.
+
+        :param checkpoint_path: Checkpoint directory.
+        :type checkpoint_path: str
+        :param begin_function: Beginning callback. Needed only if the callbacks could not be pickled into the checkpoint. Defaults to None.
+        :type begin_function: Union[Callable[[ContextType], None], None], optional
+        :param step_function: Step callback. Needed only if the callbacks could not be pickled into the checkpoint. Defaults to None.
+        :type step_function: Union[Callable[[ContextType, int], None], None], optional
+        :param run_kwargs: Other arguments of run (e.g. backend, n_workers, checkpoint_every).
+        :return: The simulation, after the run.
+        :rtype: MonteCarloSimulationEnv
+        """
+        assert isinstance(checkpoint_path, str), f'checkpoint_path must be a string. Given {type(checkpoint_path)}.'
+        assert os.path.exists(os.path.join(checkpoint_path, 'meta.json')), f'There is no checkpoint at {checkpoint_path}.'
+        saved_begin_function, saved_step_function = _RunCheckpoint.read_callbacks(checkpoint_path)
+        begin_function = begin_function if begin_function is not None else saved_begin_function
+        step_function = step_function if step_function is not None else saved_step_function
+        assert isinstance(begin_function, Callable) and isinstance(step_function, Callable), 'The callbacks were not saved in the checkpoint, so they must be given.'
+
+        env = cls(**_RunCheckpoint.get_env_kwargs(_RunCheckpoint.read_meta(checkpoint_path)))
+        env.set_subsim_begin_callback(begin_function)
+        env.set_subsim_step_callback(step_function)
+        env.run(checkpoint_path=checkpoint_path, **run_kwargs)
+        return env
+
+    def run_until(self, var_name: str, statistic: str = 'mean', rel_tol: float = 0.01, abs_tol: float = 0.0, confidence: float = 0.95, max_subsimulations: Union[int, None] = None, batch: Union[int, None] = None, show_progress: bool = True, n_workers: Union[int, None] = None, backend: str = 'serial', chunk_size: Union[int, None] = None, start_method: Union[str, None] = None) -> Tuple[float, Tuple[float, float]]:
+        """Runs subsimulations in batches until the expected value of a per-subsimulation statistic of a variable is estimated with the requested precision.
+        Each subsimulation gives one observation (the statistic of the variable over its steps), and the estimate is the mean of the observations, with a normal confidence interval from their standard error.
+        The run stops after the first batch whose confidence interval half-width is at most max(rel_tol * |estimate|, abs_tol), or when max_subsimulations are run.
+        The simulation is then the same as a run with n_subsimulations equal to the number of subsimulations run (which becomes its n_subsimulations), so all the other methods can be used afterwards.
+        The batches always end at multiples of 'batch', so the stopping point does not depend on the backend or on the number of workers.
+        The auxiliary objects of the subsimulations are not kept (replay_subsim gives them back).
+
+        :param var_name: Name of an int, float or bool variable.
+        :type var_name: str
+        :param statistic: Per-subsimulation statistic: 'mean', 'var', 'min', 'max' or 'sum' of the variable over the steps, or 'last' for its state at the last step. Defaults to 'mean'.
+        :type statistic: str, optional
+        :param rel_tol: Tolerance of the confidence interval half-width, relative to the estimate. Defaults to 0.01.
+        :type rel_tol: float, optional
+        :param abs_tol: Absolute tolerance of the confidence interval half-width. Defaults to 0.0.
+        :type abs_tol: float, optional
+        :param confidence: Confidence level of the interval, in the interval (0, 1). Defaults to 0.95.
+        :type confidence: float, optional
+        :param max_subsimulations: Maximum number of subsimulations. If None, the n_subsimulations given to the constructor. Defaults to None.
+        :type max_subsimulations: Union[int, None], optional
+        :param batch: Number of subsimulations run between two convergence checks. If None, about 1% of max_subsimulations (at least 30). Defaults to None.
+        :type batch: Union[int, None], optional
+        :param show_progress: Enable progress bar, defaults to True
+        :type show_progress: bool, optional
+        :param n_workers: Number of workers of the 'process' and 'thread' backends (see run). Defaults to None.
+        :type n_workers: Union[int, None], optional
+        :param backend: 'serial', 'process' or 'thread' (see run). Defaults to 'serial'.
+        :type backend: str, optional
+        :param chunk_size: Number of subsimulations sent to a worker at once. If None, a size that gives about one chunk of each batch per worker is used. Defaults to None.
+        :type chunk_size: Union[int, None], optional
+        :param start_method: Multiprocessing start method of the 'process' backend (see run). Defaults to None.
+        :type start_method: Union[str, None], optional
+        :return: Tuple in the format (estimate, (lower_bound, upper_bound)).
+        :rtype: Tuple[float, Tuple[float, float]]
+        """
+        assert isinstance(self._subsim_begin_function, Callable), 'Begin callback is not defined.'
+        assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+        assert isinstance(var_name, str), 'var_name must be string.'
+        found_name, found_type, found_default = self._get_variable(var_name)
+        assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
+        assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
+        assert statistic in ('mean', 'var', 'min', 'max', 'sum', 'last'), f'statistic must be \'mean\', \'var\', \'min\', \'max\', \'sum\' or \'last\'. Given {statistic}.'
+        assert isinstance(rel_tol, (int, float)) and rel_tol >= 0, f'rel_tol must be a non-negative number. Given {rel_tol}.'
+        assert isinstance(abs_tol, (int, float)) and abs_tol >= 0, f'abs_tol must be a non-negative number. Given {abs_tol}.'
+        assert rel_tol > 0 or abs_tol > 0, 'rel_tol or abs_tol must be positive.'
+        assert isinstance(confidence, float) and 0 < confidence < 1, f'confidence must be a float in the interval (0, 1). Given {confidence}.'
+        assert max_subsimulations is None or (isinstance(max_subsimulations, int) and max_subsimulations > 1), f'max_subsimulations must be an integer greater than 1 or None. Given {max_subsimulations}.'
+        assert batch is None or (isinstance(batch, int) and batch > 0), f'batch must be a positive integer or None. Given {batch}.'
+        assert backend in ('serial', 'process', 'thread'), 'backend must be \'serial\', \'process\' or \'thread\'.'
+        assert n_workers is None or (isinstance(n_workers, int) and n_workers > 0), f'n_workers must be a positive integer or None. Given {n_workers}.'
+        assert chunk_size is None or (isinstance(chunk_size, int) and chunk_size > 0), f'chunk_size must be a positive integer or None. Given {chunk_size}.'
+
+        if show_progress:
+            from tqdm import tqdm
+
+        max_subsimulations = max_subsimulations if max_subsimulations is not None else self._n_subsims
+        batch = batch if batch is not None else max(30, max_subsimulations // 100)
+        n_workers = n_workers if n_workers is not None else (os.cpu_count() or 1)
+        chunk_size = chunk_size if chunk_size is not None else (max(1, -(-batch // n_workers)) if backend != 'serial' else batch)
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+
+        executor = None
+        if backend == 'process':
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context(start_method))
+        elif backend == 'thread':
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=n_workers)
+
+        #the chunk results are kept until the number of subsimulations is known, and then collected as in run
+        chunk_results = []
+        observations = []
+        progress_bar = tqdm(total=max_subsimulations) if show_progress else None
+        caller_random_states = _get_global_random_states()
+        try:
+            n_run = 0
+            while n_run < max_subsimulations:
+                batch_indexes = list(range(n_run, min(n_run+batch, max_subsimulations)))
+                chunks = [batch_indexes[first:first+chunk_size] for first in range(0, len(batch_indexes), chunk_size)]
+                if executor is None:
+                    batch_results = [_run_subsim_chunk(self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, chunk, self._max_past, self._validate) for chunk in chunks]
+                else:
+                    batch_results = [future.result() for future in [executor.submit(_run_subsim_chunk, self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, chunk, self._max_past, self._validate) for chunk in chunks]]
+                for subsim_indexes, histories, final_states, chunk_stats in batch_results:
+                    values = np.asarray(histories[var_name], dtype=np.float64)
+                    observations.append(values[:, -1] if statistic == 'last' else _summarize_subsims(values)[statistic])
+                    chunk_results.append((subsim_indexes, histories, final_states) if self._keep_history else _fold_subsim_chunk(self._n_steps, self._entropy, subsim_indexes, histories, self._online_config, self._quantile_error))
+                n_run += len(batch_indexes)
+
+                all_observations = np.concatenate(observations)
+                estimate = float(np.mean(all_observations))
+                half_width = z * float(np.std(all_observations, ddof=1)) / np.sqrt(n_run) if n_run > 1 else np.inf
+                if progress_bar is not None:
+                    progress_bar.update(len(batch_indexes))
+                    progress_bar.set_postfix(estimate=estimate, half_width=half_width)
+                if half_width <= max(rel_tol * abs(estimate), abs_tol):
+                    break
+        finally:
+            _set_global_random_states(caller_random_states)
+            if executor is not None:
+                executor.shutdown()
+            if progress_bar is not None:
+                progress_bar.close()
+
+        self._n_subsims = n_run
+        self._allocate_results()
+        for chunk_result in chunk_results:
+            if self._keep_history:
+                self._collect_history_chunk(*chunk_result)
+            else:
+                self._collect_online_chunk(*chunk_result)
+        if self._keep_history and self._history_backend == 'memmap':
+            for result_name in self._results.keys():
+                if isinstance(self._results[result_name], np.memmap):
+                    self._results[result_name].flush()
+        return estimate, (estimate - half_width, estimate + half_width)
+
+    def iter_run(self, batch_subsims: Union[int, None] = None, batch_steps: Union[int, None] = None) -> Iterator[Tuple[List[int], range, Dict[str, np.ndarray]]]:
+        """Runs the subsimulations in batches, as a generator that yields the partial results after each batch.
+        The subsimulations are run in batches of batch_subsims, and the subsimulations of a batch are run together, batch_steps steps at a time. After each part, the generator yields a tuple (subsim_indexes, steps, histories), where histories is a dictionary {variable_name: array} with the read-only (len(subsim_indexes), len(steps)) block of the histories of each variable that has just been run.
+        When the last steps of a batch are run, the batch is folded into the statistics before the yield, so the statistics methods (e.g. get_variable_mean) can be called between two yields, and they are calculated over the completed subsimulations.
+        If the generator is closed before the end (e.g. by a break), the simulation becomes a simulation of the completed subsimulations (which becomes its n_subsimulations), as with run_until. The subsimulations of an incomplete batch are discarded.
+        Each subsimulation is seeded as in run, and the global random states of each subsimulation are saved and restored between its parts, so the outcomes are the same as the ones of run for any batch sizes. With keep_history=False and the default batch_subsims, the online accumulators are also the same; with other batch sizes, they can differ by rounding errors (and the quantile sketches by their rank error).
+        The subsimulations are run by the calling thread (as with the 'serial' backend). Step kernels (see subsim_step) run whole subsimulations, so they need batch_steps=None.
+
+        :param batch_subsims: Number of subsimulations per batch. If None, about 2^16 states per variable (the chunk_size of a serial run). Defaults to None.
+        :type batch_subsims: Union[int, None], optional
+        :param batch_steps: Number of steps run at once by the subsimulations of a batch. If None, n_steps (each batch yields once). Defaults to None.
+        :type batch_steps: Union[int, None], optional
+        :return: Generator of tuples in the format (subsim_indexes, steps, histories).
+        :rtype: Iterator[Tuple[List[int], range, Dict[str, np.ndarray]]]
+        """
+        assert isinstance(self._subsim_begin_function, Callable) or self._jit_step, 'Begin callback is not defined.'
+        assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+        assert self._jit_step or not self._jit_begin, 'A beginning kernel needs a step kernel.'
+        assert not self._jit_step or self._subsim_begin_function is None or self._jit_begin, 'A step kernel needs a beginning kernel (jit=True) or no beginning callback.'
+        assert batch_subsims is None or (isinstance(batch_subsims, int) and batch_subsims > 0), f'batch_subsims must be a positive integer or None. Given {batch_subsims}.'
+        assert batch_steps is None or (isinstance(batch_steps, int) and batch_steps > 0), f'batch_steps must be a positive integer or None. Given {batch_steps}.'
+        assert not self._jit_step or batch_steps is None, 'Step kernels run whole subsimulations, so they need batch_steps=None.'
+
+        batch_subsims = batch_subsims if batch_subsims is not None else max(1, min(self._n_subsims, 2**16 // self._n_steps))
+        batch_steps = min(batch_steps, self._n_steps) if batch_steps is not None else self._n_steps
+        #the subsimulations of a batch are run in parts only if a part has fewer steps than a subsimulation
+        in_parts = not self._jit_step and batch_steps < self._n_steps
+
+        self._stats = None
+        self._allocate_results()
+        self._n_partial_subsims = 0
+        try:
+            if self._jit_step:
+                self._subsim_envs = None
+            for first in range(0, self._n_subsims, batch_subsims):
+                subsim_indexes = list(range(first, min(first+batch_subsims, self._n_subsims)))
+                if self._keep_history:
+                    #the subsimulations write their histories directly into the rows of the result matrices
+                    histories = {var_name: self._results[var_name][first:first+len(subsim_indexes)] for var_name in self._results.keys()}
+                else:
+                    histories = {var_name: np.empty((len(subsim_indexes), self._n_steps), dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in self._variables}
+
+                if self._jit_step:
+                    kernel_histories = _run_kernels(self._variables, self._get_begin_kernel(), self._subsim_step_function, self._n_steps, self._entropy, subsim_indexes)
+                    for var_name in histories.keys():
+                        histories[var_name][:] = kernel_histories[var_name]
+                    envs = None
+                elif not in_parts:
+                    envs = []
+                    caller_random_states = _get_global_random_states()
+                    try:
+                        for k, subsim_index in enumerate(subsim_indexes):
+                            envs.append(_run_subsim(self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, subsim_index, {var_name: histories[var_name][k] for var_name in histories.keys()}, self._max_past, self._validate))
+                            _store_history(envs[k], histories, k, self._n_steps)
+                    finally:
+                        _set_global_random_states(caller_random_states)
+                else:
+                    envs, random_states = self._start_subsims(subsim_indexes, histories)
+
+                for first_step in range(0, self._n_steps, batch_steps):
+                    steps = range(first_step, min(first_step+batch_steps, self._n_steps))
+                    if in_parts:
+                        self._run_subsim_steps(envs, random_states, steps)
+                    if steps.stop == self._n_steps:
+                        if in_parts:
+                            for k, env in enumerate(envs):
+                                _store_history(env, histories, k, self._n_steps)
+                        if self._keep_history:
+                            #histories that fell back to object are copies, which are written into the (promoted) result matrices
+                            self._write_result_rows(subsim_indexes, histories)
+                        self._complete_batch(subsim_indexes, histories, envs)
+                    blocks = dict()
+                    for var_name in histories.keys():
+                        blocks[var_name] = histories[var_name][:, steps.start:steps.stop].view()
+                        blocks[var_name].flags.writeable = False
+                    yield subsim_indexes, steps, blocks
+
+            if self._keep_history and self._history_backend == 'memmap':
+                for var_name in self._results.keys():
+                    if isinstance(self._results[var_name], np.memmap):
+                        self._results[var_name].flush()
+        finally:
+            if self._n_partial_subsims < self._n_subsims:
+                self._truncate_results(self._n_partial_subsims)
+            self._n_partial_subsims = None
+
+    def _start_subsims(self, subsim_indexes: List[int], histories: Dict[str, np.ndarray]) -> Tuple[List[SubSimulationEnv], List[Tuple[Any, Any]]]:
+        """Internal method.
+        Builds the environments of a batch of subsimulations that are run in parts (see iter_run), whose histories are written into the rows of 'histories', and returns them with the global random states of each subsimulation.
+        The global random states of the caller are restored afterwards.
+        """
+        envs = []
+        random_states = []
+        caller_random_states = _get_global_random_states()
+        try:
+            for k, subsim_index in enumerate(subsim_indexes):
+                _seed_subsim(self._entropy, subsim_index)
+                env = SubSimulationEnv(self._variables, self._subsim_begin_function, self._subsim_step_function, self._max_past, validate=self._validate, rng=_get_subsim_rng(self._entropy, subsim_index))
+                env._attach_history({var_name: histories[var_name][k] for var_name in histories.keys()})
+                envs.append(env)
+                random_states.append(_get_global_random_states())
+        finally:
+            _set_global_random_states(caller_random_states)
+        return envs, random_states
+
+    def _run_subsim_steps(self, envs: List[SubSimulationEnv], random_states: List[Tuple[Any, Any]], steps: range):
+        """Internal method.
+        Runs a range of steps of each subsimulation of a batch, with its own global random states, which are saved for its next part.
+        The global random states of the caller are restored afterwards.
+        """
+        caller_random_states = _get_global_random_states()
+        try:
+            for k, env in enumerate(envs):
+                _set_global_random_states(random_states[k])
+                env._run_step_range(steps.start, steps.stop)
+                random_states[k] = _get_global_random_states()
+        finally:
+            _set_global_random_states(caller_random_states)
+
+    def _complete_batch(self, subsim_indexes: List[int], histories: Dict[str, np.ndarray], envs: Union[List[SubSimulationEnv], None]):
+        """Internal method.
+        Folds a completed batch of iter_run into the statistics and keeps the environments of its subsimulations.
+        """
+        if self._subsim_envs is not None and envs is not None:
+            for subsim_index, env in zip(subsim_indexes, envs):
+                self._subsim_envs[subsim_index] = env
+        if self._keep_history:
+            #the batches are completed in order, so each one is folded at once
+            self._fold_completed_subsims(subsim_indexes, len(subsim_indexes))
+        else:
+            self._collect_online_chunk(*_fold_subsim_chunk(self._n_steps, self._entropy, subsim_indexes, histories, self._online_config, self._quantile_error))
+        self._n_partial_subsims = subsim_indexes[-1] + 1
+
+    def _truncate_results(self, n_subsims: int):
+        """Internal method.
+        Makes the simulation a simulation of its first n_subsims subsimulations, whose results are complete. If n_subsims is 0, the simulation is left as not run.
+        """
+        if n_subsims == 0:
+            self._results = None
+            self._subsim_envs = None
+            self._online_stats = None
+            self._subsim_summaries = None
+            return
+        self._n_subsims = n_subsims
+        if self._results is not None:
+            self._results = {var_name: result[:n_subsims] for var_name, result in self._results.items()}
+        if self._subsim_envs is not None:
+            self._subsim_envs = self._subsim_envs[:n_subsims]
+        if self._subsim_summaries is not None:
+            self._subsim_summaries = {var_name: {statistic: summary[:n_subsims] for statistic, summary in summaries.items()} for var_name, summaries in self._subsim_summaries.items()}
+        self._completed_subsims = self._completed_subsims[:n_subsims]
+
+    async def arun(self, batch_subsims: Union[int, None] = None, batch_steps: Union[int, None] = None, batch_hook: Union[Callable[[List[int], range, Dict[str, np.ndarray]], None], None] = None):
+        """Coroutine that runs all the subsimulations as iter_run, giving control back to the event loop after each batch, so the simulation can run inside an asyncio application.
+        The event loop is blocked while a batch runs, so smaller batches make it more responsive.
+
+        :param batch_subsims: Number of subsimulations per batch (see iter_run). Defaults to None.
+        :type batch_subsims: Union[int, None], optional
+        :param batch_steps: Number of steps run at once by the subsimulations of a batch (see iter_run). Defaults to None.
+        :type batch_steps: Union[int, None], optional
+        :param batch_hook: Function called with the (subsim_indexes, steps, histories) tuple of each batch (see iter_run). If it is a coroutine function, it is awaited. Defaults to None.
+        :type batch_hook: Union[Callable[[List[int], range, Dict[str, np.ndarray]], None], None], optional
+        """
+        assert batch_hook is None or isinstance(batch_hook, Callable), 'batch_hook must be a function or None.'
+        for batch in self.iter_run(batch_subsims, batch_steps):
+            if batch_hook is not None:
+                result = batch_hook(*batch)
+                if asyncio.iscoroutine(result):
+                    await result
+            await asyncio.sleep(0)
+
+    def _collect_history_chunk(self, subsim_indexes: List[int], histories: Dict[str, np.ndarray], final_states: List[Dict[str, Any]]):
+        """Internal method.
+        Copies the histories of a chunk of subsimulations run by a worker into the result matrices, and builds their SubSimulationEnv objects.
+        """
+        self._write_result_rows(subsim_indexes, histories)
+        self._fold_completed_subsims(subsim_indexes)
+        if self._subsim_envs is None:
+            return
+        for subsim_index, var_states in zip(subsim_indexes, final_states):
+            env = SubSimulationEnv(self._variables, self._subsim_begin_function, self._subsim_step_function, self._max_past, validate=self._validate)
+            env._attach_history({var_name: self._results[var_name][subsim_index] for var_name in self._results.keys()}, self._n_steps, var_states)
+            self._subsim_envs[subsim_index] = env
+
+    def _write_result_rows(self, subsim_indexes: List[int], histories: Dict[str, np.ndarray]):
+        """Internal method.
+        Copies the histories of subsimulations into their rows of the result matrices. A typed result matrix is promoted to an object matrix (in memory) when the histories of its variable fell back to object.
+        """
+        for var_name in self._results.keys():
+            if np.may_share_memory(histories[var_name], self._results[var_name]):
+                continue
+            if histories[var_name].dtype == object and self._results[var_name].dtype != object:
+                self._results[var_name] = np.array(self._results[var_name], dtype=object)
+            self._results[var_name][subsim_indexes] = histories[var_name]
+
+    def _fold_completed_subsims(self, subsim_indexes: List[int], block_size: Union[int, None] = None):
+        """Internal method.
+        Marks subsimulations (whose histories are in the result matrices) as completed, and folds every block of consecutive completed subsimulations into the online accumulators (and, with the memmap backend, into the per-subsimulation summaries).
+        The statistics are thus accumulated during the run, while the histories are still in the cache, instead of by a pass over the result matrices after it.
+        The blocks are always folded in the order of the subsimulation indexes, so the accumulators do not depend on the backend or on the completion order.
+        The blocks have 'block_size' subsimulations, or about _memmap_block_values values if it is None.
+        """
+        if len(self._online_stats) == 0:
+            return
+        self._completed_subsims[subsim_indexes] = True
+        block_size = block_size if block_size is not None else max(1, _memmap_block_values // self._n_steps)
+        while self._n_folded_subsims < self._n_subsims:
+            block = slice(self._n_folded_subsims, min(self._n_folded_subsims+block_size, self._n_subsims))
+            if not np.all(self._completed_subsims[block]):
+                break
+            for var_name in self._online_stats.keys():
+                values = np.asarray(self._results[var_name][block])
+                self._online_stats[var_name].update(values)
+                if self._subsim_summaries is not None:
+                    for statistic, summary in _summarize_subsims(values).items():
+                        self._subsim_summaries[var_name][statistic][block] = summary
+            self._n_folded_subsims = block.stop
+
+    def _collect_online_chunk(self, subsim_indexes: List[int], online_stats: Dict[str, OnlineStatistics], subsim_summaries: Dict[str, Dict[str, np.ndarray]]):
+        """Internal method.
+        Merges the online accumulators and the per-subsimulation summaries of a chunk of subsimulations.
+        """
+        for var_name in self._online_stats.keys():
+            self._online_stats[var_name].merge(online_stats[var_name])
+            for statistic in self._subsim_summaries[var_name].keys():
+                self._subsim_summaries[var_name][statistic][subsim_indexes] = subsim_summaries[var_name][statistic]
+
+    def _get_variable(self, var_name: str) -> Tuple[Union[str, None], Union[type, None], Any]:
+        """Internal method.
+        Returns the (variable_name, variable_type, default_value) tuple of a variable, or (None, None, None) if it does not exist.
+        """
+        i = self._var_indexes.get(var_name)
+        return self._variables[i] if i is not None else (None, None, None)
+
+    def get_online_statistics(self, var_name: str) -> OnlineStatistics:
+        """Returns the online accumulators of a variable, which can be merged with the ones of other runs.
+
+        :param var_name: Variable name.
+        :type var_name: str
+        :return: OnlineStatistics object.
+        :rtype: OnlineStatistics
+        """
+        assert isinstance(var_name, str), 'var_name must be string.'
+        assert self._online_stats is not None, 'The simulation has not been run yet.'
+        assert var_name in self._online_stats.keys(), f'Variable {var_name} has no online accumulators.'
+        return self._online_stats[var_name]
+
     def get_subsim_env(self, subsim_index: int) -> SubSimulationEnv:
         """Returns the SubSimulationEnv for a specific subsimulation.
 
@@ -114,8 +976,68 @@ class MonteCarloSimulationEnv():
         :rtype: SubSimulationEnv
         """
         assert subsim_index < self._n_subsims, f'subsim_index must be less than the number of subsimulations.'
+        assert self._keep_history, 'Subsimulation environments are not kept when keep_history=False.'
+        if self._subsim_envs is None:
+            #the environments are not kept by the memmap backend and by the step kernels, so it is rebuilt from the result matrices
+            env = SubSimulationEnv(self._variables, self._subsim_begin_function if not self._jit_step else self._get_begin_kernel(), self._subsim_step_function, self._max_past, validate=self._validate)
+            env._attach_history({var_name: self._results[var_name][subsim_index] for var_name in self._results.keys()}, self._n_steps, {var_name: _to_python_scalar(self._results[var_name][subsim_index, -1]) for var_name in self._results.keys()})
+            return env
         return self._subsim_envs[subsim_index]
 
+    def replay_subsim(self, subsim_index: int) -> SubSimulationEnv:
+        """Runs again a single subsimulation, with the same seeds as in the run, and returns its SubSimulationEnv (with the history and the auxiliary objects).
+        Only that subsimulation is run, so it is a cheap way of inspecting a subsimulation when keep_history=False or when the auxiliary objects were lost by the 'process' backend.
+        The outcomes are the same as in the run, unless the callbacks depend on something other than the seeded generators (context.rng, and the global random and numpy.random states).
+
+        :param subsim_index: subsimulation index (starting at 0).
+        :type subsim_index: int
+        :return: SubSimulationEnv object.
+        :rtype: SubSimulationEnv
+        """
+        assert isinstance(self._subsim_begin_function, Callable) or self._jit_step, 'Begin callback is not defined.'
+        assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+        assert isinstance(subsim_index, int) and 0 <= subsim_index < self._n_subsims, f'subsim_index must be an integer in [0, {self._n_subsims}). Given {subsim_index}.'
+        if self._jit_step:
+            #step kernels have no auxiliary objects, so only the history is given back
+            histories = _run_kernels(self._variables, self._get_begin_kernel(), self._subsim_step_function, self._n_steps, self._entropy, [subsim_index])
+            env = SubSimulationEnv(self._variables, self._get_begin_kernel(), self._subsim_step_function, self._max_past, validate=self._validate)
+            env._attach_history({var_name: histories[var_name][0] for var_name in histories.keys()}, self._n_steps, {var_name: _to_python_scalar(histories[var_name][0, -1]) for var_name in histories.keys()})
+            return env
+        columns = {var_name: np.empty(self._n_steps, dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in self._variables}
+        caller_random_states = _get_global_random_states()
+        try:
+            return _run_subsim(self._variables, self._subsim_begin_function, self._subsim_step_function, self._n_steps, self._entropy, subsim_index, columns, self._max_past, self._validate)
+        finally:
+            _set_global_random_states(caller_random_states)
+
+    def _get_history_matrix(self, var_name: str) -> np.ndarray:
+        """Internal method.
+        Returns the result matrix of a variable, whose 0-axis indexes the subsimulations and 1-axis indexes the steps. No copy is made.
+        """
+        assert self._keep_history, 'Histories are not stored when keep_history=False.'
+        assert self._results is not None, 'The simulation has not been run yet.'
+        return self._results[var_name] if self._n_partial_subsims is None else self._results[var_name][:self._n_partial_subsims]
+
+    def _has_sketch(self, var_name: str) -> bool:
+        """Internal method.
+        Checks if the online accumulators of a variable have a quantile sketch.
+        """
+        return self._online_stats is not None and var_name in self._online_stats.keys() and self._online_stats[var_name].sketch is not None
+
+    def _get_online_statistic(self, var_name: str, statistic: str, domain: Union[str, None]) -> Union[np.ndarray, float]:
+        """Internal method.
+        Returns a statistic ('mean', 'var', 'std', 'min', 'max' or 'sum') of a variable from its online accumulators.
+        """
+        assert self._online_stats is not None, 'The simulation has not been run yet.'
+        assert var_name in self._online_stats.keys(), f'Variable {var_name} has no online accumulators.'
+        if domain == 'step':
+            return getattr(self._online_stats[var_name], statistic)
+        elif domain == 'subsim':
+            summaries = {statistic: summary[:self._n_partial_subsims] for statistic, summary in self._subsim_summaries[var_name].items()}
+            return np.sqrt(summaries['var']) if statistic == 'std' else summaries[statistic].copy()
+        else:
+            return self._online_stats[var_name].overall(statistic)
+
     def get_variable_mean(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
         """
         Calculates the mean of a variable. 
@@ -130,11 +1052,14 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'mean', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.mean(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.mean(hist).astype(np.float)
 
     def get_variable_median(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
@@ -151,13 +1076,65 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._has_sketch(var_name) or self._history_backend == 'memmap':
+            return self.get_variable_quantiles(var_name, 0.5, domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.median(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.median(hist).astype(np.float)
 
+    def get_variable_quantiles(self, var_name: str, qs: Union[float, Sequence[float]], domain: str = 'step') -> Union[np.ndarray, np.float64]:
+        """
+        Calculates quantiles of a variable.
+        If the simulation keeps quantile sketches (quantile_error argument), the quantiles of the 'step' and None domains are approximated from them, so the histories are not needed. Otherwise, they are calculated exactly from the histories.
+        The 0-axis indexes are the quantiles (absent if 'qs' is a scalar) and the 1-axis indexes are the domain values (step indexes or subsim indexes).
+
+        :param var_name: Variable name.
+        :type var_name: str
+        :param qs: Quantile or sequence of quantiles, in the interval [0, 1].
+        :type qs: Union[float, Sequence[float]]
+        :param domain: If domain='step', quantiles for each step are calculated; if domain='subsim', quantiles for each subsimulation are calculated, and if domain=None, the overall quantiles are calculated, defaults to 'step'
+        :type domain: str, optional
+        :return: An array with quantiles for each domain value (step or subsim), or the overall quantiles.
+        :rtype: Union[np.ndarray, np.float64]
+        """
+        assert isinstance(var_name, str), 'var_name must be string.'
+        assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
+        found_name, found_type, found_default = self._get_variable(var_name)
+        assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
+        assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
+        assert np.ndim(qs) <= 1 and np.all((np.asarray(qs) >= 0) & (np.asarray(qs) <= 1)), 'qs must be a float or a sequence of floats in the interval [0, 1].'
+
+        if self._has_sketch(var_name) and domain != 'subsim':
+            sketch = self._online_stats[var_name].sketch
+            return sketch.quantiles(qs).astype(np.float64) if domain == 'step' else np.asarray(sketch.overall_quantiles(qs)).astype(np.float64)
+        assert self._keep_history, f'Quantiles of the {domain} domain need the histories or, except for domain=\'subsim\', quantile sketches (quantile_error argument).'
+
+        hist = self._get_history_matrix(var_name)
+        if self._history_backend == 'memmap':
+            return self._get_memmap_quantiles(hist, qs, domain)
+        return np.quantile(_get_quantile_values(hist), qs, axis=(0 if domain == 'step' else 1)).astype(np.float64) if domain != None else np.quantile(_get_quantile_values(hist), qs).astype(np.float64)
+
+    def _get_memmap_quantiles(self, hist: np.ndarray, qs: Union[float, Sequence[float]], domain: str) -> np.ndarray:
+        """Internal method.
+        Calculates exact quantiles of each step (blocks of columns) or each subsimulation (blocks of rows) of a memory-mapped result matrix.
+        The overall quantiles (domain=None) are selected from blocks of rows, so the whole matrix is never loaded at once.
+        """
+        if domain == None:
+            block_size = max(1, _memmap_block_values // self._n_steps)
+            get_blocks = lambda: (np.asarray(hist[first:first+block_size], dtype=np.float64).ravel() for first in range(0, hist.shape[0], block_size))
+            return _get_blocked_quantiles(get_blocks, hist.size, qs)
+        if domain == 'step':
+            block_size = max(1, _memmap_block_values // self._n_subsims)
+            blocks = [np.quantile(np.asarray(hist[:, first:first+block_size], dtype=np.float64), qs, axis=0) for first in range(0, self._n_steps, block_size)]
+        else:
+            block_size = max(1, _memmap_block_values // self._n_steps)
+            blocks = [np.quantile(np.asarray(hist[first:first+block_size], dtype=np.float64), qs, axis=1) for first in range(0, hist.shape[0], block_size)]
+        return np.concatenate(blocks, axis=-1).astype(np.float64)
+
     def get_variable_var(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
         """
         Calculates the variance of a variable. 
@@ -172,11 +1149,14 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'var', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.var(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.var(hist).astype(np.float)
 
     def get_variable_std(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
@@ -193,11 +1173,14 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'std', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.std(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.std(hist).astype(np.float)
 
     def get_variable_min(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
@@ -214,11 +1197,14 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'min', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.min(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.min(hist).astype(np.float)
 
     def get_variable_max(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
@@ -235,11 +1221,14 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'max', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.max(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.max(hist).astype(np.float)
 
     def get_variable_sum(self, var_name: str, domain: str = 'step') -> Union[np.ndarray, np.float]:
@@ -256,47 +1245,170 @@ class MonteCarloSimulationEnv():
         """
         assert isinstance(var_name, str), 'var_name must be string.'
         assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
+        if not self._keep_history or self._history_backend == 'memmap':
+            return self._get_online_statistic(var_name, 'sum', domain)
+
+        hist = self._get_history_matrix(var_name)
         return np.sum(hist, axis=(0 if domain == 'step' else 1)).astype(np.float) if domain != None else np.sum(hist).astype(np.float)
 
-    def get_variable_histogram(self, var_name: str, n_bins: int, density: bool = False, _range: Union[Tuple[float, float], None] = None) -> np.ndarray:
+    def describe(self, var_names: Union[List[str], None] = None, stats: Sequence[str] = ('mean', 'std', 'min', 'max', 'p50'), domain: str = 'step', as_dataframe: bool = False) -> Union[Dict[str, Dict[str, Union[np.ndarray, float]]], DataFrame]:
+        """Calculates several statistics of several variables at once.
+        The moments, extrema and sums of each variable come from a single sweep over blocks of steps of its history, which are converted to float one at a time, and all the requested quantiles come from a single partition of it, instead of one pass over the data per statistic.
+        Without stored histories (keep_history=False or the memmap backend), the statistics are taken from the online accumulators.
+
+        :param var_names: Names of int, float or bool variables. If None, all of them. Defaults to None.
+        :type var_names: Union[List[str], None], optional
+        :param stats: Statistics among 'mean', 'var', 'std', 'min', 'max', 'sum', 'median' and 'pXX', where XX is a percentile (e.g. 'p5', 'p50' or 'p99.9'). Defaults to ('mean', 'std', 'min', 'max', 'p50').
+        :type stats: Sequence[str], optional
+        :param domain: If domain='step', the statistics of each step are calculated; if domain='subsim', the ones of each subsimulation, and if domain=None, the overall ones. Defaults to 'step'.
+        :type domain: str, optional
+        :param as_dataframe: If True, a DataFrame is returned. Its columns are named 'variable_statistic' and its rows are the domain values, or, for domain=None, its rows are the variables and its columns are the statistics. Defaults to False.
+        :type as_dataframe: bool, optional
+        :return: Dictionary in the format {variable_name: {statistic: values}}, or DataFrame.
+        :rtype: Union[Dict[str, Dict[str, Union[np.ndarray, float]]], DataFrame]
+        """
+        assert domain in ('step', 'subsim', None), 'domain must be \'step\', \'subsim\' or None.'
+        var_names = var_names if var_names is not None else [var_name for var_name, var_type, var_default in self._variables if var_type in (float, int, bool)]
+        assert all([self._get_variable(var_name)[1] in (float, int, bool) for var_name in var_names]), 'All the variables must exist and be of type int, float or bool.'
+        assert all([statistic in ('mean', 'var', 'std', 'min', 'max', 'sum') or _get_describe_quantile(statistic) is not None for statistic in stats]), 'Statistics must be \'mean\', \'var\', \'std\', \'min\', \'max\', \'sum\', \'median\' or \'pXX\' (a percentile between 0 and 100).'
+        quantile_stats = [statistic for statistic in stats if _get_describe_quantile(statistic) is not None]
+        axis = {'step': 0, 'subsim': 1, None: None}[domain]
+
+        description = dict()
+        for var_name in var_names:
+            var_description = dict()
+            if not self._keep_history or self._history_backend == 'memmap':
+                for statistic in stats:
+                    if statistic not in quantile_stats:
+                        var_description[statistic] = self._get_online_statistic(var_name, statistic, domain)
+                if len(quantile_stats) > 0:
+                    quantiles = self.get_variable_quantiles(var_name, [_get_describe_quantile(statistic) for statistic in quantile_stats], domain)
+                    var_description.update({statistic: quantiles[k] for k, statistic in enumerate(quantile_stats)})
+            else:
+                hist = self._get_history_matrix(var_name)
+                #all the quantiles come from a single partition of the values
+                quantiles = np.quantile(_get_quantile_values(hist), [_get_describe_quantile(statistic) for statistic in quantile_stats], axis=axis) if len(quantile_stats) > 0 else None
+                moments = self._get_blocked_moments(hist, domain) if len(quantile_stats) < len(stats) else None
+                for statistic in stats:
+                    if statistic in ('mean', 'var', 'std', 'min', 'max', 'sum'):
+                        var_description[statistic] = moments[statistic]
+                    else:
+                        var_description[statistic] = quantiles[quantile_stats.index(statistic)]
+            description[var_name] = {statistic: (float(value) if domain is None else np.asarray(value, dtype=np.float64)) for statistic, value in var_description.items()}
+
+        if not as_dataframe:
+            return description
+        if domain is None:
+            return DataFrame.from_dict(description, orient='index', columns=list(stats))
+        return DataFrame({f'{var_name}_{statistic}': description[var_name][statistic] for var_name in var_names for statistic in stats})
+
+    def _get_blocked_moments(self, hist: np.ndarray, domain: str) -> Dict[str, Union[np.ndarray, float]]:
+        """Internal method.
+        Calculates the mean, variance, standard deviation, minimum, maximum and sum of a result matrix in a single sweep over blocks of steps (columns), converting only a block to float at once.
+        The statistics of each step are the ones of its block, and the ones of each subsimulation (or the overall ones) are folded block by block into an accumulator with a "step" per subsimulation.
+        """
+        block_size = max(1, _memmap_block_values // self._n_subsims)
+        if domain == 'step':
+            parts = []
+            for first in range(0, self._n_steps, block_size):
+                part = OnlineStatistics(min(block_size, self._n_steps - first))
+                part.update(hist[:, first:first+block_size])
+                parts.append(part)
+            return {statistic: np.concatenate([getattr(part, statistic) for part in parts]) for statistic in ('mean', 'var', 'std', 'min', 'max', 'sum')}
+        accumulator = OnlineStatistics(self._n_subsims)
+        for first in range(0, self._n_steps, block_size):
+            accumulator.update(np.asarray(hist[:, first:first+block_size], dtype=np.float64).T)
+        if domain == 'subsim':
+            return {statistic: getattr(accumulator, statistic) for statistic in ('mean', 'var', 'std', 'min', 'max', 'sum')}
+        return {statistic: accumulator.overall(statistic) for statistic in ('mean', 'var', 'std', 'min', 'max', 'sum')}
+
+    def _get_online_histogram_config(self, var_name: str, n_bins: Union[int, None], _range: Union[Tuple[float, float], None], bins: Union[str, Sequence[float], None]) -> Union[Tuple, None]:
+        """Internal method.
+        Returns the configuration of the online histogram of a variable if it matches the requested bins (None matches anything), or None otherwise.
+        """
+        histogram_config = self._online_config.get(var_name)
+        if histogram_config is None or self._online_stats is None:
+            return None
+        config_bins = histogram_config[2] if len(histogram_config) == 3 else 'linear'
+        if bins is not None and not isinstance(bins, str):
+            return histogram_config if isinstance(config_bins, tuple) and config_bins == tuple(float(edge) for edge in bins) else None
+        if bins is not None and bins != config_bins:
+            return None
+        if n_bins is not None and n_bins != histogram_config[0]:
+            return None
+        if _range is not None and (float(_range[0]), float(_range[1])) != histogram_config[1]:
+            return None
+        return histogram_config
+
+    def get_variable_histogram(self, var_name: str, n_bins: Union[int, None] = None, density: bool = False, _range: Union[Tuple[float, float], None] = None, bins: Union[str, Sequence[float], None] = None, return_edges: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
         """Returns an array with a histogram of the variable for each step of the simulation.
-        The 0-axis indexes are the domain values (step indexes or subsim indexes).
+        The 0-axis indexes are the steps and the 1-axis indexes are the bins.
+        The histograms of all the steps are calculated at once, by binning all the values and counting them with a single np.bincount over the flattened (step, bin) indexes.
+        If the variable has an online histogram (see the online_histograms argument of the constructor) with the requested bins, it is returned without going through the histories.
 
         :param var_name: Variable name.
         :type var_name: str
-        :param n_bins: Number of bins per histogram.
-        :type n_bins: int
+        :param n_bins: Number of bins per histogram. It can be None only if bins is a sequence of edges or if the variable has an online histogram. Defaults to None.
+        :type n_bins: Union[int, None], optional
         :param density: Set to true so histograms are density instead of counts. defaults to False
         :type density: bool, optional
         :param _range: defines manually the range (min, max) of the histogram. Default to None.
         :type _range: Union[Tuple[float, float], None], optional
-        :return: Array of histograms.
-        :rtype: np.ndarray
+        :param bins: 'linear' for equal-width bins, 'log' for log-spaced bins (the range must then be positive), or a sequence with the bin edges (n_bins and _range are then taken from it). If None, 'linear' (or the bins of the online histogram). Defaults to None.
+        :type bins: Union[str, Sequence[float], None], optional
+        :param return_edges: If True, the bin edges are also returned. Defaults to False.
+        :type return_edges: bool, optional
+        :return: Array of histograms, or tuple in the format (histograms, bin_edges) if return_edges=True.
+        :rtype: Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
         """
         assert isinstance(var_name, str), 'var_name must be string.'
-        assert isinstance(n_bins, int), 'n_bins must be int.'
-        assert n_bins >= 1, 'n_bins must be greater than 0.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        assert n_bins is None or isinstance(n_bins, int), 'n_bins must be int.'
+        assert n_bins is None or n_bins >= 1, 'n_bins must be greater than 0.'
+        assert bins is None or not isinstance(bins, str) or bins in ('linear', 'log'), f'bins must be \'linear\', \'log\', a sequence of bin edges or None. Given {bins}.'
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         assert found_type in (float, int, bool), 'Variable type must be int, float or bool.'
-    
-        vhistories = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
-        vhistories = np.array(vhistories)
-        
-        vmax = np.max(vhistories) if _range == None else _range[1]
-        vmin = np.min(vhistories) if _range == None else _range[0]
 
-        vhistogram = [np.histogram(vhistories[:,i], bins=n_bins, range=(vmin, vmax), density=density)[0]  for i in range(vhistories.shape[1])]
-        return np.array(vhistogram).astype(np.float)
+        histogram_config = self._get_online_histogram_config(var_name, n_bins, _range, bins)
+        if histogram_config is not None:
+            vhistogram = self._online_stats[var_name].histogram.astype(np.float64)
+            edges = _get_histogram_edges(*histogram_config)
+        else:
+            assert self._keep_history, f'Histograms are not stored when keep_history=False, and no online histogram of {var_name} matches the requested bins (online histogram: {self._online_config.get(var_name)}).'
+            vhistories = self._get_history_matrix(var_name)
+            if bins is not None and not isinstance(bins, str):
+                histogram_config = _get_histogram_config(bins)
+                assert n_bins is None or n_bins == histogram_config[0], 'n_bins must match the number of given bins.'
+            else:
+                assert n_bins is not None, f'n_bins must be given, since {var_name} has no online histogram.'
+                if _range is None:
+                    if self._online_stats is not None and var_name in self._online_stats:
+                        vmin, vmax = self._online_stats[var_name].overall('min'), self._online_stats[var_name].overall('max')
+                    else:
+                        vmin, vmax = float(np.min(vhistories)), float(np.max(vhistories))
+                    if vmin == vmax:
+                        #same empty-range rule as np.histogram
+                        vmin, vmax = vmin - 0.5, vmax + 0.5
+                else:
+                    vmin, vmax = _range
+                histogram_config = _get_histogram_config((n_bins, (vmin, vmax), bins if bins is not None else 'linear'))
+            #the counts are calculated in blocks of subsimulations, so the flattened indexes of only a block are in memory at once
+            block_size = max(1, _memmap_block_values // self._n_steps)
+            vhistogram = sum([_histogram_counts(vhistories[first:first+block_size], *histogram_config) for first in range(0, vhistories.shape[0], block_size)]).astype(np.float64)
+            edges = _get_histogram_edges(*histogram_config)
+
+        if density:
+            vhistogram /= np.sum(vhistogram, axis=1, keepdims=True) * np.diff(edges)[None, :]
+        return (vhistogram, edges) if return_edges else vhistogram
 
     def get_variable_histories(self, var_name: str) -> np.ndarray:
         """Returns an array with all the outcomes that a variable had throughout the simulation. 
         The 0-axis indices are the subsimulations and the 1-axis indices are the steps.
+        For float variables, the array is a read-only view of the result matrix, so no copy is made. With the memmap history backend, the array is always a read-only view of the memory-mapped matrix, with the dtype of the variable.
 
         :param var_name: Variable name.
         :type var_name: str
@@ -304,8 +1416,74 @@ class MonteCarloSimulationEnv():
         :rtype: np.ndarray
         """
         assert isinstance(var_name, str), 'var_name must be string.'
-        found_name, found_type, found_default = _first_or_default(self._variables, lambda t: t[0]==var_name, (None, None, None))
+        found_name, found_type, found_default = self._get_variable(var_name)
         assert isinstance(found_name, str), f'Variable {var_name} does not exists.'
         
-        hist = [self._subsim_envs[i].get_variable_numpy_history(var_name) for i in range(self._n_subsims)]
-        return np.array(hist).astype(np.float)
+        if self._history_backend == 'memmap':
+            #the memory-mapped matrix is not converted to float, since it may not fit in memory
+            hist = self._get_history_matrix(var_name).view()
+            hist.flags.writeable = False
+            return hist
+
+        hist = self._get_history_matrix(var_name).astype(np.float64, copy=False)
+        if np.may_share_memory(hist, self._get_history_matrix(var_name)):
+            hist = hist.view()
+            hist.flags.writeable = False
+        return hist
+
+    def _get_export_results(self) -> Tuple[Dict[str, np.ndarray], Dict[str, type]]:
+        """Internal method.
+        Returns the result matrices and the variable types, for the export methods.
+        """
+        assert self._keep_history, 'Histories are not stored when keep_history=False.'
+        assert self._results is not None, 'The simulation has not been run yet.'
+        return self._results, {var_name: var_type for var_name, var_type, var_default in self._variables}
+
+    def to_arrow(self, var_names: Union[List[str], None] = None, layout: str = 'wide', rows_per_block: Union[int, None] = None) -> 'pyarrow.Table':
+        """Returns the histories of all subsimulations as a pyarrow Table, built from the result matrices in a single vectorized pass (one record batch per block of subsimulations).
+        In the wide layout, the columns are 'subsim', 'step' and one column per variable, so variables named 'subsim' or 'step' are not accepted, nor int variables with states out of the int64 range. In the long layout, the columns are 'subsim', 'step', 'variable' (dictionary-encoded) and 'value' (float), and only int, float and bool variables are accepted.
+        Requires pyarrow.
+
+        :param var_names: Names of the exported variables. If None, all variables are exported. Defaults to None.
+        :type var_names: Union[List[str], None], optional
+        :param layout: 'wide' or 'long'. Defaults to 'wide'.
+        :type layout: str, optional
+        :param rows_per_block: Approximate number of rows of each record batch. If None, about 2^20. Defaults to None.
+        :type rows_per_block: Union[int, None], optional
+        :return: pyarrow Table.
+        :rtype: pyarrow.Table
+        """
+        results, var_types = self._get_export_results()
+        return _to_arrow_table(results, var_types, var_names, layout, rows_per_block)
+
+    def to_parquet(self, path: str, var_names: Union[List[str], None] = None, layout: str = 'wide', rows_per_block: Union[int, None] = None, compression: str = 'snappy'):
+        """Writes the histories of all subsimulations to a Parquet file, one row group per block of subsimulations, so that only a block is in memory at once (see to_arrow for the layouts).
+        Requires pyarrow.
+
+        :param path: Path of the Parquet file.
+        :type path: str
+        :param var_names: Names of the exported variables. If None, all variables are exported. Defaults to None.
+        :type var_names: Union[List[str], None], optional
+        :param layout: 'wide' or 'long'. Defaults to 'wide'.
+        :type layout: str, optional
+        :param rows_per_block: Approximate number of rows of each row group. If None, about 2^20. Defaults to None.
+        :type rows_per_block: Union[int, None], optional
+        :param compression: Parquet compression codec. Defaults to 'snappy'.
+        :type compression: str, optional
+        """
+        assert isinstance(path, str), f'path must be a string. Given {type(path)}.'
+        results, var_types = self._get_export_results()
+        _write_parquet(path, results, var_types, var_names, layout, rows_per_block, compression)
+
+    def to_npz(self, path: str, var_names: Union[List[str], None] = None):
+        """Writes the result matrices to an uncompressed .npz file, with the (n_subsimulations, n_steps) matrix of each variable and the 'subsim' and 'step' index arrays.
+        The file can be memory-mapped back with load_results. Variables named 'subsim' or 'step' are not accepted. str variables are stored as fixed-width unicode arrays, and the int variables with states out of the int64 range as pickled object arrays (see the allow_pickle argument of load_results).
+
+        :param path: Path of the .npz file.
+        :type path: str
+        :param var_names: Names of the exported variables. If None, all variables are exported. Defaults to None.
+        :type var_names: Union[List[str], None], optional
+        """
+        assert isinstance(path, str), f'path must be a string. Given {type(path)}.'
+        results, var_types = self._get_export_results()
+        _write_npz(path, results, var_types, var_names)
@@ -0,0 +1,437 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+
+def _get_histogram_config(histogram: Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], str], Sequence[float]]) -> Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], Union[str, Tuple[float, ...]]]]:
+    """Internal function.
+    Checks a histogram configuration and returns it in the format (n_bins, (min, max)) for equal-width bins, (n_bins, (min, max), 'log') for log-spaced bins, or (n_bins, (edges[0], edges[-1]), edges) for the bin edges given as a sequence.
+    """
+    if not isinstance(histogram, tuple) or not (len(histogram) in (2, 3) and isinstance(histogram[1], (tuple, list))):
+        #a sequence of bin edges
+        edges = tuple(float(edge) for edge in histogram)
+        assert len(edges) >= 2 and all([edges[i] < edges[i+1] for i in range(len(edges)-1)]), 'The bin edges must be a strictly increasing sequence of at least two values.'
+        return (len(edges)-1, (edges[0], edges[-1]), edges)
+    n_bins, _range = histogram[0], histogram[1]
+    assert isinstance(n_bins, int) and n_bins >= 1, 'n_bins must be a positive integer.'
+    assert len(_range) == 2 and _range[0] < _range[1], 'The histogram range must be in the format (min, max), with min < max.'
+    _range = (float(_range[0]), float(_range[1]))
+    if len(histogram) == 2 or histogram[2] == 'linear':
+        return (n_bins, _range)
+    if histogram[2] == 'log':
+        assert _range[0] > 0, 'The range of log-spaced bins must be positive.'
+        return (n_bins, _range, 'log')
+    edges = tuple(float(edge) for edge in histogram[2])
+    assert len(edges) == n_bins+1 and (edges[0], edges[-1]) == _range, 'The bin edges must match n_bins and the range.'
+    return (n_bins, _range, edges)
+
+def _get_histogram_edges(n_bins: int, _range: Tuple[float, float], bins: Union[str, Sequence[float], None] = None) -> np.ndarray:
+    """Internal function.
+    Returns the n_bins+1 edges of equal-width (bins=None or 'linear') or log-spaced (bins='log') bins of '_range', or the given edges.
+    """
+    if bins is None or bins == 'linear':
+        return np.linspace(_range[0], _range[1], n_bins+1)
+    if isinstance(bins, str):
+        return np.geomspace(_range[0], _range[1], n_bins+1)
+    return np.asarray(bins, dtype=np.float64)
+
+def _histogram_counts(values: np.ndarray, n_bins: int, _range: Tuple[float, float], bins: Union[str, Sequence[float], None] = None) -> np.ndarray:
+    """Counts, for each step (1-axis of 'values'), how many values fall in each of the 'n_bins' bins of '_range': equal-width bins (bins=None or 'linear'), log-spaced bins (bins='log') or bins with the given edges.
+    All the values are binned at once and counted with a single np.bincount over the flattened (step, bin) indexes.
+    Values out of the range are ignored and the last bin includes its right edge, so the counts are the same as the ones of np.histogram.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    vmin, vmax = _range
+    n_steps = values.shape[1]
+    edges = _get_histogram_edges(n_bins, _range, bins)
+    if bins is None or bins == 'linear':
+        #same binning as np.histogram: the index is computed from the bin width, and then corrected with the edges, since rounding may move a value close to an edge to a neighbouring bin
+        bins = np.clip(np.nan_to_num((values - vmin) * (n_bins / (vmax - vmin))), 0, n_bins - 1).astype(np.int64)
+        bins[values < edges[bins]] -= 1
+        bins[(values >= edges[bins + 1]) & (bins != n_bins - 1)] += 1
+    else:
+        bins = np.searchsorted(edges, values, side='right') - 1
+    bins = np.clip(bins, 0, n_bins - 1)
+    bins[values == vmax] = n_bins - 1
+    valid = (values >= vmin) & (values <= vmax)
+    flat_indexes = (np.arange(n_steps)[None, :] * n_bins + bins)[valid]
+    return np.bincount(flat_indexes, minlength=n_steps*n_bins).reshape(n_steps, n_bins)
+
+class QuantileSketch():
+    """The QuantileSketch class is a mergeable quantile sketch (a KLL-like hierarchy of compactors) that summarizes the values of each step of a simulation.
+    Since every subsimulation gives exactly one value per step, the compactors of all steps fill at the same rate, so each level is stored as a single (n_items, n_steps) array and compacted for all steps at once.
+    A level holds at most 'capacity' items of weight 2^level per step. When it is full, its items are sorted and every other one (starting at a random offset) is promoted to the next level.
+    The memory usage is O(capacity * log2(count/capacity) * n_steps), regardless of the number of subsimulations.
+    """
+
+    def __init__(self, n_steps: int, error: float = 0.01, seed: Union[int, None] = None) -> None:
+        """
+        :param n_steps: Number of steps per subsimulation.
+        :type n_steps: int
+        :param error: Target rank error, as a fraction of the number of values (e.g. 0.01 means that a queried p50 lies between the true p49 and p51). Defaults to 0.01.
+        :type error: float, optional
+        :param seed: Seed of the random offsets of the compactions. Defaults to None.
+        :type seed: Union[int, None], optional
+        """
+        assert isinstance(n_steps, int), f'Argument of \'n_steps\' must be integer. Given {type(n_steps)}.'
+        assert n_steps > 0, f'n_steps must be positive. Given {n_steps}.'
+        assert isinstance(error, float) and 0 < error < 1, f'error must be a float in the interval (0, 1). Given {error}.'
+
+        self._n_steps = n_steps
+        self._error = error
+        self._capacity = 2*int(np.ceil(1/error))
+        self._count = 0
+        self._levels = []
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def n_steps(self) -> int:
+        """
+        :return: Number of steps per subsimulation.
+        :rtype: int
+        """
+        return self._n_steps
+
+    @property
+    def error(self) -> float:
+        """
+        :return: Target rank error.
+        :rtype: float
+        """
+        return self._error
+
+    @property
+    def count(self) -> int:
+        """
+        :return: Number of subsimulations summarized by the sketch.
+        :rtype: int
+        """
+        return self._count
+
+    def update(self, values: np.ndarray):
+        """Adds the histories of a batch of subsimulations to the sketch.
+
+        :param values: Array whose 0-axis indexes the subsimulations and 1-axis indexes the steps. A 1D array is taken as the history of a single subsimulation.
+        :type values: np.ndarray
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        assert values.ndim == 2 and values.shape[1] == self._n_steps, f'values must have shape (n_subsims, {self._n_steps}). Given {values.shape}.'
+        self._add_items(0, values)
+        self._count += values.shape[0]
+        self._compact()
+
+    def merge(self, other: 'QuantileSketch'):
+        """Adds the summarized values of another QuantileSketch (with the same number of steps and error) to this one.
+
+        :param other: QuantileSketch object.
+        :type other: QuantileSketch
+        """
+        assert isinstance(other, QuantileSketch), f'other must be a QuantileSketch object. Given {type(other)}.'
+        assert other._n_steps == self._n_steps, 'Both sketches must have the same number of steps.'
+        assert other._capacity == self._capacity, 'Both sketches must have the same error.'
+        for level, items in enumerate(other._levels):
+            self._add_items(level, items)
+        self._count += other._count
+        self._compact()
+
+    def quantiles(self, qs: Union[float, Sequence[float]]) -> np.ndarray:
+        """Returns approximate quantiles of each step.
+
+        :param qs: Quantile or sequence of quantiles, in the interval [0, 1].
+        :type qs: Union[float, Sequence[float]]
+        :return: Array whose 0-axis indexes the quantiles (absent if 'qs' is a scalar) and 1-axis indexes the steps.
+        :rtype: np.ndarray
+        """
+        qs = self._check_quantiles(qs)
+        items, weights = self._get_weighted_items()
+        order = np.argsort(items, axis=0, kind='stable')
+        sorted_items = np.take_along_axis(items, order, axis=0)
+        cumulative_weights = np.cumsum(weights[order], axis=0)
+        positions = np.stack([np.sum(cumulative_weights < max(q*self._count, 1), axis=0) for q in np.atleast_1d(qs)])
+        result = np.take_along_axis(sorted_items, np.minimum(positions, sorted_items.shape[0]-1), axis=0)
+        return result[0] if np.ndim(qs) == 0 else result
+
+    def overall_quantiles(self, qs: Union[float, Sequence[float]]) -> Union[float, np.ndarray]:
+        """Returns approximate quantiles of the values of all steps.
+
+        :param qs: Quantile or sequence of quantiles, in the interval [0, 1].
+        :type qs: Union[float, Sequence[float]]
+        :return: A quantile, or an array of quantiles.
+        :rtype: Union[float, np.ndarray]
+        """
+        qs = self._check_quantiles(qs)
+        items, weights = self._get_weighted_items()
+        items = items.ravel()
+        weights = np.repeat(weights, self._n_steps)
+        order = np.argsort(items, kind='stable')
+        cumulative_weights = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative_weights, np.maximum(np.atleast_1d(qs)*self._count*self._n_steps, 1))
+        result = items[order][np.minimum(positions, items.shape[0]-1)]
+        return float(result[0]) if np.ndim(qs) == 0 else result
+
+    def _check_quantiles(self, qs: Union[float, Sequence[float]]) -> Union[float, np.ndarray]:
+        """Internal method.
+        Validates the queried quantiles.
+        """
+        assert self._count > 0, 'The sketch is empty.'
+        qs = np.asarray(qs, dtype=np.float64)
+        assert qs.ndim <= 1, 'qs must be a float or a sequence of floats.'
+        assert np.all((qs >= 0) & (qs <= 1)), 'Quantiles must be in the interval [0, 1].'
+        return float(qs) if qs.ndim == 0 else qs
+
+    def _get_weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Internal method.
+        Returns all the items, as a (n_items, n_steps) array, and the weight of each row.
+        """
+        items = np.concatenate(self._levels, axis=0)
+        weights = np.concatenate([np.full(level_items.shape[0], 2**level, dtype=np.int64) for level, level_items in enumerate(self._levels)])
+        return items, weights
+
+    def _add_items(self, level: int, items: np.ndarray):
+        """Internal method.
+        Appends items (a (n_items, n_steps) array) to a level.
+        """
+        while len(self._levels) <= level:
+            self._levels.append(np.empty((0, self._n_steps)))
+        self._levels[level] = np.concatenate([self._levels[level], items], axis=0)
+
+    def _compact(self):
+        """Internal method.
+        Compacts every level that exceeds the capacity, promoting half of its items to the next level.
+        """
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if items.shape[0] > self._capacity:
+                items = np.sort(items, axis=0)
+                n_pairs = items.shape[0] // 2
+                #each step gets its own random offset, so the compaction errors are independent among the steps
+                offsets = self._rng.integers(0, 2, size=self._n_steps)
+                promoted = np.take_along_axis(items, offsets[None, :] + 2*np.arange(n_pairs)[:, None], axis=0)
+                self._levels[level] = items[2*n_pairs:]
+                self._add_items(level+1, promoted)
+            level += 1
+
+class OnlineStatistics():
+    """The OnlineStatistics class accumulates per-step statistics of a numeric variable without storing its histories.
+    Each update folds the histories of a batch of subsimulations into per-step accumulators (Welford/Chan mean and variance, minimum, maximum, sum and, optionally, a fixed-range histogram and a quantile sketch), so the memory usage does not depend on the number of subsimulations.
+    Accumulators of different batches (e.g. of parallel workers) can be merged.
+    """
+
+    def __init__(self, n_steps: int, histogram: Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], str], Sequence[float], None] = None, quantile_error: Union[float, None] = None, seed: Union[int, None] = None) -> None:
+        """
+        :param n_steps: Number of steps per subsimulation.
+        :type n_steps: int
+        :param histogram: Histogram configuration in the format (n_bins, (min, max)) for equal-width bins or (n_bins, (min, max), 'log') for log-spaced bins, a sequence of bin edges, or None to not accumulate histograms. Defaults to None.
+        :type histogram: Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], str], Sequence[float], None], optional
+        :param quantile_error: Target rank error of the quantile sketch, or None to not keep a sketch. Defaults to None.
+        :type quantile_error: Union[float, None], optional
+        :param seed: Seed of the quantile sketch. Defaults to None.
+        :type seed: Union[int, None], optional
+        """
+        assert isinstance(n_steps, int), f'Argument of \'n_steps\' must be integer. Given {type(n_steps)}.'
+        assert n_steps > 0, f'n_steps must be positive. Given {n_steps}.'
+        histogram = _get_histogram_config(histogram) if histogram is not None else None
+
+        self._n_steps = n_steps
+        self._count = 0
+        self._mean = np.zeros(n_steps)
+        self._m2 = np.zeros(n_steps)
+        self._min = np.full(n_steps, np.inf)
+        self._max = np.full(n_steps, -np.inf)
+        self._sum = np.zeros(n_steps)
+        self._histogram_config = histogram
+        self._histogram = np.zeros((n_steps, histogram[0]), dtype=np.int64) if histogram is not None else None
+        self._sketch = QuantileSketch(n_steps, quantile_error, seed) if quantile_error is not None else None
+
+    @property
+    def n_steps(self) -> int:
+        """
+        :return: Number of steps per subsimulation.
+        :rtype: int
+        """
+        return self._n_steps
+
+    @property
+    def count(self) -> int:
+        """
+        :return: Number of subsimulations folded into the accumulators.
+        :rtype: int
+        """
+        return self._count
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        :return: Mean of each step.
+        :rtype: np.ndarray
+        """
+        return self._mean.copy()
+
+    @property
+    def var(self) -> np.ndarray:
+        """
+        :return: Variance of each step.
+        :rtype: np.ndarray
+        """
+        return self._m2 / self._count
+
+    @property
+    def std(self) -> np.ndarray:
+        """
+        :return: Standard deviation of each step.
+        :rtype: np.ndarray
+        """
+        return np.sqrt(self.var)
+
+    @property
+    def min(self) -> np.ndarray:
+        """
+        :return: Minimum of each step.
+        :rtype: np.ndarray
+        """
+        return self._min.copy()
+
+    @property
+    def max(self) -> np.ndarray:
+        """
+        :return: Maximum of each step.
+        :rtype: np.ndarray
+        """
+        return self._max.copy()
+
+    @property
+    def sum(self) -> np.ndarray:
+        """
+        :return: Sum of each step.
+        :rtype: np.ndarray
+        """
+        return self._sum.copy()
+
+    @property
+    def histogram_config(self) -> Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], Union[str, Tuple[float, ...]]], None]:
+        """
+        :return: Histogram configuration in the format (n_bins, (min, max)) for equal-width bins, (n_bins, (min, max), 'log') for log-spaced bins or (n_bins, (min, max), edges) for given bin edges, or None if histograms are not accumulated.
+        :rtype: Union[Tuple[int, Tuple[float, float]], Tuple[int, Tuple[float, float], Union[str, Tuple[float, ...]]], None]
+        """
+        return self._histogram_config
+
+    @property
+    def histogram(self) -> np.ndarray:
+        """
+        :return: Array with the histogram counts of each step. The 0-axis indexes are the steps and the 1-axis indexes are the bins.
+        :rtype: np.ndarray
+        """
+        assert self._histogram is not None, 'Histograms are not accumulated.'
+        return self._histogram.copy()
+
+    @property
+    def histogram_edges(self) -> np.ndarray:
+        """
+        :return: Array with the n_bins+1 bin edges of the histograms.
+        :rtype: np.ndarray
+        """
+        assert self._histogram is not None, 'Histograms are not accumulated.'
+        return _get_histogram_edges(*self._histogram_config)
+
+    @property
+    def sketch(self) -> Union[QuantileSketch, None]:
+        """
+        :return: Quantile sketch, or None if quantiles are not accumulated.
+        :rtype: Union[QuantileSketch, None]
+        """
+        return self._sketch
+
+    def quantiles(self, qs: Union[float, Sequence[float]]) -> np.ndarray:
+        """Returns approximate quantiles of each step.
+
+        :param qs: Quantile or sequence of quantiles, in the interval [0, 1].
+        :type qs: Union[float, Sequence[float]]
+        :return: Array whose 0-axis indexes the quantiles (absent if 'qs' is a scalar) and 1-axis indexes the steps.
+        :rtype: np.ndarray
+        """
+        assert self._sketch is not None, 'Quantiles are not accumulated.'
+        return self._sketch.quantiles(qs)
+
+    def overall(self, statistic: str) -> float:
+        """Returns a statistic over all steps of all subsimulations.
+
+        :param statistic: 'mean', 'var', 'std', 'min', 'max' or 'sum'.
+        :type statistic: str
+        :return: Overall statistic.
+        :rtype: float
+        """
+        assert statistic in ('mean', 'var', 'std', 'min', 'max', 'sum'), 'statistic must be \'mean\', \'var\', \'std\', \'min\', \'max\' or \'sum\'.'
+        if statistic == 'min':
+            return float(np.min(self._min))
+        elif statistic == 'max':
+            return float(np.max(self._max))
+        elif statistic == 'sum':
+            return float(np.sum(self._sum))
+
+        #all steps have the same count, so the overall mean is the mean of the step means
+        overall_mean = float(np.mean(self._mean))
+        if statistic == 'mean':
+            return overall_mean
+        overall_var = float((np.sum(self._m2) + self._count*np.sum((self._mean - overall_mean)**2)) / (self._count*self._n_steps))
+        return overall_var if statistic == 'var' else float(np.sqrt(overall_var))
+
+    def update(self, values: np.ndarray):
+        """Folds the histories of a batch of subsimulations into the accumulators.
+
+        :param values: Array whose 0-axis indexes the subsimulations and 1-axis indexes the steps. A 1D array is taken as the history of a single subsimulation.
+        :type values: np.ndarray
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        assert values.ndim == 2 and values.shape[1] == self._n_steps, f'values must have shape (n_subsims, {self._n_steps}). Given {values.shape}.'
+        if values.shape[0] == 0:
+            return
+
+        batch_mean = np.mean(values, axis=0)
+        self._merge_moments(values.shape[0], batch_mean, np.sum((values - batch_mean)**2, axis=0))
+        np.minimum(self._min, np.min(values, axis=0), out=self._min)
+        np.maximum(self._max, np.max(values, axis=0), out=self._max)
+        self._sum += np.sum(values, axis=0)
+        if self._histogram is not None:
+            self._histogram += _histogram_counts(values, *self._histogram_config)
+        if self._sketch is not None:
+            self._sketch.update(values)
+
+    def merge(self, other: 'OnlineStatistics'):
+        """Folds the accumulators of another OnlineStatistics object (with the same configuration) into this one.
+
+        :param other: OnlineStatistics object.
+        :type other: OnlineStatistics
+        """
+        assert isinstance(other, OnlineStatistics), f'other must be an OnlineStatistics object. Given {type(other)}.'
+        assert other._n_steps == self._n_steps, 'Both OnlineStatistics objects must have the same number of steps.'
+        assert other._histogram_config == self._histogram_config, 'Both OnlineStatistics objects must have the same histogram configuration.'
+        assert (other._sketch is None) == (self._sketch is None), 'Both OnlineStatistics objects must have quantile sketches, or none of them.'
+        if other._count == 0:
+            return
+
+        self._merge_moments(other._count, other._mean, other._m2)
+        np.minimum(self._min, other._min, out=self._min)
+        np.maximum(self._max, other._max, out=self._max)
+        self._sum += other._sum
+        if self._histogram is not None:
+            self._histogram += other._histogram
+        if self._sketch is not None:
+            self._sketch.merge(other._sketch)
+
+    def _merge_moments(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        """Internal method.
+        Merges the count, mean and sum of squared deviations of another set of subsimulations (Chan et al. parallel algorithm).
+        """
+        total = self._count + count
+        delta = mean - self._mean
+        self._mean += delta * (count / total)
+        self._m2 += m2 + delta**2 * (self._count * count / total)
+        self._count = total
@@ -0,0 +1,220 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import os
+import json
+import random
+import hashlib
+import itertools
+import numpy as np
+from pandas import DataFrame, MultiIndex
+from montecarlosimulation import MonteCarloSimulationEnv
+from resultsio import _write_npz, _load_npz
+
+#environment factory of the worker processes of a sweep, set once per worker by _init_sweep_worker
+_worker_env_factory = None
+
+def _init_sweep_worker(env_factory: Callable[..., MonteCarloSimulationEnv]):
+    """Internal function.
+    Initializer of the worker processes of a sweep. The factory (with the objects it refers to, e.g. random variables with their alias tables) is sent once per worker instead of once per scenario.
+    """
+    global _worker_env_factory
+    _worker_env_factory = env_factory
+
+def _run_scenario(params: Dict[str, Any], seed: int, env_factory: Union[Callable[..., MonteCarloSimulationEnv], None] = None) -> Tuple[Dict[str, np.ndarray], Dict[str, type]]:
+    """Internal function.
+    Builds the simulation of a scenario with the factory (the one of the worker, if env_factory is None), runs it with the given seed and returns its result matrices and the types of its variables.
+    This function is the unit of work sent to the workers, so it must stay at module level (picklable).
+    """
+    env = (env_factory if env_factory is not None else _worker_env_factory)(**params)
+    assert isinstance(env, MonteCarloSimulationEnv), f'env_factory must return a MonteCarloSimulationEnv object. Returned {type(env)}.'
+    assert env._keep_history, 'The simulations of a sweep must keep their histories (keep_history=True).'
+    env._entropy = seed
+    env.run(show_progress=False)
+    return {var_name: np.asarray(result) for var_name, result in env._results.items()}, {var_name: var_type for var_name, var_type, var_default in env._variables}
+
+def _get_level_values(values: List[Any], repeats: np.ndarray) -> np.ndarray:
+    """Internal function.
+    Repeats the value of a parameter of each scenario by the number of rows of the scenario. Values that NumPy cannot put in a 1D array (e.g. tuples) are kept as objects.
+    """
+    array = np.array(values)
+    if array.ndim != 1:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+    return np.repeat(array, repeats)
+
+class ParameterSweep():
+    """The ParameterSweep class runs the same model over a grid of parameters. Each grid point (scenario) is a MonteCarloSimulationEnv built by a factory function, and the scenarios are run across a pool of worker processes.
+    The factory is sent once to each worker, which then runs many scenarios. The objects the factory refers to (e.g. random variables and Markov chains built outside of it, with their alias tables) are thus shared by the scenarios of a worker, and so are the per-process caches of the library (context classes of the variable schemas and compiled step kernels).
+    By default, all the scenarios use the same seed (common random numbers), so the subsimulation i of every scenario draws from the same random streams, and the differences between scenarios have a lower variance than with independent runs.
+    The results can be cached in a directory, one file per scenario, so an interrupted or extended sweep only runs the scenarios that are not cached.
+    """
+
+    def __init__(self, env_factory: Callable[..., MonteCarloSimulationEnv], grid: Union[Dict[str, Sequence[Any]], List[Dict[str, Any]]], seed: Union[int, None] = None, common_random_numbers: bool = True, cache_dir: Union[str, None] = None) -> None:
+        """
+        :param env_factory: Function that gets the parameters of a scenario as keyword arguments and returns its MonteCarloSimulationEnv, with the callbacks set and keep_history=True. The seed given to the constructor is replaced by the seed of the sweep. It must be picklable (defined at module level) when the 'spawn' start method is used.
+        :type env_factory: Callable[..., MonteCarloSimulationEnv]
+        :param grid: Dictionary in the format {parameter_name: values}, whose scenarios are all the combinations of the values, or list of scenarios in the format [{parameter_name: value}].
+        :type grid: Union[Dict[str, Sequence[Any]], List[Dict[str, Any]]]
+        :param seed: Seed of the sweep. If None, it is drawn from the global random module. Defaults to None.
+        :type seed: Union[int, None], optional
+        :param common_random_numbers: If True, all the scenarios are run with the seed of the sweep. If False, each scenario has its own seed, derived from the seed of the sweep and the index of the scenario. Defaults to True.
+        :type common_random_numbers: bool, optional
+        :param cache_dir: Directory where the results of each scenario are saved (as .npz files) and from which they are loaded instead of run again. A scenario is identified by its parameters and its seed, so the cache must be cleared if the factory changes. The files may hold pickled ints (out of the int64 range), so only directories written by trusted sweeps should be given. Defaults to None.
+        :type cache_dir: Union[str, None], optional
+        """
+        assert isinstance(env_factory, Callable), f'env_factory must be a function. Given {type(env_factory)}.'
+        assert isinstance(grid, (dict, list)), f'grid must be a dict or a list of dicts. Given {type(grid)}.'
+        assert seed is None or isinstance(seed, int), f'Argument of \'seed\' must be integer or None. Given {type(seed)}.'
+        assert isinstance(common_random_numbers, bool), f'Argument of \'common_random_numbers\' must be bool. Given {type(common_random_numbers)}.'
+        assert cache_dir is None or isinstance(cache_dir, str), f'Argument of \'cache_dir\' must be a string or None. Given {type(cache_dir)}.'
+        if isinstance(grid, dict):
+            assert all([isinstance(param_name, str) for param_name in grid.keys()]), 'The keys of grid must be parameter names (strings).'
+            scenarios = [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+        else:
+            assert all([isinstance(scenario, dict) for scenario in grid]), 'grid must be a dict or a list of dicts.'
+            scenarios = [dict(scenario) for scenario in grid]
+            assert all([scenario.keys() == scenarios[0].keys() for scenario in scenarios]), 'All the scenarios must have the same parameters.'
+        assert len(scenarios) > 0, 'grid must have at least one scenario.'
+
+        self._env_factory = env_factory
+        self._scenarios = scenarios
+        self._param_names = list(scenarios[0].keys())
+        self._seed = seed if seed is not None else random.getrandbits(128)
+        self._common_random_numbers = common_random_numbers
+        self._cache_dir = cache_dir
+        self._results = [None] * len(scenarios)
+
+    @property
+    def scenarios(self) -> List[Dict[str, Any]]:
+        """
+        :return: Parameters of each scenario, in the format [{parameter_name: value}].
+        :rtype: List[Dict[str, Any]]
+        """
+        return [dict(scenario) for scenario in self._scenarios]
+
+    def _get_scenario_seed(self, scenario_index: int) -> int:
+        """Internal method.
+        Returns the seed of a scenario.
+        """
+        if self._common_random_numbers:
+            return self._seed
+        return int.from_bytes(np.random.SeedSequence([self._seed, scenario_index]).generate_state(4).tobytes(), 'little')
+
+    def _get_cache_path(self, scenario_index: int) -> str:
+        """Internal method.
+        Returns the path of the cache file of a scenario, named after a hash of its parameters and its seed.
+        """
+        key = json.dumps({'params': self._scenarios[scenario_index], 'seed': str(self._get_scenario_seed(scenario_index))}, sort_keys=True, default=repr)
+        return os.path.join(self._cache_dir, f'scenario_{hashlib.sha1(key.encode()).hexdigest()}.npz')
+
+    def _load_cached(self, scenario_index: int) -> Union[Dict[str, np.ndarray], None]:
+        """Internal method.
+        Returns the cached results of a scenario, or None if they are not cached.
+        """
+        if self._cache_dir is None or not os.path.exists(self._get_cache_path(scenario_index)):
+            return None
+        #the cache files are written by the sweep, so their object arrays (ints out of the int64 range) are unpickled
+        arrays = _load_npz(self._get_cache_path(scenario_index), allow_pickle=True)
+        return {var_name: array for var_name, array in arrays.items() if var_name not in ('subsim', 'step')}
+
+    def _save_cached(self, scenario_index: int, results: Dict[str, np.ndarray], var_types: Dict[str, type]):
+        """Internal method.
+        Writes the results of a scenario to its cache file, through a temporary file, so an interrupted sweep never leaves a partial file.
+        """
+        if self._cache_dir is None:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        final_path = self._get_cache_path(scenario_index)
+        temporary_path = final_path[:-len('.npz')] + '.tmp.npz'
+        _write_npz(temporary_path, results, var_types)
+        os.replace(temporary_path, final_path)
+
+    def run(self, n_workers: Union[int, None] = None, backend: str = 'process', start_method: Union[str, None] = None, show_progress: bool = True) -> DataFrame:
+        """Runs the scenarios that are not cached and returns the results of all of them (see get_dataframe).
+        Each scenario is run as a whole by a worker (with the 'serial' backend of MonteCarloSimulationEnv.run), so the results do not depend on the backend or on the number of workers.
+
+        :param n_workers: Number of worker processes. If None, the number of CPUs is used. Defaults to None.
+        :type n_workers: Union[int, None], optional
+        :param backend: 'process' runs the scenarios across worker processes, and 'serial' runs them one after another in this process. Defaults to 'process'.
+        :type backend: str, optional
+        :param start_method: Multiprocessing start method ('fork', 'spawn' or 'forkserver'). If None, the platform default is used. Defaults to None.
+        :type start_method: Union[str, None], optional
+        :param show_progress: Enable progress bar (over the scenarios), defaults to True
+        :type show_progress: bool, optional
+        :return: Tidy DataFrame with the results of all the scenarios.
+        :rtype: DataFrame
+        """
+        assert backend in ('serial', 'process'), f'backend must be \'serial\' or \'process\'. Given {backend}.'
+        assert n_workers is None or (isinstance(n_workers, int) and n_workers > 0), f'n_workers must be a positive integer or None. Given {n_workers}.'
+
+        if show_progress:
+            from tqdm import tqdm
+
+        remaining = []
+        for k in range(len(self._scenarios)):
+            if self._results[k] is None:
+                self._results[k] = self._load_cached(k)
+            if self._results[k] is None:
+                remaining.append(k)
+
+        progress_bar = tqdm(total=len(self._scenarios), initial=len(self._scenarios)-len(remaining)) if show_progress else None
+        try:
+            if backend == 'serial':
+                for k in remaining:
+                    self._collect_scenario(k, *_run_scenario(self._scenarios[k], self._get_scenario_seed(k), self._env_factory), progress_bar)
+            elif len(remaining) > 0:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor, as_completed
+                n_workers = min(n_workers if n_workers is not None else (os.cpu_count() or 1), len(remaining))
+                with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context(start_method), initializer=_init_sweep_worker, initargs=(self._env_factory,)) as executor:
+                    futures = {executor.submit(_run_scenario, self._scenarios[k], self._get_scenario_seed(k)): k for k in remaining}
+                    for future in as_completed(futures):
+                        self._collect_scenario(futures[future], *future.result(), progress_bar)
+        finally:
+            if progress_bar is not None:
+                progress_bar.close()
+        return self.get_dataframe()
+
+    def _collect_scenario(self, scenario_index: int, results: Dict[str, np.ndarray], var_types: Dict[str, type], progress_bar: Any):
+        """Internal method.
+        Keeps (and caches) the results of a completed scenario and advances the progress bar.
+        """
+        self._results[scenario_index] = results
+        self._save_cached(scenario_index, results, var_types)
+        if progress_bar is not None:
+            progress_bar.update(1)
+
+    def get_scenario_histories(self, scenario_index: int) -> Dict[str, np.ndarray]:
+        """Returns the result matrices of a scenario, whose 0-axis indexes the subsimulations and 1-axis indexes the steps.
+
+        :param scenario_index: Index of the scenario in the scenarios property.
+        :type scenario_index: int
+        :return: Dictionary in the format {variable_name: matrix}.
+        :rtype: Dict[str, np.ndarray]
+        """
+        assert isinstance(scenario_index, int) and 0 <= scenario_index < len(self._scenarios), f'scenario_index must be an integer in [0, {len(self._scenarios)}). Given {scenario_index}.'
+        assert self._results[scenario_index] is not None, 'The scenario has not been run yet.'
+        return dict(self._results[scenario_index])
+
+    def get_dataframe(self, var_names: Union[List[str], None] = None) -> DataFrame:
+        """Returns a tidy DataFrame with the results of all the scenarios: a row per (scenario, subsimulation, step), indexed by the parameters, 'subsim' and 'step', and a column per variable.
+
+        :param var_names: Names of the variables. If None, all the variables. Defaults to None.
+        :type var_names: Union[List[str], None], optional
+        :return: DataFrame with a MultiIndex in the format (parameter_1, ..., parameter_n, subsim, step).
+        :rtype: DataFrame
+        """
+        assert all([results is not None for results in self._results]), 'The sweep has not been run yet.'
+        var_names = var_names if var_names is not None else list(self._results[0].keys())
+        assert all([var_name in self._results[0].keys() for var_name in var_names]), 'All the names in var_names must be names of variables.'
+        shapes = [results[var_names[0]].shape for results in self._results]
+        repeats = np.array([n_subsims * n_steps for n_subsims, n_steps in shapes], dtype=np.int64)
+        levels = [_get_level_values([scenario[param_name] for scenario in self._scenarios], repeats) for param_name in self._param_names]
+        levels.append(np.concatenate([np.repeat(np.arange(n_subsims, dtype=np.int64), n_steps) for n_subsims, n_steps in shapes]))
+        levels.append(np.concatenate([np.tile(np.arange(n_steps, dtype=np.int64), n_subsims) for n_subsims, n_steps in shapes]))
+        index = MultiIndex.from_arrays(levels, names=self._param_names + ['subsim', 'step'])
+        return DataFrame({var_name: np.concatenate([np.asarray(results[var_name]).ravel() for results in self._results]) for var_name in var_names}, index=index)
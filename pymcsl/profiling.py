@@ -0,0 +1,189 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pandas import DataFrame
+
+#phases of a run, in the order they are reported
+_phases = ('begin', 'step', 'context', 'logging', 'aggregation')
+
+def _get_peak_rss() -> float:
+    """Internal function.
+    Returns the peak resident set size (memory high-water mark) of the process in bytes, or NaN if it is not available on the platform.
+    """
+    try:
+        import resource
+        import sys
+    except ImportError:
+        return np.nan
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return float(peak) if sys.platform == 'darwin' else float(peak) * 1024
+
+class RunStats():
+    """The RunStats class records where the time of a run goes, when MonteCarloSimulationEnv.run is called with profile=True.
+    The wall time and the number of calls are recorded for each phase:
+    - 'begin': the beginning callback;
+    - 'step': the step callback (including the reads and assignments of variables done inside it);
+    - 'context': getting the context object and dispatching each step (the time between the end of a step and the call of the next step callback);
+    - 'logging': logging the states of each step into the history;
+    - 'aggregation': collecting the histories of the workers and folding them into the online accumulators.
+    The wall time, the number of steps, the steps per second and the memory high-water mark of each subsimulation are recorded too.
+    RunStats objects of different chunks of subsimulations (e.g. of parallel workers) can be merged.
+    """
+
+    def __init__(self) -> None:
+        self._times = {phase: 0.0 for phase in _phases}
+        self._calls = {phase: 0 for phase in _phases}
+        self._subsim_indexes = []
+        self._subsim_times = []
+        self._subsim_steps = []
+        self._subsim_peak_rss = []
+        self._subsim_peak_traced = []
+        self._wall_time = 0.0
+
+    def add(self, phase: str, seconds: float, calls: int = 1):
+        """Adds time (and calls) to a phase.
+
+        :param phase: 'begin', 'step', 'context', 'logging' or 'aggregation'.
+        :type phase: str
+        :param seconds: Wall time in seconds.
+        :type seconds: float
+        :param calls: Number of calls. Defaults to 1.
+        :type calls: int, optional
+        """
+        assert phase in _phases, f'phase must be one of {_phases}. Given {phase}.'
+        self._times[phase] += seconds
+        self._calls[phase] += calls
+
+    def add_subsim(self, subsim_index: int, seconds: float, n_steps: int, peak_rss: float = np.nan, peak_traced: float = np.nan):
+        """Records a completed subsimulation.
+
+        :param subsim_index: Subsimulation index.
+        :type subsim_index: int
+        :param seconds: Wall time of the subsimulation in seconds.
+        :type seconds: float
+        :param n_steps: Number of steps of the subsimulation.
+        :type n_steps: int
+        :param peak_rss: Peak resident set size of the process (in bytes) after the subsimulation. Defaults to NaN.
+        :type peak_rss: float, optional
+        :param peak_traced: Peak of the memory traced by tracemalloc (in bytes) during the subsimulation. Defaults to NaN.
+        :type peak_traced: float, optional
+        """
+        self._subsim_indexes.append(subsim_index)
+        self._subsim_times.append(seconds)
+        self._subsim_steps.append(n_steps)
+        self._subsim_peak_rss.append(peak_rss)
+        self._subsim_peak_traced.append(peak_traced)
+
+    def merge(self, other: 'RunStats'):
+        """Folds the records of another RunStats object into this one. The wall time of the run is not merged.
+
+        :param other: RunStats object.
+        :type other: RunStats
+        """
+        assert isinstance(other, RunStats), f'other must be a RunStats object. Given {type(other)}.'
+        for phase in _phases:
+            self._times[phase] += other._times[phase]
+            self._calls[phase] += other._calls[phase]
+        self._subsim_indexes += other._subsim_indexes
+        self._subsim_times += other._subsim_times
+        self._subsim_steps += other._subsim_steps
+        self._subsim_peak_rss += other._subsim_peak_rss
+        self._subsim_peak_traced += other._subsim_peak_traced
+
+    @property
+    def wall_time(self) -> float:
+        """
+        :return: Wall time of the run in seconds (so far, while it runs).
+        :rtype: float
+        """
+        return self._wall_time
+
+    @property
+    def n_subsims(self) -> int:
+        """
+        :return: Number of recorded subsimulations.
+        :rtype: int
+        """
+        return len(self._subsim_indexes)
+
+    @property
+    def n_steps(self) -> int:
+        """
+        :return: Total number of steps of the recorded subsimulations.
+        :rtype: int
+        """
+        return int(sum(self._subsim_steps))
+
+    @property
+    def steps_per_second(self) -> float:
+        """
+        :return: Steps of all the recorded subsimulations per second of wall time of the run.
+        :rtype: float
+        """
+        return self.n_steps / self._wall_time if self._wall_time > 0 else np.nan
+
+    def get_phase_dataframe(self) -> DataFrame:
+        """Returns a DataFrame with a row per phase and the columns 'time' (seconds), 'calls', 'time_per_call' (seconds) and 'share' (fraction of the total time of the phases).
+        With parallel backends, the times of the workers are summed, so the total can be greater than the wall time.
+
+        :return: DataFrame indexed by the phase names.
+        :rtype: DataFrame
+        """
+        times = np.array([self._times[phase] for phase in _phases])
+        calls = np.array([self._calls[phase] for phase in _phases])
+        total = np.sum(times)
+        return DataFrame({
+            'time': times,
+            'calls': calls,
+            'time_per_call': np.divide(times, calls, out=np.full(len(_phases), np.nan), where=calls > 0),
+            'share': times / total if total > 0 else np.full(len(_phases), np.nan)
+        }, index=list(_phases))
+
+    def get_subsim_dataframe(self) -> DataFrame:
+        """Returns a DataFrame with a row per recorded subsimulation (sorted by index) and the columns 'subsim', 'time' (seconds), 'steps', 'steps_per_second', 'peak_rss' (bytes) and 'peak_traced' (bytes, only with profile='memory').
+
+        :return: DataFrame.
+        :rtype: DataFrame
+        """
+        order = np.argsort(self._subsim_indexes, kind='stable')
+        times = np.array(self._subsim_times, dtype=np.float64)[order]
+        steps = np.array(self._subsim_steps, dtype=np.int64)[order]
+        return DataFrame({
+            'subsim': np.array(self._subsim_indexes, dtype=np.int64)[order],
+            'time': times,
+            'steps': steps,
+            'steps_per_second': np.divide(steps, times, out=np.full(len(times), np.nan), where=times > 0),
+            'peak_rss': np.array(self._subsim_peak_rss, dtype=np.float64)[order],
+            'peak_traced': np.array(self._subsim_peak_traced, dtype=np.float64)[order]
+        })
+
+    def report(self) -> Dict[str, Any]:
+        """Returns a structured report of the run.
+
+        :return: Dictionary in the format {'wall_time': seconds, 'n_subsims': int, 'n_steps': int, 'steps_per_second': float, 'peak_rss': bytes, 'phases': {phase: {'time': seconds, 'calls': int, 'share': float}}}.
+        :rtype: Dict[str, Any]
+        """
+        phases = self.get_phase_dataframe()
+        return {
+            'wall_time': self._wall_time,
+            'n_subsims': self.n_subsims,
+            'n_steps': self.n_steps,
+            'steps_per_second': self.steps_per_second,
+            'peak_rss': float(np.nanmax(self._subsim_peak_rss)) if self.n_subsims > 0 and not np.all(np.isnan(self._subsim_peak_rss)) else np.nan,
+            'phases': {phase: {'time': float(phases.loc[phase, 'time']), 'calls': int(phases.loc[phase, 'calls']), 'share': float(phases.loc[phase, 'share'])} for phase in _phases}
+        }
+
+    def _get_postfix(self) -> Dict[str, str]:
+        """Internal method.
+        Returns the progress bar postfix: the steps per second and the share of each phase.
+        """
+        total = sum(self._times.values())
+        postfix = {'steps/s': f'{self.steps_per_second:.4g}'}
+        if total > 0:
+            postfix.update({phase: f'{self._times[phase] / total:.0%}' for phase in _phases})
+        return postfix
@@ -4,24 +4,100 @@ June-2022
 """
 
 from typing import *
-from random import choices
+from random import random
+from contextvars import ContextVar
+import numpy as np
+
+#Generator of the subsimulation being run (context.rng). The random variables and Markov chains of the library draw from it when they have no generator of their own.
+_active_rng = ContextVar('active_rng', default=None)
+
+def _build_alias_table(weights: List[Union[int, float]]) -> Tuple[List[float], List[int]]:
+    """Builds the alias table of a discrete distribution (Vose's method).
+    An outcome is drawn by picking a uniformly random column 'i', and then returning 'i' with probability probabilities[i], or aliases[i] otherwise.
+
+    :param weights: Weights of the outcomes.
+    :type weights: List[Union[int, float]]
+    :return: Tuple in the format (probabilities, aliases).
+    :rtype: Tuple[List[float], List[int]]
+    """
+    n = len(weights)
+    total = float(sum(weights))
+    scaled = [w * n / total for w in weights]
+    probabilities = [1.0] * n
+    aliases = list(range(n))
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while len(small) > 0 and len(large) > 0:
+        s = small.pop()
+        l = large.pop()
+        probabilities[s] = scaled[s]
+        aliases[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    #the remaining columns are full (up to rounding errors)
+    return probabilities, aliases
 
 class DiscreteRandomVariable():
-    """Random Variables are variables that give unpredictable outcomes. 
+    """Random Variables are variables that give unpredictable outcomes.
     Discrete random variables have an alphabet, which is a set of possible outcomes, and a outcoming probability associated with each value in the alphabet. The act of getting a outcome from a random variable is called 'evaluation'.
+    An alias table is built at construction, so each evaluation costs O(1) regardless of the alphabet size.
     """
-    def __init__(self, alphabet_and_weights: Dict[Union[str, int, float], Union[int, float]]):
+    def __init__(self, alphabet_and_weights: Dict[Union[str, int, float], Union[int, float]], rng: Union[np.random.Generator, None] = None):
         """
-        :param alphabet_and_weights: Dictionary whose set of keys is the alphabet and the items are the probabilities. Format {outcome, probability}. 
+        :param alphabet_and_weights: Dictionary whose set of keys is the alphabet and the items are the probabilities. Format {outcome, probability}.
         :type alphabet_and_weights: Dict[Union[str, int, float], Union[int, float]]
+        :param rng: NumPy generator used by the evaluations. If None, the generator of the running subsimulation (context.rng) is used. Outside of a subsimulation, single evaluations then draw from the global random module and batch evaluations from the global numpy.random state. Defaults to None.
+        :type rng: Union[np.random.Generator, None], optional
         """
+        assert isinstance(alphabet_and_weights, dict), f'\'alphabet_and_weights\' must be a dict. Given {type(alphabet_and_weights)}.'
+        assert len(alphabet_and_weights) > 0, '\'alphabet_and_weights\' must not be empty.'
+        assert all([isinstance(w, (int, float)) and w >= 0 for w in alphabet_and_weights.values()]), 'All weights must be non-negative numbers.'
+        assert sum(alphabet_and_weights.values()) > 0, 'The sum of the weights must be positive.'
+        assert rng is None or isinstance(rng, np.random.Generator), f'\'rng\' must be a numpy.random.Generator or None. Given {type(rng)}.'
+
         self._alphabet = [x for x in alphabet_and_weights.keys()]
         self._weights = [alphabet_and_weights[x] for x in alphabet_and_weights.keys()]
+        self._probabilities, self._aliases = _build_alias_table(self._weights)
+        self._rng = rng
 
-    def evaluate(self) -> Union[str, int, float]:
-        """Get an outcome.
+        #arrays for batch evaluations. Alphabets with mixed types are kept as object arrays.
+        self._alphabet_array = np.array(self._alphabet) if len(set(type(x) for x in self._alphabet)) == 1 else np.array(self._alphabet, dtype=object)
+        self._probabilities_array = np.array(self._probabilities)
+        self._aliases_array = np.array(self._aliases)
 
+    def evaluate(self, size: Union[int, Tuple[int, ...], None] = None) -> Union[str, int, float, np.ndarray]:
+        """Get an outcome, or an array of outcomes.
+
+        :param size: Shape of the array of outcomes. If None, a single outcome is returned. Defaults to None.
+        :type size: Union[int, Tuple[int, ...], None], optional
         :return: outcome.
-        :rtype: Union[str, int, float]
+        :rtype: Union[str, int, float, np.ndarray]
+        """
+        if size is not None:
+            return self.evaluate_many(size)
+
+        n = len(self._alphabet)
+        rng = self._rng if self._rng is not None else _active_rng.get()
+        u = (random() if rng is None else rng.random()) * n
+        i = min(int(u), n - 1)
+        return self._alphabet[i] if u - i < self._probabilities[i] else self._alphabet[self._aliases[i]]
+
+    def evaluate_many(self, n: Union[int, Tuple[int, ...]]) -> np.ndarray:
+        """Get an array of outcomes.
+
+        :param n: Number of outcomes (or shape of the array of outcomes).
+        :type n: Union[int, Tuple[int, ...]]
+        :return: Array of outcomes.
+        :rtype: np.ndarray
         """
-        return choices(self._alphabet, self._weights)[0]
\ No newline at end of file
+        rng = self._rng if self._rng is not None else _active_rng.get()
+        if rng is None:
+            columns = np.random.randint(0, len(self._alphabet), size=n)
+            uniforms = np.random.random_sample(size=n)
+        else:
+            columns = rng.integers(0, len(self._alphabet), size=n)
+            uniforms = rng.random(size=n)
+        return self._alphabet_array[np.where(uniforms < self._probabilities_array[columns], columns, self._aliases_array[columns])]
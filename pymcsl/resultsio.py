@@ -0,0 +1,159 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import struct
+import zipfile
+import numpy as np
+
+def _get_block_size(n_steps: int, rows_per_block: Union[int, None]) -> int:
+    """Internal function.
+    Returns the number of subsimulations per block (row group) of an export, which gives about 'rows_per_block' rows (2^20 by default).
+    """
+    rows_per_block = rows_per_block if rows_per_block is not None else 2**20
+    return max(1, rows_per_block // n_steps)
+
+def _get_wide_columns(results: Dict[str, np.ndarray], var_names: List[str], first: int, last: int) -> Dict[str, np.ndarray]:
+    """Internal function.
+    Returns the columns of the wide layout (subsim, step, variable_1, ..., variable_n) of the subsimulations first to last-1.
+    """
+    n_steps = results[var_names[0]].shape[1]
+    columns = {'subsim': np.repeat(np.arange(first, last, dtype=np.int64), n_steps), 'step': np.tile(np.arange(n_steps, dtype=np.int64), last-first)}
+    for var_name in var_names:
+        columns[var_name] = np.asarray(results[var_name][first:last]).ravel()
+    return columns
+
+def _get_long_columns(results: Dict[str, np.ndarray], var_names: List[str], first: int, last: int) -> Dict[str, np.ndarray]:
+    """Internal function.
+    Returns the columns of the long layout (subsim, step, variable, value) of the subsimulations first to last-1. The values are converted to float.
+    """
+    n_steps = results[var_names[0]].shape[1]
+    n_rows = (last-first) * n_steps
+    subsim = np.repeat(np.arange(first, last, dtype=np.int64), n_steps)
+    step = np.tile(np.arange(n_steps, dtype=np.int64), last-first)
+    return {
+        'subsim': np.tile(subsim, len(var_names)),
+        'step': np.tile(step, len(var_names)),
+        'variable': np.repeat(np.arange(len(var_names), dtype=np.int32), n_rows),
+        'value': np.concatenate([np.asarray(results[var_name][first:last], dtype=np.float64).ravel() for var_name in var_names])
+    }
+
+def _get_record_batches(results: Dict[str, np.ndarray], var_names: List[str], layout: str, rows_per_block: Union[int, None]) -> Iterator[Any]:
+    """Internal function.
+    Yields the results as pyarrow record batches of about 'rows_per_block' rows, so that only a block of the result matrices is in memory at once.
+    """
+    import pyarrow as pa
+    n_subsims, n_steps = results[var_names[0]].shape
+    block_size = _get_block_size(n_steps, rows_per_block)
+    variable_labels = pa.array(var_names, type=pa.string())
+    for first in range(0, n_subsims, block_size):
+        last = min(first+block_size, n_subsims)
+        if layout == 'wide':
+            columns = _get_wide_columns(results, var_names, first, last)
+            yield pa.RecordBatch.from_arrays([pa.array(column) for column in columns.values()], names=list(columns.keys()))
+        else:
+            columns = _get_long_columns(results, var_names, first, last)
+            #the variable names are dictionary-encoded, so each row only stores an index
+            columns['variable'] = pa.DictionaryArray.from_arrays(pa.array(columns['variable']), variable_labels)
+            yield pa.RecordBatch.from_arrays([column if isinstance(column, pa.Array) else pa.array(column) for column in columns.values()], names=list(columns.keys()))
+
+def _check_export_arguments(results: Dict[str, np.ndarray], var_types: Dict[str, type], var_names: Union[List[str], None], layout: str, arrow: bool = True) -> List[str]:
+    """Internal function.
+    Checks the arguments of an export (to Arrow, if 'arrow' is True, or to .npz) and returns the names of the exported variables.
+    """
+    var_names = var_names if var_names is not None else list(results.keys())
+    assert isinstance(var_names, list) and len(var_names) > 0, 'var_names must be a non-empty list of variable names.'
+    assert all([var_name in results.keys() for var_name in var_names]), 'All the names in var_names must be names of variables.'
+    assert layout in ('wide', 'long'), f'layout must be \'wide\' or \'long\'. Given {layout}.'
+    assert layout == 'wide' or all([var_types[var_name] in (int, float, bool) for var_name in var_names]), 'The long layout has a single value column, so it only accepts int, float and bool variables.'
+    assert layout == 'long' or all([var_name not in ('subsim', 'step') for var_name in var_names]), 'Variables named \'subsim\' or \'step\' collide with the index columns of the wide layout and of .npz files.'
+    #int variables with states out of the int64 range are stored in object matrices (Python ints), which Arrow can not store
+    assert not arrow or layout == 'long' or all([var_types[var_name] is not int or results[var_name].dtype != object for var_name in var_names]), 'Some int variables have states out of the int64 range, which Arrow can not store. Use the long layout (float values) or to_npz.'
+    return var_names
+
+def _to_arrow_table(results: Dict[str, np.ndarray], var_types: Dict[str, type], var_names: Union[List[str], None] = None, layout: str = 'wide', rows_per_block: Union[int, None] = None) -> Any:
+    """Internal function.
+    Builds a pyarrow Table with the results. See MonteCarloSimulationEnv.to_arrow.
+    """
+    import pyarrow as pa
+    var_names = _check_export_arguments(results, var_types, var_names, layout)
+    return pa.Table.from_batches(list(_get_record_batches(results, var_names, layout, rows_per_block)))
+
+def _write_parquet(path: str, results: Dict[str, np.ndarray], var_types: Dict[str, type], var_names: Union[List[str], None] = None, layout: str = 'wide', rows_per_block: Union[int, None] = None, compression: str = 'snappy'):
+    """Internal function.
+    Writes the results to a Parquet file, one row group per block. See MonteCarloSimulationEnv.to_parquet.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    var_names = _check_export_arguments(results, var_types, var_names, layout)
+    writer = None
+    try:
+        for batch in _get_record_batches(results, var_names, layout, rows_per_block):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema, compression=compression)
+            writer.write_table(pa.Table.from_batches([batch]))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _write_npz(path: str, results: Dict[str, np.ndarray], var_types: Dict[str, type], var_names: Union[List[str], None] = None):
+    """Internal function.
+    Writes the result matrices to an uncompressed .npz file. See MonteCarloSimulationEnv.to_npz.
+    """
+    var_names = _check_export_arguments(results, var_types, var_names, 'wide', arrow=False)
+    n_subsims, n_steps = results[var_names[0]].shape
+    #str variables are stored as fixed-width unicode arrays, which (unlike object arrays) can be memory-mapped back. Other object matrices (e.g. ints out of the int64 range) are pickled.
+    arrays = {var_name: np.array(results[var_name], dtype=str) if var_types[var_name] is str else results[var_name] for var_name in var_names}
+    np.savez(path, subsim=np.arange(n_subsims, dtype=np.int64), step=np.arange(n_steps, dtype=np.int64), **arrays)
+
+def _load_npz(path: str, allow_pickle: bool = False) -> Dict[str, np.ndarray]:
+    """Internal function.
+    Loads the arrays of a .npz file. The uncompressed members without objects are memory-mapped (read-only) instead of read.
+    """
+    arrays = dict()
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+    with open(path, 'rb') as f, np.load(path, allow_pickle=allow_pickle) as npz:
+        for info in infos:
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = npz[name]
+                continue
+            #the data of a stored member starts after its local header (30 bytes + file name + extra field) and the .npy header
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or np.prod(shape) == 0:
+                assert not dtype.hasobject or allow_pickle, f'The array {name} has Python objects (e.g. ints out of the int64 range), which are only loaded with allow_pickle=True.'
+                arrays[name] = npz[name]
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+def load_results(path: str, allow_pickle: bool = False) -> Union[Dict[str, np.ndarray], Any]:
+    """Loads results exported by MonteCarloSimulationEnv.to_npz or MonteCarloSimulationEnv.to_parquet, without reading the data into memory.
+    A .npz file gives a dictionary with the 'subsim' and 'step' index arrays and the (n_subsimulations, n_steps) matrix of each variable, as read-only memory-mapped arrays. The matrices of Python objects (e.g. int variables with states out of the int64 range) are read into memory, and only with allow_pickle=True.
+    A .parquet file gives a pyarrow Table backed by a memory map of the file.
+
+    :param path: Path of a .npz or .parquet file.
+    :type path: str
+    :param allow_pickle: Allow loading the pickled object matrices of a .npz file. Only files from trusted sources should be loaded with it, since unpickling can run arbitrary code. Defaults to False.
+    :type allow_pickle: bool, optional
+    :return: Dictionary of arrays (.npz) or pyarrow Table (.parquet).
+    :rtype: Union[Dict[str, np.ndarray], pyarrow.Table]
+    """
+    assert isinstance(path, str), f'path must be a string. Given {type(path)}.'
+    assert path.endswith('.npz') or path.endswith('.parquet'), f'path must be a .npz or .parquet file. Given {path}.'
+    assert isinstance(allow_pickle, bool), f'allow_pickle must be bool. Given {type(allow_pickle)}.'
+    if path.endswith('.npz'):
+        return _load_npz(path, allow_pickle)
+    import pyarrow.parquet as pq
+    return pq.read_table(path, memory_map=True)
@@ -4,8 +4,11 @@ June-2022
 """
 
 from typing import *
+import random
+from time import perf_counter
 import numpy as np
 from pandas import DataFrame
+from randomvariable import _active_rng
 
 class ContextType():
     def __init__(self) -> None:
@@ -14,13 +17,172 @@ class ContextType():
 def _raise_read_only_exception(p1,p2,p3):
     raise Exception('Attributes of a past context are all read-only')
 
+#dtypes of the history columns. Variables of other types are stored in object columns.
+_numpy_dtypes = {int: np.int64, float: np.float64, bool: np.bool_}
+
+def _get_numpy_dtype(var_type: type) -> Union[type, np.dtype]:
+    return _numpy_dtypes.get(var_type, object)
+
+def _to_python_scalar(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+def _to_column(values: Union[List, np.ndarray], var_type: type) -> np.ndarray:
+    """Converts a sequence of states to a history column, falling back to an object column when the states do not fit the typed one (e.g. None states).
+    """
+    if any(value is None for value in values):
+        return np.array(values, dtype=object)
+    try:
+        return np.array(values, dtype=_get_numpy_dtype(var_type))
+    except OverflowError:
+        return np.array(values, dtype=object)
+
+class _SubSimulationContext(ContextType):
+    """Base class of the contexts of SubSimulationEnv objects.
+    The subclasses (one per variable schema, see _get_context_type) have a property for each variable, and the instance dictionary is the dictionary of auxiliary objects of the environment, so reading and writing attributes costs about as much as plain attribute access.
+    """
+    __slots__ = ('_env', '_states')
+
+    def __init__(self, env: 'SubSimulationEnv') -> None:
+        self._env = env
+        self._states = env._var_states
+        self.__dict__ = env._aux
+
+    def _past(self, n: int) -> ContextType:
+        """The 'past' method gives a read-only context with all states of 'n' steps back.
+        By default, the returned context is a snapshot of the step 'n' steps before the current one. With a max_past look-back buffer, the returned context is reused by all the calls with the same 'n', and is relative to the current step: it always reads the states of 'n' steps before the current one.
+        """
+        env = self._env
+        assert isinstance(n, int), f'The value of the \'n\' parameter in the \'past\' method must be integer, but type(n)={type(n)}.'
+        assert n >= 1, f'The value of the \'n\' parameter in the \'past\' method must be n>=1, but n={n}.'
+        assert n < env._steps_taken, f'The value of the \'n\' parameter in the \'past\' method must be less than the number of steps taken ({env._steps_taken}), but n={n}.'
+        if env._max_past is not None:
+            assert n <= env._max_past, f'The value of the \'n\' parameter in the \'past\' method must be at most max_past ({env._max_past}), but n={n}.'
+        else:
+            assert env._keep_history, 'The \'past\' method needs the history or a max_past look-back when keep_history=False.'
+            return _get_past_context_type(env._variables)(env, n, env._steps_taken - n)
+
+        past_context = env._past_contexts.get(n)
+        if past_context is None:
+            past_context = env._past_contexts[n] = _get_past_context_type(env._variables)(env, n)
+        return past_context
+
+    @property
+    def rng(self) -> np.random.Generator:
+        """The 'rng' attribute is the NumPy generator of the subsimulation.
+        """
+        return self._env._rng
+
+    @rng.setter
+    def rng(self, value: Any):
+        raise Exception('Attribute rng is read-only.')
+
+    def _getstate(self, var_name: str) -> Any:
+        """The 'getstate' method returns the state of a variable.
+        """
+        assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
+        assert var_name in self._states.keys(), f'variable {var_name} does not exists.'
+        return self._states[var_name]
+
+    def _setstate(self, var_name: str, var_value: Any):
+        """The 'setstate' method sets a value to a variable.
+        """
+        assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
+        assert var_name in self._states.keys(), f'variable {var_name} does not exists.'
+        setattr(self, var_name, var_value)
+
+    def __getattr__(self, var_name: str) -> Any:
+        #only called when the attribute is neither a variable nor an auxiliary object
+        raise AttributeError(f'Attribute {var_name} does not exists in the context.')
+
+def _get_method_property(method: Callable) -> property:
+    """Internal function.
+    Returns a property that gives the bound method and forbids assignments, so that a method of the context can not be replaced by an auxiliary object.
+    """
+    def set_method(contextobj, value):
+        raise Exception(f'Attribute {method.__name__[1:]} is a method.')
+    return property(method.__get__, set_method)
+
+def _get_variable_property(var_name: str, var_type: type, checked: bool = True) -> property:
+    """Internal function.
+    Returns a property that reads and writes the state of a variable, with type checking if 'checked' is True.
+    """
+    def get_state(contextobj):
+        return contextobj._states[var_name]
+    def set_state(contextobj, var_value):
+        assert isinstance(var_value, var_type), f'not allowed assignment of value {var_value} of type {type(var_value)} to variable {var_name} of type {var_type}.'
+        contextobj._states[var_name] = var_value
+    def set_state_unchecked(contextobj, var_value):
+        contextobj._states[var_name] = var_value
+    return property(get_state, set_state if checked else set_state_unchecked)
+
+class _SubSimulationPastContext(ContextType):
+    """Base class of the read-only contexts returned by the 'past' method.
+    The subclasses (one per variable schema, see _get_past_context_type) have a read-only property for each variable, which reads the look-back buffer (max_past) 'n' steps before the current step, or the history of the environment at a fixed step.
+    """
+    __slots__ = ('_env', '_n', '_step')
+
+    def __init__(self, env: 'SubSimulationEnv', n: int, step: Union[int, None] = None) -> None:
+        object.__setattr__(self, '_env', env)
+        object.__setattr__(self, '_n', n)
+        object.__setattr__(self, '_step', step)
+
+    __setattr__ = _raise_read_only_exception
+
+    def __getattr__(self, var_name: str) -> Any:
+        raise AttributeError(f'Attribute {var_name} does not exists in the context.')
+
+def _get_past_variable_property(var_name: str) -> property:
+    """Internal function.
+    Returns a read-only property that reads the state of a variable 'n' steps back.
+    """
+    def get_past_state(contextobj):
+        env = contextobj._env
+        if contextobj._step is None:
+            return env._past_buffer[var_name][(env._steps_taken - contextobj._n) % env._max_past]
+        return _to_python_scalar(env._history[var_name][contextobj._step])
+    return property(get_past_state)
+
+#context classes already built, indexed by variable schema ((variable_name, variable_type), ...) and type checking flag
+_context_types = dict()
+
+def _get_context_type(variables: List[Tuple[str, type, object]], checked: bool = True) -> type:
+    """Internal function.
+    Returns the context class of a variable schema. The class is built on the first call and reused by all the environments with the same schema.
+    If 'checked' is False, the assignments to the variables are not type checked.
+    """
+    schema = tuple((var_name, var_type) for var_name, var_type, var_default in variables)
+    assert all([var_name not in _SubSimulationContext.__slots__ for var_name, var_type in schema]), f'Names {_SubSimulationContext.__slots__} are internally reserved and forbidden for variables.'
+    if (schema, checked) not in _context_types:
+        class_content = {var_name: _get_variable_property(var_name, var_type, checked) for var_name, var_type in schema}
+        class_content['__slots__'] = ()
+        class_content['past'] = _get_method_property(_SubSimulationContext._past)
+        class_content['getstate'] = _get_method_property(_SubSimulationContext._getstate)
+        class_content['setstate'] = _get_method_property(_SubSimulationContext._setstate)
+        _context_types[(schema, checked)] = type('Context', (_SubSimulationContext,), class_content)
+    return _context_types[(schema, checked)]
+
+#read-only context classes already built, indexed by variable schema
+_past_context_types = dict()
+
+def _get_past_context_type(variables: List[Tuple[str, type, object]]) -> type:
+    """Internal function.
+    Returns the read-only context class of a variable schema, used by the 'past' method.
+    """
+    schema = tuple((var_name, var_type) for var_name, var_type, var_default in variables)
+    assert all([var_name not in _SubSimulationPastContext.__slots__ for var_name, var_type in schema]), f'Names {_SubSimulationPastContext.__slots__} are internally reserved and forbidden for variables.'
+    if schema not in _past_context_types:
+        class_content = {var_name: _get_past_variable_property(var_name) for var_name, var_type in schema}
+        class_content['__slots__'] = ()
+        _past_context_types[schema] = type('ReadOnlyContext', (_SubSimulationPastContext,), class_content)
+    return _past_context_types[schema]
+
 class SubSimulationEnv:
     """
     The SubSimulationEnv class has a basic framework to simulate a stochastic process.
     The subsimulation environment has a set of variables (each with a name, a type, and a default value), a callback function to start the simulation, and a callback function to run the simulation steps. The history of variable states is stored in the environment after the simulation.
     """
 
-    def __init__(self, variables: List[Tuple[str, type, object]], begin_function: Callable[[ContextType], None], step_function: Callable[[ContextType, int], None]) -> None:
+    def __init__(self, variables: List[Tuple[str, type, object]], begin_function: Callable[[ContextType], None], step_function: Callable[[ContextType, int], None], max_past: Union[int, None] = None, keep_history: bool = True, validate: str = 'full', rng: Union[np.random.Generator, None] = None) -> None:
         """
         :param variables: List of simulation variables in the format [(variable_name, variable_type, default_value)].
         :type variables: List[Tuple[str, type, object]]
@@ -28,14 +190,26 @@ class SubSimulationEnv:
         :type begin_function: Callable[[ContextType], None]
         :param step_function: Function to run the simulation steps.
         :type step_function: Callable[[ContextType, int], None]
+        :param max_past: Maximum 'n' of the 'past' method. If given, the last max_past states are kept in a circular buffer, from which the 'past' method reads. If None, the 'past' method reads the history. Defaults to None.
+        :type max_past: Union[int, None], optional
+        :param keep_history: If False, the history is not stored, so the memory usage does not grow with the number of steps. Defaults to True.
+        :type keep_history: bool, optional
+        :param validate: Type checking of the states. With 'full', every assignment to a variable and every logged state is type checked; with 'first_step', only the beginning callback and the first step are checked, and with 'off' nothing is checked. Defaults to 'full'.
+        :type validate: str, optional
+        :param rng: NumPy generator of the subsimulation, given to the callbacks as context.rng. The random variables and Markov chains of the library draw from it by default while the steps run. If None, a generator seeded from the global random module is created at the first run. Defaults to None.
+        :type rng: Union[np.random.Generator, None], optional
         """
         assert isinstance(variables, list), f'Argument of \'variables\' must be a list, but a {type(variables)} object was received.'
         assert all([isinstance(var_name, str) for var_name, var_type, var_default in variables]), f'\'variables\' list must be in the format [(string, type, object)].'
         assert all([isinstance(var_type, type) for var_name, var_type, var_default in variables]), f'\'variables\' list must be in the format [(string, type, object)].'
         assert all([isinstance(var_default, var_type) for var_name, var_type, var_default in variables]), f'Some default value in \'variables\' list does not correspond to its variable\'s type.'
-        assert all([var_name not in ('past', 'getstate', 'setstate') for var_name, var_type, var_default in variables]), 'Names \'past\', \'getstate\' and \'setstate\' are internally reserved and forbidden for variables.'
+        assert all([var_name not in ('past', 'getstate', 'setstate', 'rng') for var_name, var_type, var_default in variables]), 'Names \'past\', \'getstate\', \'setstate\' and \'rng\' are internally reserved and forbidden for variables.'
         assert isinstance(begin_function, Callable), f'Argument of \'begin_function\' must be a Callable, but a {type(begin_function)} object was received.'
         assert isinstance(step_function, Callable), f'Argument of \'step_function\' must be a Callable, but a {type(step_function)} object was received.'
+        assert max_past is None or (isinstance(max_past, int) and max_past > 0), f'Argument of \'max_past\' must be a positive integer or None. Given {max_past}.'
+        assert isinstance(keep_history, bool), f'Argument of \'keep_history\' must be bool. Given {type(keep_history)}.'
+        assert validate in ('full', 'first_step', 'off'), f'Argument of \'validate\' must be \'full\', \'first_step\' or \'off\'. Given {validate}.'
+        assert rng is None or isinstance(rng, np.random.Generator), f'Argument of \'rng\' must be a numpy.random.Generator or None. Given {type(rng)}.'
 
         self._variables = variables
         self._begin_function = begin_function
@@ -45,8 +219,9 @@ class SubSimulationEnv:
         #build a dictionary for mapping variable's types
         self._var_types = {var_name:var_type for var_name, var_type, var_default in variables}
 
-        #Creates an empty historic table for the variables
-        self._history = {var_name:[] for var_name, var_type, var_default in variables}
+        #Creates an empty historic table for the variables.
+        #Each variable has a preallocated column, whose first _steps_taken entries are the history.
+        self._history = {var_name:np.empty(0, dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in variables}
         
         #Creates a dictionary for states
         self._var_states = {var_name:var_default for var_name, var_type, var_default in variables}
@@ -54,6 +229,23 @@ class SubSimulationEnv:
         #Creates a dictionary for ancillary objects
         self._aux = dict()
 
+        #The context is built on the first use, see _get_context_obj.
+        #The states are type checked while _checked is True.
+        self._context = None
+        self._validate = validate
+        self._checked = validate != 'off'
+        self._rng = rng
+
+        #Look-back buffer of the last max_past states of each variable (state of step s at index s % max_past),
+        #and the read-only contexts already returned by the 'past' method, indexed by n
+        self._max_past = max_past
+        self._keep_history = keep_history
+        self._past_buffer = {var_name:[None]*max_past for var_name, var_type, var_default in variables} if max_past is not None else None
+        self._past_contexts = dict()
+
+        #RunStats object in which run_steps records the time of each phase, or None to not profile
+        self._profile = None
+
     @property
     def variables_names(self) -> List[str]:
         """
@@ -113,88 +305,66 @@ class SubSimulationEnv:
         assert var_name in self._var_states.keys(), f'Variable {var_name} does not exists in this context.'
         return self._var_states[var_name]
     
+    def _reserve_history(self, n: int):
+        """Internal method.
+        Makes sure the history columns have room for 'n' more steps. Columns grow geometrically, so repeated calls to run_steps cost amortized O(1) per step.
+        """
+        if not self._keep_history:
+            return
+        required_capacity = self._steps_taken + n
+        for var_name in self._history.keys():
+            column = self._history[var_name]
+            if column.shape[0] < required_capacity:
+                new_column = np.empty(max(required_capacity, 2*column.shape[0]), dtype=column.dtype)
+                new_column[:self._steps_taken] = column[:self._steps_taken]
+                self._history[var_name] = new_column
+
     def _log_states(self):
         """Internal method. 
         Push current states in _var_states to the historic table _history.
         """
+        if not self._checked:
+            self._log_states_unchecked()
+            return
         for var_name, var_type, var_default in self._variables:
             var_state = self._var_states[var_name]
             assert isinstance(var_state, var_type) or isinstance(var_state, type(None))
-            self._history[var_name].append(self._var_states[var_name])
+            if self._max_past is not None:
+                self._past_buffer[var_name][self._steps_taken % self._max_past] = var_state
+            if not self._keep_history:
+                continue
+            column = self._history[var_name]
+            if column.dtype != object and (var_state is None or (var_type is int and not -2**63 <= var_state < 2**63)):
+                #the state does not fit the typed column, so the column falls back to object
+                column = self._history[var_name] = column.astype(object)
+            column[self._steps_taken] = var_state
+
+    def _log_states_unchecked(self):
+        """Internal method.
+        Same as _log_states, but without type checking (validate='off', or after the first step with validate='first_step').
+        """
+        for var_name, var_state in self._var_states.items():
+            if self._max_past is not None:
+                self._past_buffer[var_name][self._steps_taken % self._max_past] = var_state
+            if self._keep_history:
+                column = self._history[var_name]
+                try:
+                    column[self._steps_taken] = var_state
+                except OverflowError:
+                    #the int state does not fit the typed column, so the column falls back to object
+                    column = self._history[var_name] = column.astype(object)
+                    column[self._steps_taken] = var_state
 
     def _get_context_obj(self) -> ContextType:
         """Internal method.
-        Build dinamically a ContexType subclass that provides access to states in _var_states
-        and returns a instance of it.
+        Returns the context of the environment. It is an instance of the context class of the variable schema, built once and reused in all the steps.
 
         Returns:
-            ContextType: New ContexType object.
+            ContextType: ContexType object.
         """
-        def _get_past_method(contextobj: ContextType):
-            """The 'past' method gives a read-only context with all states of 'n' steps back.
-            """
-            def past(n):
-                assert isinstance(n, int), f'The value of the \'n\' parameter in the \'past\' method must be integer, but type(n)={type(n)}.'
-                assert n >= 1, f'The value of the \'n\' parameter in the \'past\' method must be n>=1, but n={n}.'
-                assert n < self._steps_taken, f'The value of the \'n\' parameter in the \'past\' method must be less than the number of steps taken ({self._steps_taken}), but n={n}.'
-                
-                past_context_content = {var_name:self._history[var_name][-n] for var_name in self._history.keys()}
-                past_context_content['__setattr__'] = _raise_read_only_exception
-                
-                MyReadOnlyContextType = type(f'ReadOnlyContext{id(contextobj)}', (ContextType,), past_context_content)
-
-                return MyReadOnlyContextType()
-            return past
-
-        def _get_getstate_method(contextobj: ContextType):
-            """The 'getstate' method returns the state of a variable.
-            """
-            def getstate(var_name):
-                assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
-                assert var_name in self._var_states.keys(), f'variable {var_name} does not exists.'
-                return self._var_states[var_name]
-            return getstate
-        
-        def _get_setstate_method(contextobj: ContextType):
-            """The 'setstate' method sets a value to a variable.
-            """
-            def setstate(var_name, var_value):
-                assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
-                assert var_name in self._var_states.keys(), f'variable {var_name} does not exists.'
-                assert isinstance(var_value, self._var_types[var_name]), f'not allowed assignment of value {var_value} of type {type(var_value)} to variable {var_name} of type {self._var_types[var_name]}.'
-                assert var_name != 'past', f'past is a method, not a variable.'
-                self._var_states[var_name] = var_value
-            return setstate
-
-        def _set_attribute(contextobj, var_name, var_value):
-            if var_name in self._var_states.keys():
-                assert isinstance(var_value, self._var_types[var_name]), f'not allowed assignment of value {var_value} of type {type(var_value)} to variable {var_name} of type {self._var_types[var_name]}.'
-                self._var_states[var_name] = var_value
-            elif var_name in ('past', 'getattr', 'setattr'):
-                raise Exception(f'Attribute {var_name} is a method.')
-            else:
-                self._aux[var_name] = var_value
-
-        def _get_attribute(contextobj, var_name):
-            if var_name == 'past': #call to the past method
-                return _get_past_method(contextobj)
-            elif var_name == 'getstate': #call to the getstate method
-                return _get_getstate_method(contextobj)
-            elif var_name == 'setstate': #call to the setstate method
-                return _get_setstate_method(contextobj)
-            elif var_name in self._var_states.keys(): #get variable state
-                return self._var_states[var_name]
-            elif var_name in self._aux.keys(): #get aux object
-                return self._aux[var_name]
-            else:
-                raise Exception(f'Attribute {var_name} does not exists in the context.')
-
-        MyContextType = type(f'Context{id(self)}', (ContextType,), {
-            '__setattr__': _set_attribute,
-            '__getattribute__': _get_attribute
-        })
-
-        return MyContextType()
+        if self._context is None:
+            self._context = _get_context_type(self._variables, self._checked)(self)
+        return self._context
 
     def _prepare(self):
         """Internal method.
@@ -221,19 +391,129 @@ class SubSimulationEnv:
         assert isinstance(n, int)
         assert n > 0
 
+        self._reserve_history(n)
+        if self._rng is None:
+            self._rng = np.random.default_rng(random.getrandbits(128))
+        #the random variables and Markov chains of the library draw from the generator of this subsimulation while it runs
+        rng_token = _active_rng.set(self._rng)
+        try:
+            if self._profile is None:
+                self._run_steps(n)
+            else:
+                self._run_steps_profiled(n, self._profile)
+        finally:
+            _active_rng.reset(rng_token)
+
+    def _run_steps(self, n: int):
+        """Internal method.
+        Calls the beginning callback and runs 'n' steps, logging the states.
+        """
         self._prepare()
-        for step in range(n):
+        first_step = 0
+        if self._validate == 'first_step' and self._checked:
+            #the first step is type checked, and the next ones use the unchecked context
+            self._run_step(0)
+            self._log_states()
+            self._steps_taken += 1
+            self._checked = False
+            self._context = None
+            first_step = 1
+        for step in range(first_step, n):
             self._run_step(step)
             self._log_states()
             self._steps_taken += 1
 
+    def _run_step_range(self, first_step: int, last_step: int):
+        """Internal method.
+        Runs the steps first_step to last_step-1 of a subsimulation that is run in parts (the beginning callback is called before the step 0), logging the states.
+        The history must already have room for them.
+        """
+        rng_token = _active_rng.set(self._rng)
+        try:
+            if first_step == 0:
+                self._prepare()
+            for step in range(first_step, last_step):
+                self._run_step(step)
+                self._log_states()
+                self._steps_taken += 1
+                if step == 0 and self._validate == 'first_step' and self._checked:
+                    #the first step is type checked, and the next ones use the unchecked context
+                    self._checked = False
+                    self._context = None
+        finally:
+            _active_rng.reset(rng_token)
+
+    def _run_steps_profiled(self, n: int, stats: 'RunStats'):
+        """Internal method.
+        Same as _run_steps, but records the wall time of the beginning callback, of the step callbacks, of the context dispatch and of the logging in 'stats'.
+        A single clock reading separates two consecutive phases, so the profiling costs three readings per step.
+        """
+        t0 = perf_counter()
+        context = self._get_context_obj()
+        t1 = perf_counter()
+        self._begin_function(context)
+        t2 = perf_counter()
+        stats.add('context', t1 - t0)
+        stats.add('begin', t2 - t1)
+        context_time, step_time, logging_time = 0.0, 0.0, 0.0
+        t_end = t2
+        for step in range(n):
+            context = self._get_context_obj()
+            t_start = perf_counter()
+            self._step_function(context, step)
+            t_step = perf_counter()
+            self._log_states()
+            self._steps_taken += 1
+            if step == 0 and self._validate == 'first_step' and self._checked:
+                #the first step is type checked, and the next ones use the unchecked context
+                self._checked = False
+                self._context = None
+            t_log = perf_counter()
+            context_time += t_start - t_end
+            step_time += t_step - t_start
+            logging_time += t_log - t_step
+            t_end = t_log
+        stats.add('context', context_time, n)
+        stats.add('step', step_time, n)
+        stats.add('logging', logging_time, n)
+
+    def _load_history(self, history: Dict[str, Union[List, np.ndarray]], var_states: Dict[str, Any]):
+        """Internal method.
+        Replaces the historic table and the current states by the ones of a subsimulation that was run elsewhere (e.g. in a worker process).
+        """
+        assert set(history.keys()) == set(self._history.keys()), 'The loaded history must have the same variables as the environment.'
+        self._history = {var_name: _to_column(history[var_name], self._var_types[var_name]) for var_name in self._history.keys()}
+        self._var_states.update({var_name: var_states[var_name] for var_name in self._var_states.keys()})
+        self._steps_taken = len(next(iter(self._history.values()))) if len(self._history) > 0 else 0
+
+    def _attach_history(self, columns: Dict[str, np.ndarray], steps_taken: int = 0, var_states: Union[Dict[str, Any], None] = None):
+        """Internal method.
+        Makes the environment store its history in externally owned 1D arrays (e.g. rows of a result matrix), whose first 'steps_taken' entries are already filled.
+        The arrays are used while they have enough room, so the history is written into them without copies.
+        """
+        assert set(columns.keys()) == set(self._history.keys()), 'The attached columns must have the same variables as the environment.'
+        self._history = {var_name: columns[var_name] for var_name in self._history.keys()}
+        self._steps_taken = steps_taken
+        if var_states is not None:
+            self._var_states.update({var_name: var_states[var_name] for var_name in self._var_states.keys()})
+
+    def _get_column_view(self, var_name: str) -> np.ndarray:
+        """Internal method.
+        Returns a read-only view of the filled part of a history column.
+        """
+        assert self._keep_history, 'The history is not stored when keep_history=False.'
+        view = self._history[var_name][:self._steps_taken]
+        view.flags.writeable = False
+        return view
+
     def get_history(self) -> Dict[str, List]:
         """Returns a copy of the historic dictionary.
 
         :return: historic dictionary in the format {variable_name: variable_history}.
         :rtype: Dict[str, List]
         """
-        return {var_name: self._history[var_name].copy() for var_name in self._history.keys()}
+        assert self._keep_history, 'The history is not stored when keep_history=False.'
+        return {var_name: self._history[var_name][:self._steps_taken].tolist() for var_name in self._history.keys()}
 
     def get_variable_history(self, var_name: str) -> List:
         """Get a copy of the historic of a specific variable.
@@ -245,17 +525,21 @@ class SubSimulationEnv:
         """
         assert isinstance(var_name, str), f'Argument of var_name must be string. Given {type(var_name)}.'
         assert var_name in self._history.keys(), f'Variable {var_name} does not exists.'
-        return self._history[var_name].copy()
+        assert self._keep_history, 'The history is not stored when keep_history=False.'
+        return self._history[var_name][:self._steps_taken].tolist()
 
     def get_variable_numpy_history(self, var_name: str) -> np.ndarray:
-        """Get the historic of a specific variable as a NumPy array.
+        """Get the historic of a specific variable as a read-only NumPy array.
+        The array is a view of the history storage, so no copy is made. Variables that are not int, float or bool have object arrays.
 
         :param var_name: variable's name.
         :type var_name: str
         :return: variable state history.
         :rtype: np.ndarray
         """
-        return np.array(self.get_variable_history(var_name))
+        assert isinstance(var_name, str), f'Argument of var_name must be string. Given {type(var_name)}.'
+        assert var_name in self._history.keys(), f'Variable {var_name} does not exists.'
+        return self._get_column_view(var_name)
 
     def get_history_dataframe(self) -> DataFrame:
         """Get variables history as a Pandas DataFrame.
@@ -263,12 +547,13 @@ class SubSimulationEnv:
         :return: historic DataFrame.
         :rtype: DataFrame
         """
-        return DataFrame(self._history)
+        assert self._keep_history, 'The history is not stored when keep_history=False.'
+        return DataFrame({var_name: self._history[var_name][:self._steps_taken] for var_name in self._history.keys()})
    
     def get_numpy_history(self) -> Dict[str, np.ndarray]:
-        """Get variables history as a dictionary of NumPy arrays.
+        """Get variables history as a dictionary of read-only NumPy arrays (views of the history storage).
 
         :return: variables history in the format {variable_name: variable_history}.
         :rtype: Dict[str, np.ndarray]
         """
-        return {var_name:np.array(self._history[var_name]) for var_name in self._history.keys()}
\ No newline at end of file
+        return {var_name:self._get_column_view(var_name) for var_name in self._history.keys()}
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import random
+import numpy as np
+from randomvariable import _active_rng
+from subsimulation import SubSimulationEnv, ContextType, _get_numpy_dtype
+from montecarlosimulation import MonteCarloSimulationEnv, _get_global_random_states, _set_global_random_states
+
+#dtype kinds accepted in the assignment of each variable type
+_allowed_kinds = {int: 'iub', float: 'f', bool: 'b', str: 'UO'}
+
+class _VectorizedContext(ContextType):
+    """Context of a VectorizedMonteCarloSimulationEnv.
+    Variables are NumPy arrays with one state for each subsimulation.
+    """
+    def __init__(self, env: 'VectorizedMonteCarloSimulationEnv') -> None:
+        object.__setattr__(self, '_env', env)
+
+    def past(self, n: int) -> ContextType:
+        """The 'past' method gives a read-only context with all states of 'n' steps back.
+        """
+        env = object.__getattribute__(self, '_env')
+        assert isinstance(n, int), f'The value of the \'n\' parameter in the \'past\' method must be integer, but type(n)={type(n)}.'
+        assert n >= 1, f'The value of the \'n\' parameter in the \'past\' method must be n>=1, but n={n}.'
+        assert n < env._steps_taken, f'The value of the \'n\' parameter in the \'past\' method must be less than the number of steps taken ({env._steps_taken}), but n={n}.'
+
+        past_states = dict()
+        for var_name in env._states.keys():
+            past_states[var_name] = env._results[var_name][:, env._steps_taken - n].view()
+            past_states[var_name].flags.writeable = False
+        return _VectorizedPastContext(past_states)
+
+    @property
+    def rng(self) -> np.random.Generator:
+        """The 'rng' attribute is the NumPy generator of the simulation.
+        """
+        return object.__getattribute__(self, '_env')._rng
+
+    def getstate(self, var_name: str) -> np.ndarray:
+        """The 'getstate' method returns the states of a variable.
+        """
+        env = object.__getattribute__(self, '_env')
+        assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
+        assert var_name in env._states.keys(), f'variable {var_name} does not exists.'
+        return env._states[var_name]
+
+    def setstate(self, var_name: str, var_value: Any):
+        """The 'setstate' method sets the states of a variable.
+        """
+        env = object.__getattribute__(self, '_env')
+        assert isinstance(var_name, str), f'var_name must be a string. Given {var_name} of type {type(var_name)}.'
+        assert var_name in env._states.keys(), f'variable {var_name} does not exists.'
+        env._set_state(var_name, var_value)
+
+    def __getattr__(self, var_name: str) -> Any:
+        env = object.__getattribute__(self, '_env')
+        if var_name in env._states.keys(): #get variable states
+            return env._states[var_name]
+        elif var_name in env._aux.keys(): #get aux object
+            return env._aux[var_name]
+        else:
+            raise AttributeError(f'Attribute {var_name} does not exists in the context.')
+
+    def __setattr__(self, var_name: str, var_value: Any):
+        env = object.__getattribute__(self, '_env')
+        if var_name in env._states.keys():
+            env._set_state(var_name, var_value)
+        elif var_name in ('past', 'getstate', 'setstate'):
+            raise Exception(f'Attribute {var_name} is a method.')
+        elif var_name == 'rng':
+            raise Exception('Attribute rng is read-only.')
+        else:
+            env._aux[var_name] = var_value
+
+class _VectorizedPastContext(ContextType):
+    """Read-only context with the states of all subsimulations at a past step.
+    """
+    def __init__(self, past_states: Dict[str, np.ndarray]) -> None:
+        object.__setattr__(self, '_past_states', past_states)
+
+    def __getattr__(self, var_name: str) -> np.ndarray:
+        past_states = object.__getattribute__(self, '_past_states')
+        if var_name in past_states.keys():
+            return past_states[var_name]
+        raise AttributeError(f'Attribute {var_name} does not exists in the context.')
+
+    def __setattr__(self, var_name: str, var_value: Any):
+        raise Exception('Attributes of a past context are all read-only')
+
+class VectorizedMonteCarloSimulationEnv(MonteCarloSimulationEnv):
+    """
+    The VectorizedMonteCarloSimulationEnv class runs the same kind of simulation as MonteCarloSimulationEnv, but advances all the subsimulations at once.
+    The variables of the context are NumPy arrays of shape (n_subsimulations,), so the callbacks are called only once per step, and must operate on whole arrays.
+    The auxiliary objects are shared by all the subsimulations.
+    Since the subsimulations are all run at once, run_until (which adds subsimulations batch by batch) raises a TypeError, and replay_subsim runs the whole simulation again.
+    """
+
+    def __init__(self, variables: List[Tuple[str, type, Union[str, int, float, bool]]], n_subsimulations: int, n_steps: int, seed: Union[int, None] = None) -> None:
+        """
+        :param variables: List of simulation variables in the format [(variable_name, variable_type, default_value)].
+        :type variables: List[Tuple[str, type, Union[str, int, float, bool]]]
+        :param n_subsimulations: Number of subsimulations.
+        :type n_subsimulations: int
+        :param n_steps: Number of steps per subsimulation.
+        :type n_steps: int
+        :param seed: Seed of the global random generators during the run. If None, it is drawn from the global random module. Defaults to None.
+        :type seed: Union[int, None], optional
+        """
+        super().__init__(variables, n_subsimulations, n_steps, seed)
+        self._var_types = {var_name:var_type for var_name, var_type, var_default in variables}
+        self._states = None
+        self._aux = None
+        self._rng = None
+        self._steps_taken = 0
+
+    def _set_state(self, var_name: str, var_value: Any):
+        """Internal method.
+        Assigns a value (an array or a scalar to be broadcast) to the states of a variable.
+        """
+        var_type = self._var_types[var_name]
+        value = np.asarray(var_value)
+        assert value.dtype.kind in _allowed_kinds[var_type], f'not allowed assignment of values of dtype {value.dtype} to variable {var_name} of type {var_type}.'
+        assert value.ndim == 0 or value.shape == (self._n_subsims,), f'variable {var_name} must be assigned a scalar or an array of shape ({self._n_subsims},). Given shape {value.shape}.'
+        self._states[var_name] = np.array(np.broadcast_to(value, (self._n_subsims,)), dtype=_get_numpy_dtype(var_type))
+
+    def run(self, show_progress: bool = True):
+        """Run all the subsimulations at once.
+
+        :param show_progress: Enable progress bar, defaults to True
+        :type show_progress: bool, optional
+        """
+        for steps in self._run_step_blocks(self._n_steps, show_progress):
+            pass
+
+    def iter_run(self, batch_subsims: Union[int, None] = None, batch_steps: Union[int, None] = None) -> Iterator[Tuple[List[int], range, Dict[str, np.ndarray]]]:
+        """Runs all the subsimulations at once, as a generator that yields the partial results after each block of steps.
+        All the subsimulations are run together, batch_steps steps at a time, and after each block the generator yields a tuple (subsim_indexes, steps, histories) as MonteCarloSimulationEnv.iter_run, where subsim_indexes are all the subsimulations.
+        No subsimulation is complete before the last block, so the statistics methods are calculated over no subsimulations until then, and if the generator is closed before the end (e.g. by a break), the simulation is left as not run.
+        The global random states of the simulation are kept apart from the ones of the caller between the blocks, so the outcomes are the same as the ones of run for any batch_steps.
+
+        :param batch_subsims: Must be None, since all the subsimulations are run at once. Defaults to None.
+        :type batch_subsims: Union[int, None], optional
+        :param batch_steps: Number of steps run at once. If None, n_steps (the generator yields once). Defaults to None.
+        :type batch_steps: Union[int, None], optional
+        :return: Generator of tuples in the format (subsim_indexes, steps, histories).
+        :rtype: Iterator[Tuple[List[int], range, Dict[str, np.ndarray]]]
+        """
+        assert batch_subsims is None, 'The subsimulations of a VectorizedMonteCarloSimulationEnv are all run at once, so batch_subsims must be None.'
+        assert batch_steps is None or (isinstance(batch_steps, int) and batch_steps > 0), f'batch_steps must be a positive integer or None. Given {batch_steps}.'
+
+        subsim_indexes = list(range(self._n_subsims))
+        for steps in self._run_step_blocks(min(batch_steps, self._n_steps) if batch_steps is not None else self._n_steps, False):
+            blocks = dict()
+            for var_name in self._results.keys():
+                blocks[var_name] = self._results[var_name][:, steps.start:steps.stop].view()
+                blocks[var_name].flags.writeable = False
+            yield subsim_indexes, steps, blocks
+
+    def run_until(self, var_name: str, *args, **kwargs) -> Tuple[float, Tuple[float, float]]:
+        """Raises a TypeError, since the subsimulations of a VectorizedMonteCarloSimulationEnv are all run at once, so their number can not grow batch by batch (see the class docstring).
+        """
+        raise TypeError('run_until is not supported by VectorizedMonteCarloSimulationEnv, since its subsimulations are all run at once. Use run with a fixed n_subsimulations, or MonteCarloSimulationEnv.run_until.')
+
+    def replay_subsim(self, subsim_index: int) -> SubSimulationEnv:
+        """Runs the simulation again, with the same seed, and returns the SubSimulationEnv of a specific subsimulation (as get_subsim_env).
+        The subsimulations share the random generators, so the whole simulation is run again (in a separate environment, so the results of this one are kept).
+        The outcomes are the same as in the run, unless the callbacks depend on something other than the seeded generators (context.rng, and the global random and numpy.random states).
+
+        :param subsim_index: subsimulation index (starting at 0).
+        :type subsim_index: int
+        :return: SubSimulationEnv object.
+        :rtype: SubSimulationEnv
+        """
+        assert isinstance(self._subsim_begin_function, Callable), 'Begin callback is not defined.'
+        assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+        assert isinstance(subsim_index, int) and 0 <= subsim_index < self._n_subsims, f'subsim_index must be an integer in [0, {self._n_subsims}). Given {subsim_index}.'
+        env = VectorizedMonteCarloSimulationEnv(self._variables, self._n_subsims, self._n_steps, self._entropy)
+        env.set_subsim_begin_callback(self._subsim_begin_function)
+        env.set_subsim_step_callback(self._subsim_step_function)
+        env.run(show_progress=False)
+        return env.get_subsim_env(subsim_index)
+
+    def _run_step_blocks(self, batch_steps: int, show_progress: bool) -> Iterator[range]:
+        """Internal method.
+        Runs all the subsimulations at once, as a generator that yields the range of steps of each block of batch_steps steps after running it.
+        The global random generators are seeded from the simulation seed, and the states of the caller are restored after each block.
+        """
+        assert isinstance(self._subsim_begin_function, Callable), 'Begin callback is not defined.'
+        assert isinstance(self._subsim_step_function, Callable), 'Step callback is not defined.'
+
+        if show_progress:
+            from tqdm import tqdm
+
+        caller_random_states = _get_global_random_states()
+        seed_state = np.random.SeedSequence(self._entropy).generate_state(4)
+        random.seed(int.from_bytes(seed_state.tobytes(), 'little'))
+        np.random.seed(seed_state)
+        random_states = _get_global_random_states()
+        _set_global_random_states(caller_random_states)
+        #child stream of the simulation seed, used by context.rng and, by default, by the random variables and Markov chains of the library
+        self._rng = np.random.default_rng(np.random.SeedSequence(self._entropy).spawn(1)[0])
+
+        #the histories are column-major, so that the states of a step are contiguous
+        self._results = {var_name: np.empty((self._n_subsims, self._n_steps), dtype=_get_numpy_dtype(var_type), order='F') for var_name, var_type, var_default in self._variables}
+        self._states = {var_name: np.full(self._n_subsims, var_default, dtype=_get_numpy_dtype(var_type)) for var_name, var_type, var_default in self._variables}
+        self._aux = dict()
+        self._steps_taken = 0
+
+        context = _VectorizedContext(self)
+        progress_bar = tqdm(total=self._n_steps) if show_progress else None
+        #the subsimulations are complete only after the last step
+        self._n_partial_subsims = 0
+        try:
+            for first_step in range(0, self._n_steps, batch_steps):
+                steps = range(first_step, min(first_step+batch_steps, self._n_steps))
+                caller_random_states = _get_global_random_states()
+                _set_global_random_states(random_states)
+                rng_token = _active_rng.set(self._rng)
+                try:
+                    if first_step == 0:
+                        self._subsim_begin_function(context)
+                    for step in steps:
+                        self._subsim_step_function(context, step)
+                        for var_name in self._states.keys():
+                            self._results[var_name][:, step] = self._states[var_name]
+                        self._steps_taken += 1
+                finally:
+                    _active_rng.reset(rng_token)
+                    random_states = _get_global_random_states()
+                    _set_global_random_states(caller_random_states)
+                if progress_bar is not None:
+                    progress_bar.update(len(steps))
+                if steps.stop == self._n_steps:
+                    self._n_partial_subsims = None
+                yield steps
+        finally:
+            if self._n_partial_subsims is not None:
+                self._truncate_results(0)
+                self._n_partial_subsims = None
+            if progress_bar is not None:
+                progress_bar.close()
+
+    @property
+    def auxiliary_objects(self) -> Dict[str, Any]:
+        """Returns a dictionary with all the auxiliary objects.
+
+        :return: Dictionary in the format {attribute_name: object}.
+        :rtype: Dict[str, Any]
+        """
+        return self._aux.copy()
+
+    def get_subsim_env(self, subsim_index: int) -> SubSimulationEnv:
+        """Returns a SubSimulationEnv with the history and the final states of a specific subsimulation.
+        The returned environment does not hold auxiliary objects, since they are shared by all the subsimulations.
+
+        :param subsim_index: subsimulation index (starting at 0).
+        :type subsim_index: int
+        :return: SubSimulationEnv object.
+        :rtype: SubSimulationEnv
+        """
+        assert subsim_index < self._n_subsims, f'subsim_index must be less than the number of subsimulations.'
+        env = SubSimulationEnv(self._variables, self._subsim_begin_function, self._subsim_step_function)
+        env._load_history({var_name: self._results[var_name][subsim_index] for var_name in self._results.keys()},
+                          {var_name: self._states[var_name][subsim_index:subsim_index+1].tolist()[0] for var_name in self._states.keys()})
+        return env
@@ -0,0 +1,59 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv
+from pymcsl.jitkernel import _run_kernels
+
+N_SUBSIMS = 200
+N_STEPS = 50
+VARIABLES = [('x', float, 0.0), ('n', int, 0), ('b', bool, False)]
+
+def begin_kernel(state, rng):
+    state.x = rng.uniform(-1.0, 1.0)
+
+def step_kernel(state, step, rng):
+    state.x += rng.normal(0.0, 2.0) + rng.exponential(0.5) - rng.standard_normal()
+    state.n += rng.integers(-3, 4)
+    state.b = rng.random() < 0.3
+
+if __name__ == '__main__':
+    #results with the interpreted loop, which is also the loop without numba
+    interpreted = _run_kernels(VARIABLES, begin_kernel, step_kernel, N_STEPS, 0, list(range(N_SUBSIMS)), compiled=False)
+    #the subsimulations only depend on the seed and their indexes, not on the blocks they are run in
+    part = _run_kernels(VARIABLES, begin_kernel, step_kernel, N_STEPS, 0, [150, 3], compiled=False)
+    for var_name, var_type, var_default in VARIABLES:
+        assert np.array_equal(part[var_name], interpreted[var_name][[150, 3]]), var_name
+    #the streams of the subsimulations are not repeated
+    assert len(np.unique(interpreted['x'][:, -1])) == N_SUBSIMS
+    assert abs(np.mean(interpreted['b']) - 0.3) < 0.02
+    assert set(np.unique(np.diff(interpreted['n'], axis=1))) == set(range(-3, 4))
+    print('interpreted loop ok')
+
+    try:
+        import numba
+    except ImportError:
+        numba = None
+    if numba is None:
+        print('numba is not installed, compiled loop skipped')
+    else:
+        compiled = _run_kernels(VARIABLES, begin_kernel, step_kernel, N_STEPS, 0, list(range(N_SUBSIMS)))
+        for var_name, var_type, var_default in VARIABLES:
+            assert compiled[var_name].dtype == interpreted[var_name].dtype
+            assert np.allclose(compiled[var_name], interpreted[var_name], rtol=1e-12, atol=0), var_name
+        print('compiled loop ok')
+
+    #a simulation with the kernels, its replays and another seed
+    env = MonteCarloSimulationEnv(VARIABLES, N_SUBSIMS, N_STEPS, seed=0)
+    env.set_subsim_begin_callback(begin_kernel, jit=True)
+    env.set_subsim_step_callback(step_kernel, jit=True)
+    env.run(show_progress=False)
+    for var_name, var_type, var_default in VARIABLES:
+        assert np.allclose(env.get_variable_histories(var_name), interpreted[var_name], rtol=1e-12, atol=0), var_name
+        assert np.array_equal(env.replay_subsim(17).get_variable_history(var_name), env.get_variable_histories(var_name)[17]), var_name
+    other = _run_kernels(VARIABLES, begin_kernel, step_kernel, N_STEPS, 1, list(range(N_SUBSIMS)), compiled=False)
+    assert not np.any(other['x'][:, -1] == interpreted['x'][:, -1])
+    print('simulation ok')
@@ -0,0 +1,47 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+import pymcsl
+import montecarlosimulation
+from pymcsl import MonteCarloSimulationEnv
+
+STATS = ['mean', 'var', 'std', 'min', 'max', 'sum', 'median', 'p10', 'p99.5']
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+
+def stepf(context, step):
+    context.x += context.rng.normal()
+    context.n += int(context.rng.integers(-10, 11))
+    context.b = bool(context.rng.random() < 0.4)
+
+def getter(env: MonteCarloSimulationEnv, var_name: str, statistic: str, domain: Union[str, None]) -> Union[np.ndarray, float]:
+    """Value of a statistic calculated by the individual getter."""
+    if statistic == 'median':
+        return env.get_variable_median(var_name, domain)
+    if statistic.startswith('p'):
+        return env.get_variable_quantiles(var_name, float(statistic[1:])/100, domain)
+    return getattr(env, f'get_variable_{statistic}')(var_name, domain)
+
+if __name__ == '__main__':
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0), ('b', bool, False)], 300, 40, seed=0)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    env.run(show_progress=False)
+
+    #with blocks of 3 steps, and with a single block
+    for block_values in (900, montecarlosimulation._memmap_block_values):
+        montecarlosimulation._memmap_block_values = block_values
+        for domain in ('step', 'subsim', None):
+            description = env.describe(stats=STATS, domain=domain)
+            for var_name in ('x', 'n', 'b'):
+                for statistic in STATS:
+                    assert np.allclose(description[var_name][statistic], getter(env, var_name, statistic, domain), rtol=1e-10, atol=1e-10), (var_name, statistic, domain)
+                    assert np.shape(description[var_name][statistic]) == np.shape(getter(env, var_name, statistic, domain)), (var_name, statistic, domain)
+            print(block_values, domain, 'ok')
@@ -0,0 +1,65 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import random
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, DiscreteRandomVariable
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.s = ''
+    context.die = DiscreteRandomVariable({k: 1 for k in range(1, 7)})
+
+def stepf(context, step):
+    context.x += context.rng.normal() + np.random.random()
+    context.n += context.die.evaluate() + random.randint(0, 1)
+    context.s = 'ab'[context.n % 2] + context.s[:3]
+
+def rng_stepf(context, step):
+    context.x += context.rng.normal()
+    context.n += context.die.evaluate()
+
+def build_env(step_function: Callable = stepf) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0), ('s', str, '')], 60, 15, seed=0)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(step_function)
+    return env
+
+def get_histories(env: MonteCarloSimulationEnv) -> Dict[str, list]:
+    """Histories of all the subsimulations, as lists."""
+    return {var_name: [env.get_subsim_env(i).get_variable_history(var_name) for i in range(60)] for var_name in ('x', 'n', 's')}
+
+if __name__ == '__main__':
+    serial = build_env()
+    serial.run(show_progress=False)
+    expected = get_histories(serial)
+    for run_kwargs in [dict(backend='process', n_workers=1), dict(backend='process', n_workers=3), dict(backend='process', n_workers=2, chunk_size=7), dict(backend='process', n_workers=2, start_method='spawn')]:
+        env = build_env()
+        env.run(show_progress=False, **run_kwargs)
+        assert get_histories(env) == expected, run_kwargs
+        for statistic in ('mean', 'var', 'min', 'max', 'sum'):
+            assert np.array_equal(getattr(env, f'get_variable_{statistic}')('x'), getattr(serial, f'get_variable_{statistic}')('x')), (run_kwargs, statistic)
+        print(run_kwargs, 'ok')
+
+    #the thread backend is only reproducible if the callbacks draw from context.rng
+    rng_serial = build_env(rng_stepf)
+    rng_serial.run(show_progress=False)
+    for run_kwargs in [dict(backend='thread', n_workers=4), dict(backend='thread', n_workers=2, chunk_size=5), dict(backend='process', n_workers=2)]:
+        env = build_env(rng_stepf)
+        env.run(show_progress=False, **run_kwargs)
+        assert get_histories(env) == get_histories(rng_serial), run_kwargs
+        print(run_kwargs, 'ok')
+
+    #the caller's global random states are not changed by the runs
+    random.seed(1)
+    np.random.seed(1)
+    expected_draws = (random.random(), np.random.random())
+    random.seed(1)
+    np.random.seed(1)
+    build_env().run(show_progress=False, backend='process', n_workers=2)
+    assert (random.random(), np.random.random()) == expected_draws
+    print('global random states ok')
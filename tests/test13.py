@@ -0,0 +1,71 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, OnlineStatistics
+
+STATISTICS = ('mean', 'var', 'std', 'min', 'max', 'sum')
+VARIABLES = [('x', float, 0.0), ('n', int, 0), ('b', bool, False), ('s', str, '')]
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+    context.s = ''
+
+def stepf(context, step):
+    context.x += context.rng.normal(1.0, 3.0)
+    context.n += int(context.rng.integers(-2, 5))
+    context.b = bool(context.rng.random() < 0.5)
+    context.s = str(context.n)
+
+def build_env(seed: int = 0, **kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv(VARIABLES, 250, 30, seed=seed, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+def assert_raises(function: Callable):
+    try:
+        function()
+    except AssertionError:
+        return
+    assert False, 'An AssertionError was expected.'
+
+if __name__ == '__main__':
+    in_memory = build_env()
+    in_memory.run(show_progress=False)
+
+    for env_kwargs, run_kwargs in [(dict(), dict()), (dict(), dict(chunk_size=7)), (dict(), dict(backend='process', n_workers=2)), (dict(online_stats=['x']), dict())]:
+        online = build_env(keep_history=False, **env_kwargs)
+        online.run(show_progress=False, **run_kwargs)
+        var_names = env_kwargs.get('online_stats', ['x', 'n', 'b'])
+        for var_name in var_names:
+            for statistic in STATISTICS:
+                for domain in ('step', 'subsim', None):
+                    result = getattr(online, f'get_variable_{statistic}')(var_name, domain)
+                    expected = getattr(in_memory, f'get_variable_{statistic}')(var_name, domain)
+                    assert np.shape(result) == np.shape(expected), (var_name, statistic, domain)
+                    assert np.allclose(result, expected, rtol=1e-10, atol=1e-10), (var_name, statistic, domain)
+        #the histories are not stored, and the variables without accumulators have no statistics
+        assert_raises(lambda: online.get_variable_histories('x'))
+        for var_name in {'x', 'n', 'b'} - set(var_names):
+            assert_raises(lambda: online.get_variable_mean(var_name))
+        print(env_kwargs, run_kwargs, 'ok')
+
+    #the accumulators of two runs merge into the ones of both
+    first, second, second_in_memory = build_env(keep_history=False), build_env(1, keep_history=False), build_env(1)
+    first.run(show_progress=False)
+    second.run(show_progress=False)
+    merged = OnlineStatistics(30)
+    merged.merge(first.get_online_statistics('x'))
+    merged.merge(second.get_online_statistics('x'))
+    second_in_memory.run(show_progress=False)
+    histories = np.concatenate([in_memory.get_variable_histories('x'), second_in_memory.get_variable_histories('x')])
+    assert merged.count == 500
+    assert np.allclose(merged.mean, np.mean(histories, axis=0)) and np.allclose(merged.var, np.var(histories, axis=0))
+    assert np.allclose(merged.min, np.min(histories, axis=0)) and np.allclose(merged.max, np.max(histories, axis=0))
+    print('merge ok')
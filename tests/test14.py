@@ -0,0 +1,84 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, SubSimulationEnv
+
+MAX_PAST = 3
+VARIABLES = [('x', float, 0.0), ('n', int, 0), ('s', str, '')]
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.s = ''
+    context.seen = []
+
+def stepf(context, step):
+    #autoregressive model that looks back up to MAX_PAST steps
+    if step > MAX_PAST:
+        context.seen.append((context.past(1).x, context.past(2).n, context.past(MAX_PAST).s))
+        context.x = 0.5*context.past(1).x + 0.3*context.past(MAX_PAST).x + context.rng.normal()
+        context.n = context.past(2).n + int(context.rng.integers(0, 3))
+        context.s = context.past(MAX_PAST).s[-2:] + str(context.n % 10)
+    else:
+        context.x = context.rng.normal()
+        context.n = step
+        context.s = str(step)
+
+def build_env(**kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv(VARIABLES, 40, 25, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+def assert_raises(function: Callable):
+    try:
+        function()
+    except AssertionError:
+        return
+    assert False, 'An AssertionError was expected.'
+
+if __name__ == '__main__':
+    #the look-back buffer gives the same past states as the history
+    reference = SubSimulationEnv(VARIABLES, beginf, stepf, rng=np.random.default_rng(0))
+    reference.run_steps(25)
+    buffered = SubSimulationEnv(VARIABLES, beginf, stepf, max_past=MAX_PAST, rng=np.random.default_rng(0))
+    buffered.run_steps(25)
+    assert buffered.get_history_dataframe().equals(reference.get_history_dataframe())
+    assert buffered.auxiliary_objects['seen'] == reference.auxiliary_objects['seen']
+    histories = reference.get_history_dataframe()
+    for k, (x, n, s) in enumerate(reference.auxiliary_objects['seen']):
+        #the k-th record was taken at step MAX_PAST+1+k, which is the row of the same index of the history
+        row = MAX_PAST + 1 + k
+        assert (x, n, s) == (histories['x'][row-1], histories['n'][row-2], histories['s'][row-MAX_PAST]), k
+    print('subsimulation ok')
+
+    #the buffered views are reused and read the states relative to the current step
+    past_views = []
+    def view_stepf(context, step):
+        context.x = float(step)
+        if step >= 2:
+            past_views.append((context.past(1), context.past(1).x))
+    env = SubSimulationEnv([('x', float, 0.0)], lambda context: None, view_stepf, max_past=2)
+    env.run_steps(6)
+    assert all([view is past_views[0][0] for view, x in past_views])
+    assert [x for view, x in past_views] == [1.0, 2.0, 3.0, 4.0]
+    assert_raises(lambda: env._get_context_obj().past(3))
+    print('views ok')
+
+    #simulations with the buffer, with and without histories
+    in_memory = build_env()
+    in_memory.run(show_progress=False)
+    for env_kwargs in [dict(max_past=MAX_PAST), dict(max_past=MAX_PAST, keep_history=False), dict(max_past=MAX_PAST+4)]:
+        env = build_env(**env_kwargs)
+        env.run(show_progress=False)
+        for statistic in ('mean', 'var', 'min', 'max', 'sum'):
+            for var_name in ('x', 'n'):
+                assert np.allclose(getattr(env, f'get_variable_{statistic}')(var_name), getattr(in_memory, f'get_variable_{statistic}')(var_name)), (env_kwargs, statistic, var_name)
+        if env_kwargs.get('keep_history', True):
+            for var_name in ('x', 'n', 's'):
+                assert np.array_equal(env.get_variable_histories(var_name), in_memory.get_variable_histories(var_name)), (env_kwargs, var_name)
+        print(env_kwargs, 'ok')
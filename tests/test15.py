@@ -0,0 +1,61 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, SubSimulationEnv
+
+VARIABLES = [('x', float, 0.0), ('n', int, 0), ('b', bool, False), ('s', str, '')]
+#step of the subsimulations at which an int is assigned to the float variable, or None
+BAD_STEP = None
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+    context.s = ''
+
+def stepf(context, step):
+    context.x += context.rng.normal()
+    context.n += int(context.rng.integers(0, 3))
+    context.setstate('b', context.n % 2 == 0)
+    context.s = context.s[-3:] + str(context.n % 10)
+    if step == BAD_STEP:
+        context.x = 1
+
+def run_subsim(validate: str) -> SubSimulationEnv:
+    env = SubSimulationEnv(VARIABLES, beginf, stepf, validate=validate, rng=np.random.default_rng(0))
+    env.run_steps(10)
+    return env
+
+def raises(function: Callable) -> bool:
+    try:
+        function()
+    except AssertionError:
+        return True
+    return False
+
+if __name__ == '__main__':
+    #all the modes give the same results for well-typed callbacks
+    expected = run_subsim('full').get_history_dataframe()
+    for validate in ('first_step', 'off'):
+        assert run_subsim(validate).get_history_dataframe().equals(expected), validate
+    for run_kwargs in [dict(), dict(profile=True), dict(backend='process', n_workers=2), dict(chunk_size=3)]:
+        histories = dict()
+        for validate in ('full', 'first_step', 'off'):
+            env = MonteCarloSimulationEnv(VARIABLES, 20, 10, seed=0, validate=validate)
+            env.set_subsim_begin_callback(beginf)
+            env.set_subsim_step_callback(stepf)
+            env.run(show_progress=False, **run_kwargs)
+            histories[validate] = [env.get_variable_histories(var_name) for var_name in ('x', 'n', 'b', 's')]
+        for validate in ('first_step', 'off'):
+            assert all([np.array_equal(result, reference) for result, reference in zip(histories[validate], histories['full'])]), (run_kwargs, validate)
+        print(run_kwargs, 'ok')
+
+    #'full' checks every step, 'first_step' only the first one and 'off' none
+    for BAD_STEP, expected_errors in [(0, {'full': True, 'first_step': True, 'off': False}), (5, {'full': True, 'first_step': False, 'off': False})]:
+        for validate, expected_error in expected_errors.items():
+            assert raises(lambda: run_subsim(validate)) == expected_error, (BAD_STEP, validate)
+    print('type checks ok')
@@ -0,0 +1,70 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import os
+import shutil
+import tempfile
+import numpy as np
+import pymcsl
+import montecarlosimulation
+from pymcsl import MonteCarloSimulationEnv
+
+STATISTICS = ('mean', 'var', 'std', 'min', 'max', 'sum', 'median')
+QS = [0.0, 0.05, 0.5, 0.99, 1.0]
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+    context.s = ''
+
+def stepf(context, step):
+    context.x += context.rng.standard_t(3)
+    context.n += int(context.rng.integers(-4, 5))
+    context.b = bool(context.rng.random() < 0.2)
+    context.s = str(context.n)
+
+def build_env(**kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0), ('b', bool, False), ('s', str, '')], 120, 35, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+def assert_same(result: Any, expected: Any, label: Any):
+    assert np.shape(result) == np.shape(expected), label
+    assert np.allclose(result, expected, rtol=1e-10, atol=1e-10), label
+
+if __name__ == '__main__':
+    in_memory = build_env()
+    in_memory.run(show_progress=False)
+
+    directory = tempfile.mkdtemp()
+    try:
+        #blocks of 100 values (a few subsimulations or steps) and the default blocks
+        for block_values, run_kwargs in [(100, dict()), (100, dict(backend='process', n_workers=2)), (montecarlosimulation._memmap_block_values, dict())]:
+            montecarlosimulation._memmap_block_values = block_values
+            env = build_env(history_backend='memmap', history_dir=directory)
+            env.run(show_progress=False, **run_kwargs)
+            #a file per numeric variable
+            assert sorted(os.listdir(directory)) == ['b.dat', 'n.dat', 'x.dat'], os.listdir(directory)
+            for var_name in ('x', 'n', 'b'):
+                histories = env.get_variable_histories(var_name)
+                assert isinstance(histories, np.memmap) or isinstance(histories.base, np.memmap), var_name
+                assert np.array_equal(histories, in_memory.get_variable_histories(var_name)), var_name
+                for domain in ('step', 'subsim', None):
+                    for statistic in STATISTICS:
+                        assert_same(getattr(env, f'get_variable_{statistic}')(var_name, domain), getattr(in_memory, f'get_variable_{statistic}')(var_name, domain), (block_values, var_name, statistic, domain))
+                    assert_same(env.get_variable_quantiles(var_name, QS, domain), in_memory.get_variable_quantiles(var_name, QS, domain), (block_values, var_name, 'quantiles', domain))
+                    description, expected_description = env.describe([var_name], domain=domain), in_memory.describe([var_name], domain=domain)
+                    for statistic in expected_description[var_name].keys():
+                        assert_same(description[var_name][statistic], expected_description[var_name][statistic], (block_values, var_name, 'describe', statistic, domain))
+                assert np.array_equal(env.get_variable_histogram(var_name, 9), in_memory.get_variable_histogram(var_name, 9)), var_name
+            assert np.array_equal(env.get_subsim_env(77).get_variable_history('x'), in_memory.get_subsim_env(77).get_variable_history('x'))
+            assert env.get_subsim_env(77).get_variable_history('s') == in_memory.get_subsim_env(77).get_variable_history('s')
+            print(block_values, run_kwargs, 'ok')
+            del env, histories
+    finally:
+        shutil.rmtree(directory)
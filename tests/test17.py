@@ -0,0 +1,69 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+from statistics import NormalDist
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv
+
+N_STEPS = 10
+BATCH = 40
+MAX_SUBSIMS = 2000
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+
+def stepf(context, step):
+    #the expected mean of x over the steps of a subsimulation is 2
+    context.x = context.rng.normal(2.0, 3.0)
+    context.n += int(context.rng.integers(0, 2))
+
+def build_env(n_subsims: int, **kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0)], n_subsims, N_STEPS, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+def expected_stop(observations: np.ndarray, rel_tol: float, confidence: float) -> Tuple[int, float, float]:
+    """First multiple of BATCH whose confidence interval is narrow enough, with its estimate and half-width."""
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    for n in range(BATCH, len(observations) + BATCH, BATCH):
+        n = min(n, len(observations))
+        estimate = float(np.mean(observations[:n]))
+        half_width = z * float(np.std(observations[:n], ddof=1)) / np.sqrt(n)
+        if half_width <= rel_tol * abs(estimate) or n == len(observations):
+            return n, estimate, half_width
+
+if __name__ == '__main__':
+    reference = build_env(MAX_SUBSIMS)
+    reference.run(show_progress=False)
+
+    for statistic, rel_tol, observations in [('mean', 0.05, reference.get_variable_mean('x', 'subsim')), ('last', 0.02, reference.get_variable_histories('n')[:, -1])]:
+        var_name = 'x' if statistic == 'mean' else 'n'
+        n_expected, estimate_expected, half_width_expected = expected_stop(observations, rel_tol, 0.95)
+        assert n_expected < MAX_SUBSIMS, statistic
+        for run_kwargs in [dict(), dict(backend='process', n_workers=2), dict(backend='thread', n_workers=3, chunk_size=7)]:
+            env = build_env(5)
+            estimate, (lower, upper) = env.run_until(var_name, statistic, rel_tol=rel_tol, max_subsimulations=MAX_SUBSIMS, batch=BATCH, show_progress=False, **run_kwargs)
+            #the run stops at the first narrow enough interval, and is then the same as a plain run of that many subsimulations
+            assert env._n_subsims == n_expected, (statistic, run_kwargs, env._n_subsims, n_expected)
+            assert np.isclose(estimate, estimate_expected) and np.isclose(upper - estimate, half_width_expected) and np.isclose(estimate - lower, half_width_expected), (statistic, run_kwargs)
+            assert upper - estimate <= rel_tol * abs(estimate)
+            assert np.array_equal(env.get_variable_histories(var_name), reference.get_variable_histories(var_name)[:n_expected]), (statistic, run_kwargs)
+            assert np.allclose(env.get_variable_mean(var_name), np.mean(reference.get_variable_histories(var_name)[:n_expected], axis=0)), (statistic, run_kwargs)
+            print(statistic, run_kwargs, n_expected, 'ok')
+
+    #the estimate is close to the expected value, relative to the width of its interval
+    estimate, (lower, upper) = build_env(5).run_until('x', rel_tol=0.01, max_subsimulations=MAX_SUBSIMS, batch=BATCH, show_progress=False)
+    assert lower - (upper - lower) <= 2.0 <= upper + (upper - lower), (lower, upper)
+
+    #a tolerance that is never met stops at max_subsimulations
+    env = build_env(5, keep_history=False)
+    estimate, (lower, upper) = env.run_until('x', rel_tol=1e-6, max_subsimulations=130, batch=BATCH, show_progress=False)
+    assert env._n_subsims == 130
+    assert np.isclose(estimate, np.mean(reference.get_variable_mean('x', 'subsim')[:130]))
+    assert np.allclose(env.get_variable_mean('x'), np.mean(reference.get_variable_histories('x')[:130], axis=0))
+    print('max_subsimulations ok')
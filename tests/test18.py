@@ -0,0 +1,81 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import time
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, RunStats
+
+N_SUBSIMS = 12
+N_STEPS = 8
+SLEEP = 0.002
+
+def beginf(context):
+    context.x = 0.0
+    context.items = []
+
+def stepf(context, step):
+    context.x += context.rng.normal()
+    context.items.append(step)
+
+def slow_stepf(context, step):
+    time.sleep(SLEEP)
+    context.x += context.rng.normal()
+
+def build_env(step_function: Callable = stepf, **kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0)], N_SUBSIMS, N_STEPS, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(step_function)
+    return env
+
+if __name__ == '__main__':
+    plain = build_env()
+    plain.run(show_progress=False)
+    assert plain.stats is None
+
+    for env_kwargs, run_kwargs in [(dict(), dict()), (dict(), dict(backend='process', n_workers=2)), (dict(), dict(backend='thread', n_workers=2)), (dict(keep_history=False), dict())]:
+        hook_calls = []
+        env = build_env(**env_kwargs)
+        env.run(show_progress=False, profile=True, profile_hook=hook_calls.append, **run_kwargs)
+        #profiling does not change the results
+        assert np.array_equal(env.get_variable_mean('x'), plain.get_variable_mean('x')), (env_kwargs, run_kwargs)
+
+        stats = env.stats
+        assert isinstance(stats, RunStats)
+        phases = stats.get_phase_dataframe()
+        assert list(phases.index) == ['begin', 'step', 'context', 'logging', 'aggregation']
+        assert phases.loc['begin', 'calls'] == N_SUBSIMS and phases.loc['step', 'calls'] == N_SUBSIMS * N_STEPS and phases.loc['logging', 'calls'] == N_SUBSIMS * N_STEPS, phases
+        assert phases.loc['aggregation', 'calls'] >= 1
+        assert np.all(phases['time'] >= 0) and np.isclose(phases['share'].sum(), 1.0)
+
+        subsims = stats.get_subsim_dataframe()
+        assert subsims['subsim'].tolist() == list(range(N_SUBSIMS))
+        assert subsims['steps'].tolist() == [N_STEPS] * N_SUBSIMS
+        assert np.all(subsims['time'] > 0) and np.all(subsims['peak_rss'] > 0)
+        assert np.all(np.isnan(subsims['peak_traced']))
+        assert stats.n_subsims == N_SUBSIMS and stats.n_steps == N_SUBSIMS * N_STEPS
+        assert stats.wall_time > 0 and np.isclose(stats.steps_per_second, stats.n_steps / stats.wall_time)
+
+        report = stats.report()
+        assert report['n_subsims'] == N_SUBSIMS and report['n_steps'] == N_SUBSIMS * N_STEPS and report['peak_rss'] > 0
+        assert report['phases']['step']['calls'] == N_SUBSIMS * N_STEPS
+        #the hook gets the stats of the run as the subsimulations are completed
+        assert len(hook_calls) >= 1 and all([hook_stats is stats for hook_stats in hook_calls])
+        print(env_kwargs, run_kwargs, 'ok')
+
+    #the memory profile records the traced peak of each subsimulation
+    env = build_env()
+    env.run(show_progress=False, profile='memory')
+    assert not np.any(np.isnan(env.stats.get_subsim_dataframe()['peak_traced']))
+    print('memory profile ok')
+
+    #a slow step callback shows up in the step phase
+    env = build_env(slow_stepf)
+    env.run(show_progress=False, profile=True)
+    phases = env.stats.get_phase_dataframe()
+    assert phases.loc['step', 'time'] >= N_SUBSIMS * N_STEPS * SLEEP
+    assert phases.loc['step', 'share'] > 0.5
+    assert np.all(env.stats.get_subsim_dataframe()['time'] >= N_STEPS * SLEEP)
+    print('step phase ok')
@@ -0,0 +1,112 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import random
+import asyncio
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, VectorizedMonteCarloSimulationEnv
+
+N_SUBSIMS = 30
+N_STEPS = 12
+VARIABLES = [('x', float, 0.0), ('n', int, 0), ('s', str, '')]
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.s = ''
+
+def stepf(context, step):
+    context.x += context.rng.normal() + np.random.random()
+    context.n += random.randint(0, 2)
+    context.s = str(context.n)
+
+def vectorized_beginf(context):
+    context.x = 0.0
+
+def vectorized_stepf(context, step):
+    context.x = context.x + context.rng.normal(size=N_SUBSIMS) + np.random.random(N_SUBSIMS)
+
+def build_env(env_class: type = MonteCarloSimulationEnv, **kwargs) -> MonteCarloSimulationEnv:
+    if env_class is VectorizedMonteCarloSimulationEnv:
+        env = VectorizedMonteCarloSimulationEnv([('x', float, 0.0)], N_SUBSIMS, N_STEPS, seed=0)
+        env.set_subsim_begin_callback(vectorized_beginf)
+        env.set_subsim_step_callback(vectorized_stepf)
+    else:
+        env = MonteCarloSimulationEnv(VARIABLES, N_SUBSIMS, N_STEPS, seed=0, **kwargs)
+        env.set_subsim_begin_callback(beginf)
+        env.set_subsim_step_callback(stepf)
+    return env
+
+def check_blocks(env: MonteCarloSimulationEnv, reference: MonteCarloSimulationEnv, batches: List[Tuple[List[int], range, Dict[str, np.ndarray]]], var_names: List[str]):
+    """Checks that the yielded blocks are the blocks of the histories of the reference, and that they cover all of them."""
+    covered = np.zeros((N_SUBSIMS, N_STEPS), dtype=int)
+    for subsim_indexes, steps, blocks in batches:
+        for var_name in var_names:
+            assert np.array_equal(blocks[var_name], reference.get_variable_histories(var_name)[subsim_indexes][:, steps.start:steps.stop]), var_name
+        covered[np.ix_(subsim_indexes, list(steps))] += 1
+    assert np.all(covered == 1)
+
+if __name__ == '__main__':
+    reference = build_env()
+    reference.run(show_progress=False)
+
+    for batch_subsims, batch_steps in [(None, None), (7, None), (4, 5), (1, 1), (N_SUBSIMS, 3)]:
+        env = build_env()
+        batches = []
+        for subsim_indexes, steps, blocks in env.iter_run(batch_subsims, batch_steps):
+            assert not any([block.flags.writeable for block in blocks.values()])
+            batches.append((subsim_indexes, steps, {var_name: blocks[var_name].copy() for var_name in blocks.keys()}))
+            if steps.stop == N_STEPS:
+                #the statistics are calculated over the completed subsimulations
+                assert np.allclose(env.get_variable_mean('x'), np.mean(reference.get_variable_histories('x')[:subsim_indexes[-1]+1], axis=0))
+        check_blocks(env, reference, batches, ['x', 'n'])
+        for var_name in ('x', 'n', 's'):
+            assert np.array_equal(env.get_variable_histories(var_name), reference.get_variable_histories(var_name)), (batch_subsims, batch_steps, var_name)
+        online = build_env(keep_history=False)
+        for batch in online.iter_run(batch_subsims, batch_steps):
+            pass
+        assert np.allclose(online.get_variable_var('x'), reference.get_variable_var('x'))
+        print(batch_subsims, batch_steps, 'ok')
+
+    #a generator closed early leaves a simulation of the completed subsimulations
+    env = build_env()
+    for subsim_indexes, steps, blocks in env.iter_run(8, 4):
+        if subsim_indexes[0] == 16 and steps.start == 4:
+            break
+    assert np.array_equal(env.get_variable_histories('x'), reference.get_variable_histories('x')[:16])
+    assert np.allclose(env.get_variable_max('n'), np.max(reference.get_variable_histories('n')[:16], axis=0))
+    print('early stop ok')
+
+    #the vectorized simulation
+    vectorized_reference = build_env(VectorizedMonteCarloSimulationEnv)
+    vectorized_reference.run(show_progress=False)
+    env = build_env(VectorizedMonteCarloSimulationEnv)
+    check_blocks(env, vectorized_reference, [(subsim_indexes, steps, {'x': blocks['x'].copy()}) for subsim_indexes, steps, blocks in env.iter_run(batch_steps=5)], ['x'])
+    assert np.array_equal(env.get_variable_histories('x'), vectorized_reference.get_variable_histories('x'))
+    print('vectorized ok')
+
+    #arun gives control back to the event loop between the batches
+    async def main() -> Tuple[MonteCarloSimulationEnv, List[str]]:
+        events = []
+        env = build_env()
+        async def async_hook(subsim_indexes, steps, blocks):
+            events.append('batch')
+        async def ticker():
+            for i in range(3):
+                events.append('tick')
+                await asyncio.sleep(0)
+        await asyncio.gather(env.arun(5, batch_hook=async_hook), ticker())
+        return env, events
+    env, events = asyncio.run(main())
+    assert np.array_equal(env.get_variable_histories('x'), reference.get_variable_histories('x'))
+    assert events.count('batch') == N_SUBSIMS // 5 and events.count('tick') == 3
+    #the ticks are interleaved with the batches instead of waiting for the end of the run
+    assert events.index('tick', 1) < len(events) - 1 - events[::-1].index('batch'), events
+    sync_batches = []
+    env = build_env()
+    asyncio.run(env.arun(7, 4, batch_hook=lambda subsim_indexes, steps, blocks: sync_batches.append((subsim_indexes, steps, {var_name: blocks[var_name].copy() for var_name in blocks.keys()}))))
+    check_blocks(env, reference, sync_batches, ['x', 'n'])
+    print('arun ok')
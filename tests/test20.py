@@ -0,0 +1,94 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import os
+import shutil
+import tempfile
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, ParameterSweep
+
+N_SUBSIMS = 25
+N_STEPS = 6
+SEED = 7
+BIG = 2**70
+n_factory_calls = 0
+
+def factory(drift: float, scale: float) -> MonteCarloSimulationEnv:
+    global n_factory_calls
+    n_factory_calls += 1
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0), ('s', str, '')], N_SUBSIMS, N_STEPS)
+
+    @env.subsim_begin
+    def beginf(context):
+        context.x = 0.0
+        context.n = BIG if scale > 2 else 0
+        context.s = ''
+
+    @env.subsim_step
+    def stepf(context, step):
+        context.x += drift + scale*context.rng.normal()
+        context.n += int(context.rng.integers(0, 3))
+        context.s = str(context.n % 7)
+
+    return env
+
+def run_alone(drift: float, scale: float, seed: int) -> MonteCarloSimulationEnv:
+    env = factory(drift, scale)
+    env._entropy = seed
+    env.run(show_progress=False)
+    return env
+
+if __name__ == '__main__':
+    grid = {'drift': [0.0, 0.5, -1.0], 'scale': [1.0, 3.0]}
+    sweep = ParameterSweep(factory, grid, seed=SEED)
+    dataframe = sweep.run(backend='serial', show_progress=False)
+
+    #each scenario is the simulation of its parameters with the seed of the sweep
+    assert list(dataframe.index.names) == ['drift', 'scale', 'subsim', 'step'] and list(dataframe.columns) == ['x', 'n', 's']
+    assert len(dataframe) == 6 * N_SUBSIMS * N_STEPS
+    #rows are looked up in a sorted copy, since the index follows the order of the grid
+    sorted_dataframe = dataframe.sort_index()
+    for k, scenario in enumerate(sweep.scenarios):
+        alone = run_alone(scenario['drift'], scenario['scale'], SEED)
+        for var_name in ('x', 'n', 's'):
+            assert np.array_equal(sweep.get_scenario_histories(k)[var_name], alone._results[var_name]), (scenario, var_name)
+        assert np.array_equal(sorted_dataframe.loc[(scenario['drift'], scenario['scale'])]['x'].to_numpy(), alone.get_variable_histories('x').ravel()), scenario
+    print('scenarios ok')
+
+    #common random numbers: scenarios that only differ in the drift differ by a deterministic amount
+    drift_difference = sweep.get_scenario_histories(2)['x'] - sweep.get_scenario_histories(0)['x']
+    assert np.allclose(drift_difference, 0.5 * np.arange(1, N_STEPS+1)[None, :])
+    assert np.array_equal(sweep.get_scenario_histories(0)['n'], sweep.get_scenario_histories(2)['n'])
+    independent = ParameterSweep(factory, grid, seed=SEED, common_random_numbers=False)
+    independent.run(backend='serial', show_progress=False)
+    independent_difference = independent.get_scenario_histories(2)['x'] - independent.get_scenario_histories(0)['x']
+    assert np.var(independent_difference[:, -1]) > 1.0 and np.var(drift_difference[:, -1]) < 1e-20
+    print('common random numbers ok')
+
+    #the process pool gives the same results
+    process_sweep = ParameterSweep(factory, grid, seed=SEED)
+    assert process_sweep.run(n_workers=2, show_progress=False).equals(dataframe)
+    print('process pool ok')
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        ParameterSweep(factory, grid, seed=SEED, cache_dir=cache_dir).run(backend='serial', show_progress=False)
+        assert len(os.listdir(cache_dir)) == 6
+        #the cached scenarios are loaded instead of run again, and only the new ones are run
+        n_factory_calls = 0
+        cached = ParameterSweep(factory, grid, seed=SEED, cache_dir=cache_dir)
+        assert cached.run(backend='serial', show_progress=False).equals(dataframe)
+        assert n_factory_calls == 0
+        extended = ParameterSweep(factory, {'drift': [0.0, 0.5, -1.0, 2.0], 'scale': [1.0, 3.0]}, seed=SEED, cache_dir=cache_dir)
+        extended_dataframe = extended.run(backend='serial', show_progress=False)
+        assert n_factory_calls == 2 and len(os.listdir(cache_dir)) == 8
+        assert extended_dataframe.sort_index().loc[(0.5, 3.0)].equals(sorted_dataframe.loc[(0.5, 3.0)])
+        #another seed is another set of scenarios
+        ParameterSweep(factory, grid, seed=SEED+1, cache_dir=cache_dir).run(backend='serial', show_progress=False)
+        assert n_factory_calls == 8
+    finally:
+        shutil.rmtree(cache_dir)
+    print('cache ok')
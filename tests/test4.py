@@ -0,0 +1,39 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+from pymcsl import MonteCarloSimulationEnv
+
+#int states outside of the int64 range are kept as Python ints (object columns)
+BIG = 2**70
+
+def beginf(context):
+    context.x = 0
+
+def stepf(context, step):
+    context.x = BIG if step == 1 else step
+
+def build_env(**kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', int, 0)], 4, 3, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+if __name__ == '__main__':
+    for env_kwargs in [dict(), dict(history_backend='memmap')]:
+        for run_kwargs in [dict(), dict(backend='thread', n_workers=2), dict(backend='process', n_workers=2)]:
+            env = build_env(**env_kwargs)
+            env.run(show_progress=False, **run_kwargs)
+            for i in range(4):
+                assert env.get_subsim_env(i).get_variable_history('x') == [0, BIG, 2], (env_kwargs, run_kwargs)
+            assert env.get_variable_mean('x')[1] == float(BIG)
+            print(env_kwargs, run_kwargs, 'ok')
+
+    env = build_env()
+    for batch in env.iter_run(batch_subsims=3, batch_steps=2):
+        pass
+    assert all([env.get_subsim_env(i).get_variable_history('x') == [0, BIG, 2] for i in range(4)])
+    assert env.replay_subsim(2).get_variable_history('x') == [0, BIG, 2]
+    print('iter_run and replay_subsim ok')
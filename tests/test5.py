@@ -0,0 +1,63 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, QuantileSketch
+
+ERROR = 0.01
+QS = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+def rank_errors(values: np.ndarray, quantiles: np.ndarray, qs: List[float]) -> np.ndarray:
+    """Returns the distance between the requested quantiles and the ranks (as fractions of the number of values) of the given quantiles of each column of 'values'.
+    A value that appears several times may have any rank between its first and last occurrences.
+    """
+    sorted_values = np.sort(values, axis=0)
+    errors = np.empty((len(qs), values.shape[1]))
+    for j in range(values.shape[1]):
+        first = np.searchsorted(sorted_values[:, j], quantiles[:, j], side='left') / values.shape[0]
+        last = np.searchsorted(sorted_values[:, j], quantiles[:, j], side='right') / values.shape[0]
+        errors[:, j] = np.maximum(0, np.maximum(first - np.asarray(qs), np.asarray(qs) - last))
+    return errors
+
+def beginf(context):
+    context.x = 0.0
+
+def stepf(context, step):
+    context.x += context.rng.normal()
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(size=(20000, 8)), rng.exponential(size=(20000, 8))**3, rng.integers(0, 5, size=(20000, 8))], axis=1)
+
+    #a single sketch, filled in batches
+    sketch = QuantileSketch(values.shape[1], ERROR, seed=0)
+    for first in range(0, values.shape[0], 1000):
+        sketch.update(values[first:first+1000])
+    assert sketch.count == values.shape[0]
+    assert np.max(rank_errors(values, sketch.quantiles(QS), QS)) <= ERROR
+    print('update ok')
+
+    #sketches of separate parts, merged
+    merged = QuantileSketch(values.shape[1], ERROR, seed=1)
+    for first in range(0, values.shape[0], 3000):
+        part = QuantileSketch(values.shape[1], ERROR, seed=first)
+        part.update(values[first:first+3000])
+        merged.merge(part)
+    assert merged.count == values.shape[0]
+    assert np.max(rank_errors(values, merged.quantiles(QS), QS)) <= ERROR
+    assert np.max(rank_errors(values.reshape(-1, 1), np.asarray(merged.overall_quantiles(QS))[:, None], QS)) <= ERROR
+    print('merge ok')
+
+    #sketches filled while a simulation runs, by each backend
+    for run_kwargs in [dict(), dict(backend='thread', n_workers=2), dict(backend='process', n_workers=2)]:
+        env = MonteCarloSimulationEnv([('x', float, 0.0)], 5000, 10, seed=0, quantile_error=ERROR)
+        env.set_subsim_begin_callback(beginf)
+        env.set_subsim_step_callback(stepf)
+        env.run(show_progress=False, **run_kwargs)
+        histories = env.get_variable_histories('x')
+        assert np.max(rank_errors(histories, env.get_variable_quantiles('x', QS), QS)) <= ERROR
+        assert np.max(rank_errors(histories.reshape(-1, 1), env.get_variable_quantiles('x', QS, None)[:, None], QS)) <= ERROR
+        print(run_kwargs, 'ok')
@@ -0,0 +1,54 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import SimpleMarkovChain, MarkovChainEnsemble
+
+def assert_close(result: Dict[Any, float], expected: Dict[Any, float]):
+    assert result.keys() == expected.keys(), (result, expected)
+    assert all([np.isclose(result[state], expected[state]) for state in expected.keys()]), (result, expected)
+
+if __name__ == '__main__':
+    #two-state chain with P(A->B) = p = 0.25 and P(B->A) = q = 0.5
+    two_states = SimpleMarkovChain({'A', 'B'}, [('A', 'A', 3), ('A', 'B', 1), ('B', 'A', 1), ('B', 'B', 1)], 'A')
+    assert_close(two_states.stationary_distribution(), {'A': 2/3, 'B': 1/3})
+    #P(A at step n | A at step 0) = q/(p+q) + p/(p+q) * (1-p-q)^n, with the sparse (small n) and dense (large n) products
+    for n in [0, 1, 5, 20, 200]:
+        assert_close(two_states.distribution_at(n), {'A': 2/3 + 1/3 * 0.25**n, 'B': 1/3 - 1/3 * 0.25**n})
+    assert_close(two_states.distribution_at(1, {'A': 0.5, 'B': 0.5}), {'A': 0.5*0.75 + 0.5*0.5, 'B': 0.5*0.25 + 0.5*0.5})
+    #the time to leave A is geometric with mean 1/p
+    assert_close(two_states.expected_hitting_times('B'), {'A': 4.0, 'B': 0.0})
+    print('two-state chain ok')
+
+    #chain of tests/test3.py: 1->2, 2->1 or 3, 3->1
+    cycle = SimpleMarkovChain({1, 2, 3}, [(1, 2, 1), (2, 1, 1), (2, 3, 1), (3, 1, 1)], 1)
+    assert_close(cycle.stationary_distribution(), {1: 0.4, 2: 0.4, 3: 0.2})
+    assert_close(cycle.expected_hitting_times(3), {1: 4.0, 2: 3.0, 3: 0.0})
+    print('cycle chain ok')
+
+    #gambler's ruin on 0..4 with fair bets: absorption at 4 from k with probability k/4, after k*(4-k) bets on average
+    ruin = SimpleMarkovChain({0, 1, 2, 3, 4}, [(0, 0, 1), (4, 4, 1)] + [(k, k+d, 1) for k in range(1, 4) for d in (-1, 1)], 2)
+    assert_close(ruin.expected_hitting_times({0, 4}), {0: 0.0, 1: 3.0, 2: 4.0, 3: 3.0, 4: 0.0})
+    absorption = ruin.absorption_probabilities()
+    assert absorption.keys() == {1, 2, 3}
+    for k in range(1, 4):
+        assert_close(absorption[k], {0: 1 - k/4, 4: k/4})
+    #the states that may be absorbed at 4 never hit 0 with probability 1
+    assert_close(ruin.expected_hitting_times(0), {0: 0.0, 1: np.inf, 2: np.inf, 3: np.inf, 4: np.inf})
+    try:
+        ruin.stationary_distribution()
+        assert False, 'A chain with two closed classes has no unique stationary distribution.'
+    except ValueError:
+        pass
+    print('gambler\'s ruin ok')
+
+    #the analytic distribution matches the sampled one
+    ensemble = MarkovChainEnsemble(ruin, 200000, rng=np.random.default_rng(0))
+    final_states = ensemble.simulate(6)[:, -1]
+    expected = ruin.distribution_at(6)
+    for state, probability in expected.items():
+        assert abs(np.mean(final_states == state) - probability) < 0.005, (state, np.mean(final_states == state), probability)
+    print('sampling ok')
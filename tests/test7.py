@@ -0,0 +1,67 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import shutil
+import tempfile
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv
+
+N_SUBSIMS = 100
+N_STEPS = 20
+CHECKPOINT_EVERY = 10
+#the first run is interrupted at the beginning of its INTERRUPTION-th subsimulation
+INTERRUPTION = 56
+INTERRUPT_AT = None
+n_begins = 0
+
+def beginf(context):
+    global n_begins
+    n_begins += 1
+    if n_begins == INTERRUPT_AT:
+        raise KeyboardInterrupt()
+    context.x = 0.0
+    context.y = 0
+
+def stepf(context, step):
+    context.x += context.rng.normal()
+    context.y += int(context.rng.integers(0, 2))
+
+def build_env(**kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('y', int, 0)], N_SUBSIMS, N_STEPS, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+if __name__ == '__main__':
+    for env_kwargs, run_kwargs in [(dict(), dict()), (dict(keep_history=False), dict()), (dict(), dict(backend='process', n_workers=2))]:
+        uninterrupted = build_env(**env_kwargs)
+        uninterrupted.run(show_progress=False)
+
+        checkpoint_path = tempfile.mkdtemp()
+        try:
+            INTERRUPT_AT = INTERRUPTION
+            n_begins = 0
+            try:
+                build_env(**env_kwargs).run(show_progress=False, checkpoint_path=checkpoint_path, checkpoint_every=CHECKPOINT_EVERY)
+                assert False, 'The run was not interrupted.'
+            except KeyboardInterrupt:
+                pass
+
+            INTERRUPT_AT = None
+            n_begins = 0
+            resumed = MonteCarloSimulationEnv.resume(checkpoint_path, show_progress=False, checkpoint_every=CHECKPOINT_EVERY, **run_kwargs)
+        finally:
+            shutil.rmtree(checkpoint_path)
+
+        if run_kwargs.get('backend') != 'process':
+            #at most one checkpoint interval is run again
+            assert n_begins <= N_SUBSIMS - INTERRUPTION + CHECKPOINT_EVERY, n_begins
+        for var_name in ('x', 'y'):
+            if env_kwargs.get('keep_history', True):
+                assert np.array_equal(resumed.get_variable_histories(var_name), uninterrupted.get_variable_histories(var_name)), var_name
+            for statistic in ('mean', 'var', 'min', 'max', 'sum'):
+                assert np.allclose(getattr(resumed, f'get_variable_{statistic}')(var_name), getattr(uninterrupted, f'get_variable_{statistic}')(var_name)), (var_name, statistic)
+        print(env_kwargs, run_kwargs, 'ok')
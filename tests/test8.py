@@ -0,0 +1,55 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv
+
+N_BINS = 51
+RANGE = (-5.0, 4.9)
+#the float variable only takes values on the bin edges, or just below them
+EDGES = np.linspace(RANGE[0], RANGE[1], N_BINS+1)
+VALUES = np.concatenate([EDGES, np.nextafter(EDGES, -np.inf)])
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+
+def stepf(context, step):
+    context.x = float(context.rng.choice(VALUES))
+    context.n = int(context.rng.integers(-3, 4))
+    context.b = bool(context.rng.random() < 0.3)
+
+def build_env(**kwargs) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv([('x', float, 0.0), ('n', int, 0), ('b', bool, False)], 500, 6, seed=0, **kwargs)
+    env.set_subsim_begin_callback(beginf)
+    env.set_subsim_step_callback(stepf)
+    return env
+
+def column_histograms(histories: np.ndarray, **kwargs) -> np.ndarray:
+    """Histogram of each step with np.histogram, as the original get_variable_histogram."""
+    return np.array([np.histogram(histories[:, i].astype(np.float64), **kwargs)[0] for i in range(histories.shape[1])]).astype(np.float64)
+
+if __name__ == '__main__':
+    env = build_env()
+    env.run(show_progress=False)
+    for var_name, n_bins in [('x', N_BINS), ('n', 7), ('n', 4), ('b', 2), ('b', 3)]:
+        histories = env.get_variable_histories(var_name)
+        assert np.array_equal(env.get_variable_histogram(var_name, n_bins), column_histograms(histories, bins=n_bins, range=(np.min(histories), np.max(histories)))), var_name
+        assert np.array_equal(env.get_variable_histogram(var_name, n_bins, _range=RANGE), column_histograms(histories, bins=n_bins, range=RANGE)), var_name
+    histories = env.get_variable_histories('x')
+    log_edges = np.geomspace(0.1, 4.9, 11)
+    assert np.array_equal(env.get_variable_histogram('x', 10, _range=(0.1, 4.9), bins='log'), column_histograms(histories, bins=log_edges))
+    assert np.array_equal(env.get_variable_histogram('x', bins=EDGES[::5]), column_histograms(histories, bins=EDGES[::5]))
+    print('histories ok')
+
+    #the online histograms are the same as the ones of the histories
+    online_env = build_env(keep_history=False, online_histograms={'x': (N_BINS, RANGE), 'n': (7, (-3, 3)), 'b': (2, (0, 1))})
+    online_env.run(show_progress=False)
+    assert np.array_equal(online_env.get_variable_histogram('x'), column_histograms(env.get_variable_histories('x'), bins=N_BINS, range=RANGE))
+    assert np.array_equal(online_env.get_variable_histogram('n'), column_histograms(env.get_variable_histories('n'), bins=7, range=(-3, 3)))
+    assert np.array_equal(online_env.get_variable_histogram('b'), column_histograms(env.get_variable_histories('b'), bins=2, range=(0, 1)))
+    print('online histograms ok')
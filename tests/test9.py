@@ -0,0 +1,97 @@
+"""
+By Filipe Chagas
+June-2022
+"""
+
+from typing import *
+import os
+import shutil
+import tempfile
+import numpy as np
+from pymcsl import MonteCarloSimulationEnv, load_results
+
+BIG = 2**70
+
+def beginf(context):
+    context.x = 0.0
+    context.n = 0
+    context.b = False
+    context.s = ''
+
+def stepf(context, step):
+    context.x = context.rng.normal()
+    context.n = int(context.rng.integers(-5, 5))
+    context.b = bool(context.n > 0)
+    context.s = 'abc'[:context.n % 4]
+
+def big_stepf(context, step):
+    context.n = BIG + step
+
+def collision_beginf(context):
+    context.step = 0
+
+def collision_stepf(context, step):
+    context.step = step
+
+def build_env(variables: List[Tuple[str, type, Any]], begin_function: Callable, step_function: Callable) -> MonteCarloSimulationEnv:
+    env = MonteCarloSimulationEnv(variables, 7, 5, seed=0)
+    env.set_subsim_begin_callback(begin_function)
+    env.set_subsim_step_callback(step_function)
+    env.run(show_progress=False)
+    return env
+
+def assert_raises(function: Callable):
+    try:
+        function()
+    except AssertionError:
+        return
+    assert False, 'An AssertionError was expected.'
+
+def check_wide_table(table: Any, env: MonteCarloSimulationEnv, var_names: List[str]):
+    assert table.column_names == ['subsim', 'step'] + var_names, table.column_names
+    assert table.column('subsim').to_pylist() == np.repeat(np.arange(7), 5).tolist()
+    assert table.column('step').to_pylist() == np.tile(np.arange(5), 7).tolist()
+    for var_name in var_names:
+        assert table.column(var_name).to_pylist() == [env.get_subsim_env(i).get_variable_history(var_name)[j] for i in range(7) for j in range(5)], var_name
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        env = build_env([('x', float, 0.0), ('n', int, 0), ('b', bool, False), ('s', str, '')], beginf, stepf)
+        histories = {var_name: [env.get_subsim_env(i).get_variable_history(var_name) for i in range(7)] for var_name in ('x', 'n', 'b', 's')}
+
+        check_wide_table(env.to_arrow(rows_per_block=10), env, ['x', 'n', 'b', 's'])
+        env.to_parquet(os.path.join(directory, 'results.parquet'), rows_per_block=10)
+        check_wide_table(load_results(os.path.join(directory, 'results.parquet')), env, ['x', 'n', 'b', 's'])
+        long_table = env.to_arrow(['x', 'n'], layout='long')
+        assert long_table.column('value').to_pylist() == np.concatenate([np.ravel(histories['x']), np.ravel(histories['n'])]).tolist()
+
+        env.to_npz(os.path.join(directory, 'results.npz'))
+        loaded = load_results(os.path.join(directory, 'results.npz'))
+        assert sorted(loaded.keys()) == ['b', 'n', 's', 'step', 'subsim', 'x']
+        assert loaded['subsim'].tolist() == list(range(7)) and loaded['step'].tolist() == list(range(5))
+        for var_name in ('x', 'n', 'b', 's'):
+            assert loaded[var_name].tolist() == histories[var_name], var_name
+        print('round trips ok')
+
+        #ints out of the int64 range are kept as ints by .npz files, and rejected by the wide Arrow layout
+        big_env = build_env([('n', int, 0)], beginf, big_stepf)
+        big_env.to_npz(os.path.join(directory, 'big.npz'))
+        assert_raises(lambda: load_results(os.path.join(directory, 'big.npz')))
+        loaded = load_results(os.path.join(directory, 'big.npz'), allow_pickle=True)
+        assert loaded['n'].tolist() == [[BIG + step for step in range(5)]] * 7
+        assert_raises(lambda: big_env.to_arrow())
+        assert_raises(lambda: big_env.to_parquet(os.path.join(directory, 'big.parquet')))
+        assert big_env.to_arrow(layout='long').column('value').to_pylist() == [float(BIG + step) for step in range(5)] * 7
+        print('big ints ok')
+
+        #variables named as the index columns are rejected instead of overwriting them
+        collision_env = build_env([('step', int, 0)], collision_beginf, collision_stepf)
+        assert_raises(lambda: collision_env.to_arrow())
+        assert_raises(lambda: collision_env.to_parquet(os.path.join(directory, 'collision.parquet')))
+        assert_raises(lambda: collision_env.to_npz(os.path.join(directory, 'collision.npz')))
+        long_table = collision_env.to_arrow(layout='long')
+        assert long_table.column('step').to_pylist() == long_table.column('value').to_pylist()
+        print('index column names ok')
+    finally:
+        shutil.rmtree(directory)